@@ -19,7 +19,10 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 from .config import get_settings
 from .database import engine, init_db
-from .routes import api_router, health_router
+from .redis_client import close_redis
+from .routes import api_router, health_router, media_router
+from .services.http_client import close_http_clients
+from .services.media_derivatives import shutdown_derivative_service
 from .utils.logging import setup_logging
 
 # 配置结构化日志
@@ -61,6 +64,20 @@ class PrometheusMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """跳过指定路径前缀的 GZip：媒体文件本身已压缩，且 Range 响应不能再被整体压缩"""
+
+    def __init__(self, app, excluded_prefixes=(), **kwargs):
+        super().__init__(app, **kwargs)
+        self.excluded_prefixes = tuple(excluded_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.excluded_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 class LoggingMiddleware(BaseHTTPMiddleware):
     """请求日志中间件"""
 
@@ -109,6 +126,11 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # 关闭时执行
     logger.info("Shutting down WeChat Work Archive System API")
 
+    # 关闭上游 HTTP 连接池、衍生图进程池和 Redis 连接
+    await close_http_clients()
+    shutdown_derivative_service()
+    await close_redis()
+
     # 关闭数据库连接
     if engine:
         await engine.dispose()
@@ -137,7 +159,8 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    app.add_middleware(GZipMiddleware, minimum_size=1000)
+    media_prefix = settings.media_url_prefix.rstrip("/")
+    app.add_middleware(SelectiveGZipMiddleware, minimum_size=1000, excluded_prefixes=(media_prefix + "/",))
     app.add_middleware(PrometheusMiddleware)
 
     if settings.debug:
@@ -146,6 +169,7 @@ def create_app() -> FastAPI:
     # 注册路由
     app.include_router(health_router, tags=["Health"])
     app.include_router(api_router, prefix="/api/v1", tags=["API"])
+    app.include_router(media_router, prefix=media_prefix, tags=["Media"])
 
     # Prometheus 指标端点
     @app.get("/metrics")
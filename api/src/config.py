@@ -6,7 +6,7 @@
 
 import os
 from functools import lru_cache
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from pydantic import BaseSettings, Field, validator
 
@@ -38,14 +38,33 @@ class Settings(BaseSettings):
     # ================================================================================
     corp_id: str = Field(..., env="CORP_ID")
     secret: str = Field(..., env="SECRET")
+    # 逗号分隔的键值对用 str 声明：pydantic 会把 List 类型的环境变量按 JSON 解析
+    extra_corp_accounts: str = Field(default="", env="EXTRA_CORP_ACCOUNTS")  # corpid:secret,...
     encoding_aes_key: str = Field(..., env="ENCODING_AES_KEY")
+    extra_corp_aes_keys: str = Field(default="", env="EXTRA_CORP_AES_KEYS")  # corpid:encoding_aes_key,...
     api_base_url: str = Field(
         default="https://qyapi.weixin.qq.com",
         env="WECHAT_API_BASE_URL"
     )
     token_cache_ttl: int = Field(default=7000, env="TOKEN_CACHE_TTL")  # 秒
+    token_refresh_margin: int = Field(default=300, env="TOKEN_REFRESH_MARGIN")  # 过期前提前刷新（秒）
     max_retry_attempts: int = Field(default=3, env="MAX_RETRY_ATTEMPTS")
+    retry_backoff_base: float = Field(default=0.5, env="RETRY_BACKOFF_BASE")  # 秒
+    rate_limit_backoff_base: float = Field(default=2.0, env="RATE_LIMIT_BACKOFF_BASE")  # 秒
+    retry_backoff_max: float = Field(default=30.0, env="RETRY_BACKOFF_MAX")  # 秒
+    enable_rate_limit: bool = Field(default=True, env="ENABLE_RATE_LIMIT")
+    upstream_rate_limits: str = Field(
+        default="token:1,chatdata:10,media:20,roster:5,default:10",
+        env="UPSTREAM_RATE_LIMITS"
+    )  # 接口族:每秒请求数，逗号分隔
+    rate_limit_burst: float = Field(default=2.0, env="RATE_LIMIT_BURST")  # 桶容量（秒的配额）
+    circuit_failure_threshold: int = Field(default=5, env="CIRCUIT_FAILURE_THRESHOLD")  # 连续失败次数
+    circuit_reset_timeout: float = Field(default=30.0, env="CIRCUIT_RESET_TIMEOUT")  # 熔断冷却（秒）
     request_timeout: int = Field(default=30, env="REQUEST_TIMEOUT")
+    http2_enabled: bool = Field(default=False, env="HTTP2_ENABLED")  # 需要安装 h2
+    http_max_connections: int = Field(default=100, env="HTTP_MAX_CONNECTIONS")
+    http_max_keepalive_connections: int = Field(default=20, env="HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    http_keepalive_expiry: float = Field(default=60.0, env="HTTP_KEEPALIVE_EXPIRY")  # 秒
 
     # ================================================================================
     # 数据库配置
@@ -78,9 +97,35 @@ class Settings(BaseSettings):
     # 同步配置
     # ================================================================================
     sync_interval: int = Field(default=300, env="SYNC_INTERVAL")  # 秒
+    sync_lane_stale_after: int = Field(default=1800, env="SYNC_LANE_STALE_AFTER")  # 秒，无进度视为通道 worker 已退出
+    sync_fanout_check_interval: int = Field(default=300, env="SYNC_FANOUT_CHECK_INTERVAL")  # 秒
     max_sync_days: int = Field(default=90, env="MAX_SYNC_DAYS")
-    batch_size: int = Field(default=100, env="BATCH_SIZE")
+    backfill_slice_size: int = Field(default=50000, env="BACKFILL_SLICE_SIZE")  # 每个回补分片的 seq 跨度
+    backfill_concurrency: int = Field(default=4, env="BACKFILL_CONCURRENCY")  # 同时执行的回补分片数
+    backfill_slice_stale_after: int = Field(default=1800, env="BACKFILL_SLICE_STALE_AFTER")  # 秒，无进度视为 worker 已退出
+    backfill_check_interval: int = Field(default=300, env="BACKFILL_CHECK_INTERVAL")  # 秒
+    batch_size: int = Field(default=100, env="BATCH_SIZE")  # 初始拉取条数，运行时自适应调整
+    batch_size_min: int = Field(default=50, env="BATCH_SIZE_MIN")
+    batch_size_max: int = Field(default=1000, env="BATCH_SIZE_MAX")  # getchatdata 单次上限
+    flush_size_min: int = Field(default=100, env="FLUSH_SIZE_MIN")
+    flush_size_max: int = Field(default=5000, env="FLUSH_SIZE_MAX")
+    target_fetch_latency: float = Field(default=2.0, env="TARGET_FETCH_LATENCY")  # 秒
+    target_commit_latency: float = Field(default=1.0, env="TARGET_COMMIT_LATENCY")  # 秒
     enable_auto_sync: bool = Field(default=True, env="ENABLE_AUTO_SYNC")
+    sync_queue_size: int = Field(default=4, env="SYNC_QUEUE_SIZE")  # 流水线各阶段间队列容量（批）
+    progress_flush_interval: int = Field(default=5, env="PROGRESS_FLUSH_INTERVAL")  # 任务进度写库间隔（秒）
+    msgaudit_private_key_path: str = Field(default="/app/keys", env="MSGAUDIT_PRIVATE_KEY_PATH")
+    enable_msgid_filter: bool = Field(default=True, env="ENABLE_MSGID_FILTER")
+    msgid_filter_capacity: int = Field(default=10000000, env="MSGID_FILTER_CAPACITY")  # 每企业
+    msgid_filter_error_rate: float = Field(default=0.001, env="MSGID_FILTER_ERROR_RATE")
+    msgid_filter_refresh_interval: int = Field(default=300, env="MSGID_FILTER_REFRESH_INTERVAL")  # 秒
+    archive_record_path: Optional[str] = Field(default=None, env="ARCHIVE_RECORD_PATH")  # 录制上游响应
+    decrypt_workers: int = Field(default=0, env="DECRYPT_WORKERS")  # 解密进程数，0 表示 CPU 核数
+    counter_reconcile_interval: int = Field(default=3600, env="COUNTER_RECONCILE_INTERVAL")  # 秒
+    counter_reconcile_chunk_size: int = Field(default=500, env="COUNTER_RECONCILE_CHUNK_SIZE")  # 每块群数
+    roster_sync_interval: int = Field(default=3600, env="ROSTER_SYNC_INTERVAL")  # 秒
+    roster_sync_chunk_size: int = Field(default=200, env="ROSTER_SYNC_CHUNK_SIZE")  # 每块群数
+    roster_sync_concurrency: int = Field(default=8, env="ROSTER_SYNC_CONCURRENCY")  # 并发拉取群数
 
     # ================================================================================
     # 媒体文件配置
@@ -93,6 +138,46 @@ class Settings(BaseSettings):
         env="ALLOWED_FILE_TYPES"
     )
     media_url_prefix: str = Field(default="/media", env="MEDIA_URL_PREFIX")
+    media_checkpoint_bytes: int = Field(default=8388608, env="MEDIA_CHECKPOINT_BYTES")  # 8MB
+    media_download_stale_after: int = Field(default=600, env="MEDIA_DOWNLOAD_STALE_AFTER")  # 秒
+    media_schedule_interval: int = Field(default=10, env="MEDIA_SCHEDULE_INTERVAL")  # 秒
+    media_schedule_window: int = Field(default=500, env="MEDIA_SCHEDULE_WINDOW")  # 每轮参与排序的最新待下载文件数
+    media_max_inflight_files: int = Field(default=16, env="MEDIA_MAX_INFLIGHT_FILES")
+    media_max_inflight_bytes: int = Field(default=268435456, env="MEDIA_MAX_INFLIGHT_BYTES")  # 256MB
+    media_max_attempts: int = Field(default=8, env="MEDIA_MAX_ATTEMPTS")
+    media_retry_backoff_base: float = Field(default=60.0, env="MEDIA_RETRY_BACKOFF_BASE")  # 秒
+    media_retry_backoff_max: float = Field(default=21600.0, env="MEDIA_RETRY_BACKOFF_MAX")  # 秒
+    media_type_weights: str = Field(
+        default="voice:0,image:0,emotion:0.5,file:2,video:3,default:1",
+        env="MEDIA_TYPE_WEIGHTS"
+    )  # 文件类型:优先级权重，逗号分隔，越小越先下载
+    media_blob_reclaim_interval: int = Field(default=86400, env="MEDIA_BLOB_RECLAIM_INTERVAL")  # 秒
+    media_blob_reclaim_grace: int = Field(default=86400, env="MEDIA_BLOB_RECLAIM_GRACE")  # 秒
+    media_blob_reclaim_chunk_size: int = Field(default=1000, env="MEDIA_BLOB_RECLAIM_CHUNK_SIZE")
+    media_thumbnail_size: int = Field(default=240, env="MEDIA_THUMBNAIL_SIZE")  # 像素，长边
+    media_preview_size: int = Field(default=1280, env="MEDIA_PREVIEW_SIZE")  # 像素，长边
+    media_derivative_workers: int = Field(default=2, env="MEDIA_DERIVATIVE_WORKERS")
+    media_derivative_cache_max_bytes: int = Field(
+        default=2147483648, env="MEDIA_DERIVATIVE_CACHE_MAX_BYTES"
+    )  # 2GB
+    media_x_accel_redirect_prefix: Optional[str] = Field(
+        default=None, env="MEDIA_X_ACCEL_REDIRECT_PREFIX"
+    )  # nginx internal location，为空时由应用直接发送文件
+    media_cold_storage_path: Optional[str] = Field(
+        default=None, env="MEDIA_COLD_STORAGE_PATH"
+    )  # 冷存储打包目录，为空时使用 media_storage_path/packs
+    media_cold_after_days: int = Field(default=180, env="MEDIA_COLD_AFTER_DAYS")
+    media_cold_idle_days: int = Field(default=30, env="MEDIA_COLD_IDLE_DAYS")
+    media_pack_segment_size: int = Field(default=1073741824, env="MEDIA_PACK_SEGMENT_SIZE")  # 1GB
+    media_pack_max_entry_size: int = Field(default=16777216, env="MEDIA_PACK_MAX_ENTRY_SIZE")  # 16MB
+    media_tiering_interval: int = Field(default=3600, env="MEDIA_TIERING_INTERVAL")  # 秒
+    media_tiering_batch_size: int = Field(default=500, env="MEDIA_TIERING_BATCH_SIZE")
+    media_integrity_interval: int = Field(default=3600, env="MEDIA_INTEGRITY_INTERVAL")  # 秒
+    media_integrity_max_seconds: int = Field(default=3000, env="MEDIA_INTEGRITY_MAX_SECONDS")  # 每轮运行时长上限
+    media_integrity_bytes_per_second: int = Field(
+        default=52428800, env="MEDIA_INTEGRITY_BYTES_PER_SECOND"
+    )  # 50MB/s，0 表示不限速
+    media_integrity_batch_size: int = Field(default=200, env="MEDIA_INTEGRITY_BATCH_SIZE")
 
     # ================================================================================
     # 安全配置
@@ -198,7 +283,18 @@ class Settings(BaseSettings):
             "task_routes": {
                 "src.tasks.sync_messages": {"queue": "sync"},
                 "src.tasks.download_media": {"queue": "media"},
+                "src.tasks.schedule_media_downloads": {"queue": "maintenance"},
+                "src.tasks.reclaim_media_blobs": {"queue": "maintenance"},
+                "src.tasks.migrate_cold_media": {"queue": "maintenance"},
+                "src.tasks.verify_media_integrity": {"queue": "maintenance"},
                 "src.tasks.cleanup_old_data": {"queue": "maintenance"},
+                "src.tasks.rebuild_msgid_filters": {"queue": "maintenance"},
+                "src.tasks.reconcile_counters": {"queue": "maintenance"},
+                "src.tasks.sync_group_rosters": {"queue": "sync"},
+                "src.tasks.run_backfill": {"queue": "sync"},
+                "src.tasks.backfill_slice_done": {"queue": "sync"},
+                "src.tasks.check_backfills": {"queue": "maintenance"},
+                "src.tasks.check_sync_fanouts": {"queue": "maintenance"},
             },
             "beat_schedule": {
                 "sync-messages": {
@@ -209,9 +305,78 @@ class Settings(BaseSettings):
                     "task": "src.tasks.cleanup_old_data",
                     "schedule": 86400,  # 每天执行一次
                 },
+                "sync-group-rosters": {
+                    "task": "src.tasks.sync_group_rosters",
+                    "schedule": self.roster_sync_interval,
+                },
+                "schedule-media-downloads": {
+                    "task": "src.tasks.schedule_media_downloads",
+                    "schedule": self.media_schedule_interval,
+                },
+                "reclaim-media-blobs": {
+                    "task": "src.tasks.reclaim_media_blobs",
+                    "schedule": self.media_blob_reclaim_interval,
+                },
+                "migrate-cold-media": {
+                    "task": "src.tasks.migrate_cold_media",
+                    "schedule": self.media_tiering_interval,
+                },
+                "verify-media-integrity": {
+                    "task": "src.tasks.verify_media_integrity",
+                    "schedule": self.media_integrity_interval,
+                },
+                "check-backfills": {
+                    "task": "src.tasks.check_backfills",
+                    "schedule": self.backfill_check_interval,
+                },
+                "check-sync-fanouts": {
+                    "task": "src.tasks.check_sync_fanouts",
+                    "schedule": self.sync_fanout_check_interval,
+                },
+                "reconcile-counters": {
+                    "task": "src.tasks.reconcile_counters",
+                    "schedule": self.counter_reconcile_interval,
+                },
             },
         }
 
+    @staticmethod
+    def _parse_pairs(value: str) -> List[Tuple[str, str]]:
+        """解析逗号分隔的 key:value 列表，跳过空项和缺少值的项"""
+        pairs = []
+        for item in value.split(","):
+            key, _, item_value = item.strip().partition(":")
+            if key and item_value:
+                pairs.append((key, item_value))
+        return pairs
+
+    def get_corp_accounts(self) -> Dict[str, str]:
+        """所有存档企业的 corpid -> secret，主企业在前"""
+        accounts = {self.corp_id: self.secret}
+        for corp_id, secret in self._parse_pairs(self.extra_corp_accounts):
+            accounts.setdefault(corp_id, secret)
+        return accounts
+
+    def get_encoding_aes_key(self, corp_id: str) -> Optional[str]:
+        """企业的 EncodingAESKey，额外企业未配置时返回 None"""
+        if corp_id == self.corp_id:
+            return self.encoding_aes_key
+        return dict(self._parse_pairs(self.extra_corp_aes_keys)).get(corp_id)
+
+    def get_rate_limits(self) -> Dict[str, float]:
+        """各接口族的每秒请求配额"""
+        return {family: float(rate) for family, rate in self._parse_pairs(self.upstream_rate_limits)}
+
+    def get_media_type_weights(self) -> Dict[str, float]:
+        """各媒体类型的下载优先级权重"""
+        return {file_type: float(value) for file_type, value in self._parse_pairs(self.media_type_weights)}
+
+    def get_private_key_path(self, corp_id: str) -> str:
+        """企业的会话存档私钥目录，额外企业放在以 corpid 命名的子目录"""
+        if corp_id == self.corp_id:
+            return self.msgaudit_private_key_path
+        return os.path.join(self.msgaudit_private_key_path, corp_id)
+
     def get_wechat_api_config(self) -> dict:
         """企业微信 API 配置"""
         return {
@@ -119,6 +119,13 @@ def get_sync_session():
         session.close()
 
 
+async def get_driver_connection(session: AsyncSession):
+    """取出会话当前事务所在的 asyncpg 连接，用于 COPY 和数组参数的批量语句"""
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    return raw.driver_connection
+
+
 async def check_database_health() -> bool:
     """检查数据库健康状态"""
     try:
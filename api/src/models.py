@@ -9,7 +9,7 @@ from typing import Dict, List, Optional
 
 from sqlalchemy import (
     Boolean, Column, DateTime, Enum, ForeignKey, Integer, BigInteger,
-    String, Text, ARRAY, JSON, func, Index
+    String, Table, Text, ARRAY, JSON, func, Index, text
 )
 from sqlalchemy.dialects.postgresql import INET, JSONB
 from sqlalchemy.orm import relationship
@@ -103,7 +103,7 @@ class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    seq = Column(BigInteger, unique=True, nullable=False, index=True)
+    seq = Column(BigInteger, nullable=False, index=True)  # 企业内递增，多企业之间会重复
     msgid = Column(String(100), unique=True, nullable=False, index=True)
     roomid = Column(String(100), ForeignKey("chat_groups.roomid"), nullable=False, index=True)
     msgtype = Column(Enum(MessageType), nullable=False, index=True)
@@ -116,7 +116,9 @@ class ChatMessage(Base):
     is_revoked = Column(Boolean, default=False, index=True)
     revoke_time = Column(DateTime(timezone=True))
     forward_count = Column(Integer, default=0)
-    reply_to_msgid = Column(String(100), ForeignKey("chat_messages.msgid"))
+    reply_to_msgid = Column(
+        String(100), ForeignKey("chat_messages.msgid", deferrable=True, initially="DEFERRED")
+    )
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow, index=True)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -199,12 +201,21 @@ class MediaFile(Base):
     download_attempts = Column(Integer, default=0)
     error_message = Column(Text)
     downloaded_at = Column(DateTime(timezone=True))
+    scheduled_at = Column(DateTime(timezone=True))  # 调度器投递时间，worker 领取时清空
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow, index=True)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # 关系
     message = relationship("ChatMessage", back_populates="media_files")
 
+    # 索引：调度器只扫描待下载文件中最新的一段，以及已投递未领取的文件
+    __table_args__ = (
+        Index('idx_media_files_schedulable', 'created_at',
+              postgresql_where=text("download_status IN ('PENDING', 'FAILED')")),
+        Index('idx_media_files_scheduled_at', 'scheduled_at',
+              postgresql_where=text("scheduled_at IS NOT NULL")),
+    )
+
     @hybrid_property
     def is_downloaded(self):
         """是否已下载"""
@@ -221,6 +232,21 @@ class MediaFile(Base):
         return f"<MediaFile(id={self.id}, type='{self.file_type}', status='{self.download_status}')>"
 
 
+class MediaBlob(Base):
+    """内容寻址的媒体文件实体，按 md5 去重，ref_count 为引用它的已下载 MediaFile 数"""
+    __tablename__ = "media_blobs"
+
+    md5 = Column(String(32), primary_key=True)
+    file_size = Column(BigInteger)
+    ref_count = Column(Integer, default=0, nullable=False)
+    released_at = Column(DateTime(timezone=True), index=True)  # 引用数降为 0 的时间
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<MediaBlob(md5='{self.md5}', refs={self.ref_count})>"
+
+
 class SyncTask(Base):
     """同步任务模型"""
     __tablename__ = "sync_tasks"
@@ -262,6 +288,79 @@ class SyncTask(Base):
         return f"<SyncTask(task_id='{self.task_id}', status='{self.status}')>"
 
 
+class PendingMessageRef(Base):
+    """待解析的消息引用（回复/撤回的目标消息尚未入库）"""
+    __tablename__ = "pending_message_refs"
+
+    target_msgid = Column(String(100), primary_key=True)
+    ref_type = Column(String(10), primary_key=True)  # reply / revoke
+    msgid = Column(String(100), primary_key=True)
+    ref_time = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<PendingMessageRef(type='{self.ref_type}', msgid='{self.msgid}', target='{self.target_msgid}')>"
+
+
+class SyncCursor(Base):
+    """同步游标模型（每个企业一行，与消息批次同事务提交）"""
+    __tablename__ = "sync_cursors"
+
+    owner_corpid = Column(String(100), primary_key=True)
+    last_seq = Column(BigInteger, nullable=False, default=0)
+    last_msgtime = Column(DateTime(timezone=True))
+    message_count = Column(BigInteger, default=0)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @hybrid_property
+    def lag_seconds(self):
+        """最后一条已入库消息距今的秒数"""
+        if self.last_msgtime:
+            return max((datetime.now(self.last_msgtime.tzinfo) - self.last_msgtime).total_seconds(), 0)
+        return None
+
+    def __repr__(self):
+        return f"<SyncCursor(owner_corpid='{self.owner_corpid}', last_seq={self.last_seq})>"
+
+
+# 批量写入的 COPY 暂存表（见 services/bulk_writer）：UNLOGGED，随 schema 一起创建，
+# 写入时不再执行 DDL；各批次以 batch_id 区分，合并后在同一事务内删除
+message_staging = Table(
+    "chat_messages_staging",
+    Base.metadata,
+    Column("batch_id", String(32), nullable=False),
+    Column("seq", BigInteger, nullable=False),
+    Column("msgid", String(100), nullable=False),
+    Column("roomid", String(100), nullable=False),
+    Column("msgtype", Text, nullable=False),
+    Column("msgtime", DateTime(timezone=True), nullable=False),
+    Column("from_user", String(100)),
+    Column("to_users", ARRAY(Text)),
+    Column("content", Text),
+    Column("media_data", Text),
+    Column("raw_data", Text),
+    Index("idx_chat_messages_staging_batch", "batch_id"),
+    prefixes=["UNLOGGED"],
+)
+
+media_staging = Table(
+    "media_files_staging",
+    Base.metadata,
+    Column("batch_id", String(32), nullable=False),
+    Column("msgid", String(100), nullable=False),
+    Column("file_type", String(20), nullable=False),
+    Column("file_name", String(255)),
+    Column("original_filename", String(255)),
+    Column("file_size", BigInteger),
+    Column("file_extension", String(10)),
+    Column("md5", String(32)),
+    Column("metadata", Text),
+    Index("idx_media_files_staging_batch", "batch_id"),
+    prefixes=["UNLOGGED"],
+)
+
+
 class AuditLog(Base):
     """审计日志模型"""
     __tablename__ = "audit_logs"
@@ -0,0 +1,47 @@
+"""
+Redis 客户端模块
+
+提供进程级共享的异步 Redis 连接池。
+"""
+
+from typing import Optional
+
+import redis.asyncio as redis
+import structlog
+
+from .config import get_settings
+
+logger = structlog.get_logger()
+
+# 全局变量
+redis_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """获取 Redis 客户端（首次调用时创建连接池）"""
+    global redis_client
+
+    if redis_client is None:
+        settings = get_settings()
+        redis_client = redis.from_url(settings.redis_url, **settings.redis_config)
+
+    return redis_client
+
+
+async def check_redis_health() -> bool:
+    """检查 Redis 健康状态"""
+    try:
+        return await get_redis().ping()
+    except Exception as e:
+        logger.error("Redis health check failed", error=str(e))
+        return False
+
+
+async def close_redis():
+    """关闭 Redis 连接"""
+    global redis_client
+
+    if redis_client is not None:
+        await redis_client.close()
+        redis_client = None
+        logger.info("Redis connections closed")
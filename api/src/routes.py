@@ -4,19 +4,29 @@ API 路由定义
 定义所有的API端点和路由。
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
+import os
 import structlog
 
+from .config import get_settings
 from .database import get_db, check_database_health
+from .models import MediaFile
 from .schemas import (
-    GroupResponse, GroupListResponse, MessageResponse, MessageListResponse,
-    SyncTaskRequest, SyncTaskResponse, HealthResponse
+    GroupResponse, GroupListResponse, MemberListResponse, MessageResponse, MessageListResponse,
+    SyncTaskRequest, SyncTaskResponse, SyncCursorResponse, HealthResponse
 )
+from .services.backfill import BackfillService
 from .services.group_service import GroupService
+from .services.media_derivatives import get_derivative_service
+from .services.media_serving import CACHE_CONTROL, build_media_response, is_not_modified
+from .services.media_store import MediaStore
+from .services.media_tiering import record_access
 from .services.message_service import MessageService
+from .services.rate_limiter import PRIORITY_INTERACTIVE
 from .services.sync_service import SyncService
 
 logger = structlog.get_logger()
@@ -27,6 +37,9 @@ health_router = APIRouter()
 # API路由
 api_router = APIRouter()
 
+# 媒体文件路由（挂载在 media_url_prefix 下）
+media_router = APIRouter()
+
 
 @health_router.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -121,6 +134,32 @@ async def get_group(
         )
 
 
+@api_router.get("/groups/{roomid}/members", response_model=MemberListResponse)
+async def get_group_members(
+    roomid: str,
+    page: int = Query(1, ge=1, description="页码"),
+    size: int = Query(50, ge=1, le=200, description="每页数量"),
+    is_active: Optional[bool] = Query(True, description="是否在群"),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取群成员（含发言数、最后发言时间）"""
+    try:
+        group_service = GroupService(db)
+        result = await group_service.get_group_members(
+            roomid=roomid,
+            page=page,
+            size=size,
+            is_active=is_active
+        )
+        return result
+    except Exception as e:
+        logger.error("Failed to get group members", roomid=roomid, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="获取群成员失败"
+        )
+
+
 @api_router.get("/groups/{roomid}/messages", response_model=MessageListResponse)
 async def get_group_messages(
     roomid: str,
@@ -185,13 +224,31 @@ async def sync_messages(
     request: SyncTaskRequest,
     db: AsyncSession = Depends(get_db)
 ):
-    """手动同步消息"""
+    """手动同步消息；task_type 为 backfill 时按分片并行回补历史消息
+
+    普通手动同步有人在等结果，按交互优先级取上游配额；回补是批量任务，仍按同步优先级。
+    """
+    if request.task_type == "backfill":
+        if request.start_time is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="历史回补必须指定开始时间"
+            )
+        end_time = request.end_time or datetime.now(timezone.utc)
+        if end_time - request.start_time > timedelta(days=get_settings().max_sync_days):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="回补时间范围超过最大同步天数"
+            )
+
     try:
         sync_service = SyncService(db)
         task = await sync_service.create_sync_task(
             roomid=request.roomid,
             start_time=request.start_time,
-            end_time=request.end_time
+            end_time=request.end_time,
+            task_type=request.task_type,
+            metadata=None if request.task_type == "backfill" else {"priority": PRIORITY_INTERACTIVE}
         )
         return task
     except Exception as e:
@@ -210,7 +267,7 @@ async def get_sync_task(
     """获取同步任务状态"""
     try:
         sync_service = SyncService(db)
-        task = await sync_service.get_task_by_id(task_id)
+        task = await sync_service.get_task_with_progress(task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -253,6 +310,46 @@ async def get_sync_tasks(
         )
 
 
+@api_router.get("/sync/cursors", response_model=List[SyncCursorResponse])
+async def get_sync_cursors(
+    db: AsyncSession = Depends(get_db)
+):
+    """获取各企业同步游标及同步延迟"""
+    try:
+        sync_service = SyncService(db)
+        return await sync_service.get_cursors()
+    except Exception as e:
+        logger.error("Failed to get sync cursors", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="获取同步游标失败"
+        )
+
+
+@api_router.post("/sync/tasks/{task_id}/retry", response_model=SyncTaskResponse)
+async def retry_sync_task(
+    task_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """重试回补任务中失败的分片"""
+    try:
+        task = await BackfillService(db).retry_failed(task_id)
+        if not task:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="回补任务不存在"
+            )
+        return task
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to retry sync task", task_id=task_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="重试同步任务失败"
+        )
+
+
 @api_router.delete("/sync/tasks/{task_id}")
 async def cancel_sync_task(
     task_id: str,
@@ -346,4 +443,63 @@ async def search_messages(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="搜索消息失败"
-        )
\ No newline at end of file
+        )
+
+
+@media_router.api_route("/{media_id}", methods=["GET", "HEAD"])
+async def get_media_file(
+    media_id: int,
+    request: Request,
+    download: bool = Query(False, description="以附件形式下载"),
+    db: AsyncSession = Depends(get_db)
+):
+    """下载媒体文件，支持 Range、ETag 条件请求和 X-Accel-Redirect；热、冷存储透明读取"""
+    media = await db.get(MediaFile, media_id)
+    path, offset, size = MediaStore.locate(media) if media is not None else (None, 0, None)
+    if media is None or not media.is_downloaded or not path or not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="媒体文件不存在"
+        )
+    response = build_media_response(request, media, path, offset, size, attachment=download)
+    await record_access(db, media)
+    return response
+
+
+@media_router.get("/{media_id}/{variant}")
+async def get_media_derivative(
+    media_id: int,
+    variant: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取图片的缩略图（thumbnail）或预览图（preview），首次请求时生成"""
+    service = get_derivative_service()
+    media = await db.get(MediaFile, media_id)
+    if media is None or variant not in service.variants or not service.supports(media):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="预览图不存在"
+        )
+
+    # 衍生图由内容 md5 决定，不会变化；与原文件一样只允许浏览器私有缓存
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": f'"{media.md5.lower()}-{variant}"'}
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        path = await service.get(media, variant)
+    except (OSError, ValueError) as e:
+        logger.warning("Failed to render media derivative", media_id=media_id, variant=variant, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="无法生成预览图"
+        )
+    except Exception as e:
+        logger.error("Failed to get media derivative", media_id=media_id, variant=variant, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="获取预览图失败"
+        )
+
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
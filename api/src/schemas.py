@@ -9,6 +9,8 @@ from typing import Any, Dict, List, Optional, Union
 from pydantic import BaseModel, Field, validator
 from enum import Enum
 
+from .config import get_settings
+
 
 # 枚举类型
 class MessageTypeEnum(str, Enum):
@@ -127,10 +129,28 @@ class MediaFileResponse(BaseModel):
     download_status: DownloadStatusEnum = Field(..., description="下载状态")
     downloaded_at: Optional[datetime] = Field(None, description="下载时间")
     metadata: Dict[str, Any] = Field(default_factory=dict, description="元数据")
+    thumbnail_url: Optional[str] = Field(None, description="缩略图地址")
+    preview_url: Optional[str] = Field(None, description="预览图地址")
 
     class Config:
         from_attributes = True
 
+    @validator('thumbnail_url', always=True)
+    def build_thumbnail_url(cls, v, values):
+        return v or _derivative_url(values, "thumbnail")
+
+    @validator('preview_url', always=True)
+    def build_preview_url(cls, v, values):
+        return v or _derivative_url(values, "preview")
+
+
+def _derivative_url(values: Dict[str, Any], variant: str) -> Optional[str]:
+    """已下载的图片类媒体才有衍生图"""
+    if values.get('file_type') not in ("image", "emotion") or values.get('download_status') != "completed":
+        return None
+    prefix = get_settings().media_url_prefix.rstrip("/")
+    return f"{prefix}/{values['id']}/{variant}"
+
 
 class MessageBase(BaseModel):
     """消息基础模式"""
@@ -199,6 +219,11 @@ class MemberResponse(MemberBase):
         from_attributes = True
 
 
+class MemberListResponse(PaginatedResponse):
+    """群成员列表响应模式"""
+    data: List[MemberResponse] = Field(..., description="群成员列表")
+
+
 # 同步任务相关模式
 class SyncTaskRequest(BaseModel):
     """同步任务请求模式"""
@@ -236,6 +261,19 @@ class SyncTaskResponse(BaseModel):
         from_attributes = True
 
 
+class SyncCursorResponse(BaseModel):
+    """同步游标响应模式"""
+    owner_corpid: str = Field(..., description="企业ID")
+    last_seq: int = Field(0, description="最后提交的消息序号")
+    last_msgtime: Optional[datetime] = Field(None, description="最后提交的消息时间")
+    message_count: int = Field(0, description="累计入库消息数")
+    lag_seconds: Optional[float] = Field(None, description="同步延迟（秒）")
+    updated_at: datetime = Field(..., description="更新时间")
+
+    class Config:
+        from_attributes = True
+
+
 class SyncTaskListResponse(PaginatedResponse):
     """同步任务列表响应模式"""
     data: List[SyncTaskResponse] = Field(..., description="任务列表")
@@ -0,0 +1,5 @@
+"""
+业务服务包
+
+包含群组、消息、同步及企业微信接口相关的业务服务。
+"""
@@ -0,0 +1,210 @@
+"""
+会话存档录制与回放
+
+ArchiveRecorder 把上游 getchatdata / getmediadata 的原始响应追加写入本地分段文件；
+回放服务读取这些分段，按可配置速率模拟企业微信接口。把 WECHAT_API_BASE_URL 指向
+回放服务即可离线压测完整的 SyncService → 解密 → chat_messages 入库链路。
+
+用法:
+    python -m src.services.archive_replay --path /data/replay --rate 5000 --port 9000
+"""
+
+import argparse
+import asyncio
+import bisect
+import glob
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import structlog
+from fastapi import FastAPI, Request
+
+logger = structlog.get_logger()
+
+# 录制的接口
+RECORDED_ENDPOINTS = ("/cgi-bin/msgaudit/getchatdata", "/cgi-bin/msgaudit/getmediadata")
+
+SEGMENT_PATTERN = "segment-*.jsonl"
+
+
+class ArchiveRecorder:
+    """把上游响应追加写入分段文件（JSON Lines，按大小滚动）
+
+    多个 worker / API 进程可以同时录制到同一目录：分段文件名带主机名和 pid，
+    每个进程只写自己的分段，不会交错写入同一文件。
+    """
+
+    def __init__(self, path: str, segment_size: int = 64 * 1024 * 1024):
+        self.path = path
+        self.segment_size = segment_size
+        self.pid = os.getpid()
+        self.prefix = f"segment-{socket.gethostname()}-{self.pid}"
+        self._lock = threading.Lock()
+        self._file = None
+        os.makedirs(path, exist_ok=True)
+
+    async def record(self, endpoint: str, request: Optional[Dict[str, Any]], body: bytes):
+        """记录一次响应；body 为上游原始响应字节，拼行和写文件在线程池中进行，不阻塞事件循环"""
+        if endpoint not in RECORDED_ENDPOINTS:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._write, endpoint, request, body)
+
+    def _write(self, endpoint: str, request: Optional[Dict[str, Any]], body: bytes):
+        # JSON 字符串内的换行必然被转义，原始字节中的换行只可能是空白，可直接去掉
+        body = body.replace(b"\r", b"").replace(b"\n", b"")
+        line = b'{"endpoint":' + orjson.dumps(endpoint) \
+            + b',"request":' + orjson.dumps(request or {}) \
+            + b',"response":' + body + b'}\n'
+
+        with self._lock:
+            if self._file is None or self._file.tell() + len(line) > self.segment_size:
+                self._rotate()
+            self._file.write(line)
+            self._file.flush()
+
+    def _rotate(self):
+        """打开下一个分段文件"""
+        if self._file is not None:
+            self._file.close()
+        index = len(glob.glob(os.path.join(self.path, f"{self.prefix}-*.jsonl"))) + 1
+        filename = os.path.join(self.path, f"{self.prefix}-{index:06d}.jsonl")
+        self._file = open(filename, "ab")
+        logger.info("Replay segment opened", file=filename)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_recorder: Optional[ArchiveRecorder] = None
+
+
+def get_archive_recorder() -> Optional[ArchiveRecorder]:
+    """配置了 ARCHIVE_RECORD_PATH 时返回进程级共享录制器"""
+    global _recorder
+    from ..config import get_settings
+
+    path = get_settings().archive_record_path
+    if not path:
+        return None
+    if _recorder is None or _recorder.pid != os.getpid():
+        # fork 出的子进程不能沿用父进程的分段文件
+        _recorder = ArchiveRecorder(path)
+    return _recorder
+
+
+class ArchiveReplayStore:
+    """加载录制分段并按 seq / 媒体分片索引"""
+
+    def __init__(self, path: str):
+        self.seqs: List[int] = []
+        self.chatdata: List[Dict[str, Any]] = []
+        self.media: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._load(path)
+
+    def _load(self, path: str):
+        entries: Dict[int, Dict[str, Any]] = {}
+        for filename in sorted(glob.glob(os.path.join(path, SEGMENT_PATTERN))):
+            with open(filename, "rb") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = orjson.loads(line)
+                    response = record["response"]
+                    if record["endpoint"].endswith("getchatdata"):
+                        for entry in response.get("chatdata") or []:
+                            entries[entry["seq"]] = entry
+                    else:
+                        request = record["request"]
+                        key = (request.get("sdkfileid", ""), request.get("indexbuf", ""))
+                        self.media[key] = response
+
+        for seq in sorted(entries):
+            self.seqs.append(seq)
+            self.chatdata.append(entries[seq])
+
+        logger.info("Replay data loaded", messages=len(self.chatdata), media_chunks=len(self.media))
+
+    def get_chat_data(self, seq: int, limit: int) -> List[Dict[str, Any]]:
+        """返回 seq 之后的最多 limit 条"""
+        start = bisect.bisect_right(self.seqs, seq)
+        return self.chatdata[start:start + limit]
+
+
+class _RateLimiter:
+    """按每秒条数限速"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, count: int):
+        if self.rate <= 0 or count <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            self._next_at = max(self._next_at, now) + count / self.rate
+            delay = self._next_at - now
+        await asyncio.sleep(delay)
+
+
+def create_replay_app(path: str, rate: float = 0, latency: float = 0) -> FastAPI:
+    """创建回放服务；rate 为每秒消息条数（0 不限速），latency 为每次请求的固定延迟（秒）"""
+    store = ArchiveReplayStore(path)
+    limiter = _RateLimiter(rate)
+    app = FastAPI(title="WeChat Work Archive Replay", docs_url=None, redoc_url=None)
+
+    @app.get("/cgi-bin/gettoken")
+    async def get_token():
+        return {"errcode": 0, "errmsg": "ok", "access_token": "replay-token", "expires_in": 7200}
+
+    @app.post("/cgi-bin/msgaudit/getchatdata")
+    async def get_chat_data(request: Request):
+        body = await request.json()
+        chatdata = store.get_chat_data(int(body.get("seq", 0)), int(body.get("limit", 100)))
+        if latency:
+            await asyncio.sleep(latency)
+        await limiter.acquire(len(chatdata))
+        return {"errcode": 0, "errmsg": "ok", "chatdata": chatdata}
+
+    @app.post("/cgi-bin/msgaudit/getmediadata")
+    async def get_media_data(request: Request):
+        body = await request.json()
+        response = store.media.get((body.get("sdkfileid", ""), body.get("indexbuf", "")))
+        if latency:
+            await asyncio.sleep(latency)
+        if response is None:
+            return {"errcode": 301010, "errmsg": "media not recorded"}
+        return response
+
+    return app
+
+
+def main():
+    """命令行入口"""
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="WeChat Work archive replay server")
+    parser.add_argument("--path", required=True, help="录制分段目录")
+    parser.add_argument("--rate", type=float, default=0, help="每秒回放消息条数，0 表示不限速")
+    parser.add_argument("--latency", type=float, default=0, help="每次请求的固定延迟（秒）")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_replay_app(args.path, rate=args.rate, latency=args.latency),
+        host=args.host,
+        port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
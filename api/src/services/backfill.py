@@ -0,0 +1,321 @@
+"""
+历史消息分片回补
+
+getchatdata 只能按 seq 翻页，不能按时间查询，因此回补任务先用少量探测请求
+二分定位 start_time / end_time 对应的 seq 边界，再把 seq 区间切成若干等长分片。
+每个分片是一个 backfill_slice 子任务，在 sync 队列上以并发上限逐步投递；
+父任务记录各分片状态，重试时只重新投递失败的分片。超过 BACKFILL_SLICE_STALE_AFTER
+没有任何进度的在途分片视为 worker 已退出，记为失败，避免父任务一直停留在运行中。
+"""
+
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+import structlog
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import SyncTask, TaskStatus
+from .decrypt_executor import DecryptExecutor
+from .message_parser import parse_msgtime
+from .sync_service import SyncService
+from .task_progress import clear_progress, read_progress, set_progress_status
+from .wechat_client import WeChatArchiveClient
+
+logger = structlog.get_logger()
+
+BACKFILL_TASK_TYPE = "backfill"
+SLICE_TASK_TYPE = "backfill_slice"
+
+# 每次探测拉取的条数：首条解密失败时可以用后面的消息判断时间
+PROBE_LIMIT = 5
+
+# 单次探测最多翻页数，连续大段无法解密的数据不会一直翻到存档末尾
+PROBE_MAX_PAGES = 100
+
+
+class SeqLocateError(Exception):
+    """无法定位 seq 边界"""
+
+
+class SeqLocator:
+    """通过探测请求定位某一时间点对应的 seq 边界"""
+
+    def __init__(
+        self,
+        client: WeChatArchiveClient,
+        decryptor: DecryptExecutor,
+        key_path: Optional[str] = None,
+        encoding_aes_key: Optional[str] = None,
+        initial_step: int = 10000,
+        max_probe_pages: int = PROBE_MAX_PAGES
+    ):
+        self.client = client
+        self.decryptor = decryptor
+        self.key_path = key_path
+        self.encoding_aes_key = encoding_aes_key
+        self.initial_step = initial_step
+        self.max_probe_pages = max_probe_pages
+        self.probes = 0
+
+    async def _probe(self, seq: int) -> Optional[Tuple[int, datetime]]:
+        """seq 之后第一条可解密消息的 (seq, 时间)，没有更多消息时返回 None；
+        连续 max_probe_pages 页都无法解密时放弃，回补规划失败"""
+        start_seq = seq
+        for _ in range(self.max_probe_pages):
+            self.probes += 1
+            page = await self.client.get_chat_data(seq, PROBE_LIMIT)
+            chatdata = page.get("chatdata") or []
+            if not chatdata:
+                return None
+
+            for entry_seq, raw in await self.decryptor.decrypt_batch(
+                chatdata, self.key_path, self.encoding_aes_key
+            ):
+                data = orjson.loads(raw)
+                msgtime = data.get("msgtime") or data.get("time")
+                if msgtime:
+                    return entry_seq, parse_msgtime(msgtime)
+            seq = chatdata[-1]["seq"]
+
+        raise SeqLocateError(
+            f"No decryptable message in {self.max_probe_pages} probe pages after seq={start_seq}"
+        )
+
+    async def _after(self, seq: int, at: Optional[datetime]) -> bool:
+        """seq 之后的消息是否都不早于 at（at 为空表示查找数据末尾）"""
+        found = await self._probe(seq)
+        return found is None or (at is not None and found[1] >= at)
+
+    async def locate(self, at: Optional[datetime], low: int = 0) -> int:
+        """返回最小的 seq，使其之后的消息都不早于 at；先倍增找上界，再二分"""
+        if await self._after(low, at):
+            return low
+
+        step = self.initial_step
+        high = low + step
+        while not await self._after(high, at):
+            low, step = high, step * 2
+            high = low + step
+
+        while high - low > 1:
+            mid = (low + high) // 2
+            if await self._after(mid, at):
+                high = mid
+            else:
+                low = mid
+        return high
+
+
+class BackfillService:
+    """分片回补的规划、投递和汇总"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.sync_service = SyncService(db)
+        settings = get_settings()
+        self.slice_size = settings.backfill_slice_size
+        self.concurrency = settings.backfill_concurrency
+        self.stale_after = settings.backfill_slice_stale_after
+
+    async def plan(self, parent: SyncTask, locator: SeqLocator) -> List[SyncTask]:
+        """定位 seq 区间并创建分片子任务"""
+        seq_start = await locator.locate(parent.start_time)
+        seq_end = await locator.locate(parent.end_time, low=seq_start)
+        span = seq_end - seq_start
+        count = max(1, math.ceil(span / self.slice_size)) if span else 0
+
+        slices = []
+        for index in range(count):
+            slices.append(await self.sync_service.create_sync_task(
+                roomid=parent.roomid,
+                start_time=parent.start_time,
+                end_time=parent.end_time,
+                task_type=SLICE_TASK_TYPE,
+                corp_id=(parent.metadata or {}).get("owner_corpid"),
+                metadata={
+                    "parent_task_id": parent.task_id,
+                    "slice": index,
+                    "seq_start": seq_start + span * index // count,
+                    "seq_end": seq_start + span * (index + 1) // count,
+                },
+                dispatch=False
+            ))
+
+        parent.total_count = count
+        parent.metadata = {
+            **(parent.metadata or {}),
+            "seq_range": [seq_start, seq_end],
+            "slice_count": count,
+            "probes": locator.probes,
+        }
+        await self.db.commit()
+        logger.info("Backfill planned", task_id=parent.task_id, slices=count,
+                    seq_start=seq_start, seq_end=seq_end, probes=locator.probes)
+        return slices
+
+    async def get_slices(self, parent_task_id: str) -> List[SyncTask]:
+        """父任务下的全部分片，按序号排列"""
+        result = await self.db.execute(
+            select(SyncTask).where(
+                SyncTask.task_type == SLICE_TASK_TYPE,
+                SyncTask.__table__.c.metadata["parent_task_id"].astext == parent_task_id
+            )
+        )
+        return sorted(result.scalars().all(), key=lambda task: task.metadata["slice"])
+
+    async def dispatch_pending(self, parent_task_id: str) -> Optional[SyncTask]:
+        """在并发上限内投递待执行分片；全部分片结束时汇总父任务
+
+        分片结束回调会并发调用本方法，父任务行加锁保证投递和汇总串行。
+        """
+        from ..tasks import backfill_slice_done, sync_messages
+
+        result = await self.db.execute(
+            select(SyncTask).where(SyncTask.task_id == parent_task_id).with_for_update()
+        )
+        parent = result.scalar_one_or_none()
+        if parent is None:
+            return None
+
+        slices = await self.get_slices(parent_task_id)
+        if parent.status == TaskStatus.RUNNING.value:
+            await self._fail_stale_slices(slices)
+        statuses = {task.task_id: self._slice_status(task) for task in slices}
+        in_flight = sum(1 for status in statuses.values() if status in ("queued", TaskStatus.RUNNING.value))
+        waiting = [task for task in slices if statuses[task.task_id] == TaskStatus.PENDING.value]
+
+        to_dispatch: List[SyncTask] = []
+        if parent.status == TaskStatus.RUNNING.value:
+            to_dispatch = waiting[:max(0, self.concurrency - in_flight)]
+            for task in to_dispatch:
+                task.metadata = {**task.metadata, "queued": True}
+                statuses[task.task_id] = "queued"
+
+        self._summarize(parent, slices, statuses)
+        await self.db.commit()
+
+        for task in to_dispatch:
+            sync_messages.apply_async((task.task_id,), link=backfill_slice_done.s(parent_task_id))
+        if to_dispatch:
+            logger.info("Backfill slices dispatched", task_id=parent_task_id, count=len(to_dispatch))
+        return parent
+
+    async def check_running(self) -> int:
+        """检查全部运行中的回补任务：回收失联分片、补投分片并汇总，返回检查的任务数"""
+        result = await self.db.execute(
+            select(SyncTask.task_id).where(
+                SyncTask.task_type == BACKFILL_TASK_TYPE,
+                SyncTask.status == TaskStatus.RUNNING.value
+            )
+        )
+        task_ids = list(result.scalars().all())
+        for task_id in task_ids:
+            await self.dispatch_pending(task_id)
+        return len(task_ids)
+
+    async def _fail_stale_slices(self, slices: List[SyncTask]):
+        """在途分片超过 stale_after 没有进度时记为失败；若 worker 仍在运行，
+        发布取消状态使其在下一批上报时退出"""
+        now = datetime.now(timezone.utc)
+        for task in slices:
+            if self._slice_status(task) not in ("queued", TaskStatus.RUNNING.value):
+                continue
+            progress = await read_progress(task.task_id)
+            if not self.is_stale(task, progress, now, self.stale_after):
+                continue
+
+            task.status = TaskStatus.FAILED.value
+            task.error_message = f"分片超过 {self.stale_after} 秒没有进度，worker 可能已退出"
+            task.metadata = {**task.metadata, "queued": False}
+            await set_progress_status(task.task_id, TaskStatus.CANCELLED.value)
+            logger.warning("Stale backfill slice failed", task_id=task.task_id,
+                           parent_task_id=task.metadata.get("parent_task_id"))
+
+    @staticmethod
+    def is_stale(
+        task: SyncTask,
+        progress: Optional[Dict],
+        now: datetime,
+        stale_after: float
+    ) -> bool:
+        """分片最后一次活动（任务行更新或 Redis 进度上报）距今是否超过 stale_after 秒"""
+        activity = [task.updated_at, (progress or {}).get("updated_at")]
+        activity = [t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in activity if t is not None]
+        if not activity:
+            return False
+        return (now - max(activity)).total_seconds() > stale_after
+
+    async def retry_failed(self, parent_task_id: str) -> Optional[SyncTask]:
+        """把失败或取消的分片重置为待执行并重新投递，已完成的分片不再执行"""
+        parent = await self.sync_service.get_task_by_id(parent_task_id)
+        if parent is None or parent.task_type != BACKFILL_TASK_TYPE:
+            return None
+
+        retried: List[str] = []
+        for task in await self.get_slices(parent_task_id):
+            if task.status in (TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+                task.status = TaskStatus.PENDING.value
+                task.error_message = None
+                task.metadata = {
+                    **task.metadata,
+                    "queued": False,
+                    "attempts": task.metadata.get("attempts", 1) + 1,
+                }
+                retried.append(task.task_id)
+
+        if retried:
+            parent.status = TaskStatus.RUNNING.value
+            parent.error_message = None
+        await self.db.commit()
+
+        # 取消时写入 Redis 的状态和上次执行的计数一并清除，否则重试的分片在首次上报时又被取消
+        for task_id in retried:
+            await clear_progress(task_id)
+        logger.info("Backfill retry requested", task_id=parent_task_id, slices=len(retried))
+        return await self.dispatch_pending(parent_task_id)
+
+    @staticmethod
+    def _slice_status(task: SyncTask) -> str:
+        """已投递但 worker 尚未开始的分片记为 queued"""
+        if task.status == TaskStatus.PENDING.value and (task.metadata or {}).get("queued"):
+            return "queued"
+        return task.status
+
+    @staticmethod
+    def _summarize(parent: SyncTask, slices: List[SyncTask], statuses: Dict[str, str]):
+        """把分片状态汇总到父任务"""
+        completed = sum(1 for status in statuses.values() if status == TaskStatus.COMPLETED.value)
+        failed = sum(
+            1 for status in statuses.values()
+            if status in (TaskStatus.FAILED.value, TaskStatus.CANCELLED.value)
+        )
+        parent.progress = completed + failed
+        parent.success_count = completed
+        parent.error_count = failed
+        parent.metadata = {
+            **(parent.metadata or {}),
+            "slices": [
+                {
+                    "slice": task.metadata["slice"],
+                    "task_id": task.task_id,
+                    "seq_start": task.metadata["seq_start"],
+                    "seq_end": task.metadata["seq_end"],
+                    "status": statuses[task.task_id],
+                    "inserted": task.success_count or 0,
+                    "error": task.error_message,
+                }
+                for task in slices
+            ],
+            "inserted": sum(task.success_count or 0 for task in slices),
+        }
+
+        if parent.status == TaskStatus.RUNNING.value and parent.progress == len(slices):
+            if failed:
+                parent.status = TaskStatus.FAILED.value
+                parent.error_message = f"{failed} 个分片失败，可重试失败分片"
+            else:
+                parent.status = TaskStatus.COMPLETED.value
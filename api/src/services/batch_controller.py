@@ -0,0 +1,120 @@
+"""
+自适应批大小控制
+
+按 AIMD（加性增、乘性减）在运行时调整 getchatdata 拉取条数和数据库刷写条数：
+上游延迟和提交耗时低于目标时逐步加大批次，超过目标时按比例缩小，
+始终限制在配置的上下限之内。
+"""
+
+import collections
+import time
+from typing import Any, Deque, Dict, Optional
+
+from ..config import get_settings
+
+# EWMA 平滑系数
+_ALPHA = 0.3
+
+
+def _ewma(current: Optional[float], value: float) -> float:
+    """指数加权移动平均"""
+    return value if current is None else current + _ALPHA * (value - current)
+
+
+class AdaptiveBatchController:
+    """AIMD 批大小控制器"""
+
+    def __init__(
+        self,
+        fetch_limit: Optional[int] = None,
+        flush_size: Optional[int] = None,
+        increase_step: int = 50,
+        decrease_factor: float = 0.5,
+        max_decisions: int = 50
+    ):
+        settings = get_settings()
+        self.fetch_min = settings.batch_size_min
+        self.fetch_max = settings.batch_size_max
+        self.flush_min = settings.flush_size_min
+        self.flush_max = settings.flush_size_max
+        self.target_fetch_latency = settings.target_fetch_latency
+        self.target_commit_latency = settings.target_commit_latency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self.fetch_limit = self._clamp(fetch_limit or settings.batch_size, self.fetch_min, self.fetch_max)
+        self.flush_size = self._clamp(flush_size or self.fetch_limit, self.flush_min, self.flush_max)
+
+        self.fetch_latency: Optional[float] = None
+        self.commit_latency: Optional[float] = None
+        self.decrypt_rate: Optional[float] = None
+        self.decisions: Deque[Dict[str, Any]] = collections.deque(maxlen=max_decisions)
+        self._started = time.monotonic()
+
+    @staticmethod
+    def _clamp(value: int, low: int, high: int) -> int:
+        return max(low, min(high, int(value)))
+
+    def observe_fetch(self, latency: float, count: int, limit: int):
+        """记录一次上游拉取并调整拉取条数"""
+        self.fetch_latency = _ewma(self.fetch_latency, latency)
+
+        if self.fetch_latency > self.target_fetch_latency:
+            self._set("fetch_limit", self.fetch_limit * self.decrease_factor, "upstream_slow")
+        elif count < limit:
+            # 已追平上游，加大批次没有意义
+            return
+        elif self.decrypt_rate and limit / max(self.fetch_latency, 1e-3) > self.decrypt_rate * 1.5:
+            # 拉取速度已明显超过解密吞吐，保持不变
+            return
+        else:
+            self._set("fetch_limit", self.fetch_limit + self.increase_step, "upstream_fast")
+
+    def observe_decrypt(self, seconds: float, count: int, parallelism: int = 1):
+        """记录一批解密耗时，估算解密吞吐（条/秒）"""
+        if seconds > 0 and count:
+            self.decrypt_rate = _ewma(self.decrypt_rate, count * parallelism / seconds)
+
+    def observe_commit(self, latency: float, count: int):
+        """记录一次数据库提交并调整刷写条数"""
+        self.commit_latency = _ewma(self.commit_latency, latency)
+
+        if self.commit_latency > self.target_commit_latency:
+            self._set("flush_size", self.flush_size * self.decrease_factor, "commit_slow")
+        elif count >= self.flush_size:
+            self._set("flush_size", self.flush_size + self.increase_step, "commit_fast")
+
+    def _set(self, knob: str, value: float, reason: str):
+        """设置新值并记录决策"""
+        if knob == "fetch_limit":
+            new_value = self._clamp(value, self.fetch_min, self.fetch_max)
+        else:
+            new_value = self._clamp(value, self.flush_min, self.flush_max)
+
+        old_value = getattr(self, knob)
+        if new_value == old_value:
+            return
+
+        setattr(self, knob, new_value)
+        self.decisions.append({
+            "t": round(time.monotonic() - self._started, 3),
+            "knob": knob,
+            "from": old_value,
+            "to": new_value,
+            "reason": reason,
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """控制器状态，写入 SyncTask.metadata"""
+        return {
+            "fetch_limit": self.fetch_limit,
+            "flush_size": self.flush_size,
+            "bounds": {
+                "fetch_limit": [self.fetch_min, self.fetch_max],
+                "flush_size": [self.flush_min, self.flush_max],
+            },
+            "fetch_latency": round(self.fetch_latency, 3) if self.fetch_latency is not None else None,
+            "commit_latency": round(self.commit_latency, 3) if self.commit_latency is not None else None,
+            "decrypt_rate": round(self.decrypt_rate, 1) if self.decrypt_rate is not None else None,
+            "decisions": list(self.decisions),
+        }
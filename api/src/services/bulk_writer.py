@@ -0,0 +1,283 @@
+"""
+消息批量写入
+
+每批消息先用 PostgreSQL COPY 写入 UNLOGGED 暂存表，再通过
+INSERT ... SELECT ... ON CONFLICT (msgid) DO NOTHING 合并到 chat_messages，
+media_files 按同样方式只为新插入的消息落库。整批连同同步游标在一个事务内完成。
+
+回复关系和撤回标记不在插入时逐条处理，而是整批插入后各用一条集合 UPDATE 应用；
+目标消息尚未到达的引用写入 pending_message_refs，待目标消息入库的批次中再解析。
+reply_to_msgid 外键为 DEFERRABLE INITIALLY DEFERRED，在事务提交时才检查。
+群成员的发言数和最后发言时间按批聚合后在同一事务内更新（见 counters）。
+"""
+
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import structlog
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config import get_settings
+from ..database import get_driver_connection
+from ..models import ChatGroup, media_staging, message_staging
+from .counters import CounterDeltas
+
+logger = structlog.get_logger()
+
+# 暂存表随 schema 创建（见 models.message_staging / media_staging）
+MESSAGE_STAGING_TABLE = message_staging.name
+MEDIA_STAGING_TABLE = media_staging.name
+
+MESSAGE_COLUMNS = (
+    "batch_id", "seq", "msgid", "roomid", "msgtype", "msgtime", "from_user",
+    "to_users", "content", "media_data", "raw_data",
+)
+MEDIA_COLUMNS = (
+    "batch_id", "msgid", "file_type", "file_name", "original_filename",
+    "file_size", "file_extension", "md5", "metadata",
+)
+
+MERGE_MESSAGES_SQL = f"""
+    INSERT INTO chat_messages (
+        seq, msgid, roomid, msgtype, msgtime, from_user, to_users, content,
+        media_data, raw_data, is_revoked, forward_count, created_at, updated_at
+    )
+    SELECT DISTINCT ON (msgid)
+        seq, msgid, roomid, msgtype::messagetype, msgtime, from_user, to_users, content,
+        media_data::jsonb, raw_data::jsonb, FALSE, 0, now(), now()
+    FROM {MESSAGE_STAGING_TABLE}
+    WHERE batch_id = $1
+    ORDER BY msgid, seq
+    ON CONFLICT (msgid) DO NOTHING
+    RETURNING msgid
+"""
+
+MERGE_MEDIA_SQL = f"""
+    INSERT INTO media_files (
+        msgid, file_type, file_name, original_filename, file_size, file_extension,
+        md5, metadata, download_status, download_attempts, created_at, updated_at
+    )
+    SELECT
+        msgid, file_type, file_name, original_filename, file_size, file_extension,
+        md5, metadata::jsonb, 'PENDING'::downloadstatus, 0, now(), now()
+    FROM {MEDIA_STAGING_TABLE}
+    WHERE batch_id = $1 AND msgid = ANY($2::varchar[])
+"""
+
+ADVANCE_CURSOR_SQL = """
+    INSERT INTO sync_cursors (owner_corpid, last_seq, last_msgtime, message_count, created_at, updated_at)
+    VALUES ($1, $2, $3, $4, now(), now())
+    ON CONFLICT (owner_corpid) DO UPDATE SET
+        last_seq = GREATEST(sync_cursors.last_seq, EXCLUDED.last_seq),
+        last_msgtime = GREATEST(sync_cursors.last_msgtime, EXCLUDED.last_msgtime),
+        message_count = sync_cursors.message_count + EXCLUDED.message_count,
+        updated_at = now()
+"""
+
+
+# 应用本批回复关系；目标不存在的写入待解析表
+APPLY_REPLIES_SQL = """
+    WITH links AS (
+        SELECT * FROM unnest($1::varchar[], $2::varchar[]) AS v(msgid, target_msgid)
+    ),
+    updated AS (
+        UPDATE chat_messages m
+        SET reply_to_msgid = l.target_msgid, updated_at = now()
+        FROM links l
+        WHERE m.msgid = l.msgid
+          AND EXISTS (SELECT 1 FROM chat_messages t WHERE t.msgid = l.target_msgid)
+        RETURNING m.msgid
+    )
+    INSERT INTO pending_message_refs (target_msgid, ref_type, msgid, ref_time, created_at)
+    SELECT l.target_msgid, 'reply', l.msgid, NULL, now()
+    FROM links l
+    WHERE l.msgid NOT IN (SELECT msgid FROM updated)
+    ON CONFLICT DO NOTHING
+"""
+
+# 应用本批撤回操作；msgid 为撤回消息本身，ref_time 为撤回时间
+APPLY_REVOKES_SQL = """
+    WITH ops AS (
+        SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::timestamptz[])
+            AS v(target_msgid, msgid, revoke_time)
+    ),
+    updated AS (
+        UPDATE chat_messages m
+        SET is_revoked = TRUE, revoke_time = o.revoke_time, updated_at = now()
+        FROM ops o
+        WHERE m.msgid = o.target_msgid
+        RETURNING m.msgid
+    )
+    INSERT INTO pending_message_refs (target_msgid, ref_type, msgid, ref_time, created_at)
+    SELECT o.target_msgid, 'revoke', o.msgid, o.revoke_time, now()
+    FROM ops o
+    WHERE o.target_msgid NOT IN (SELECT msgid FROM updated)
+    ON CONFLICT DO NOTHING
+"""
+
+# 本批新到达的消息若是此前挂起引用的目标，解析并删除对应的待解析记录
+RESOLVE_PENDING_REPLIES_SQL = """
+    WITH resolved AS (
+        DELETE FROM pending_message_refs
+        WHERE ref_type = 'reply' AND target_msgid = ANY($1::varchar[])
+        RETURNING target_msgid, msgid
+    )
+    UPDATE chat_messages m
+    SET reply_to_msgid = r.target_msgid, updated_at = now()
+    FROM resolved r
+    WHERE m.msgid = r.msgid
+"""
+
+RESOLVE_PENDING_REVOKES_SQL = """
+    WITH resolved AS (
+        DELETE FROM pending_message_refs
+        WHERE ref_type = 'revoke' AND target_msgid = ANY($1::varchar[])
+        RETURNING target_msgid, ref_time
+    )
+    UPDATE chat_messages m
+    SET is_revoked = TRUE, revoke_time = r.ref_time, updated_at = now()
+    FROM resolved r
+    WHERE m.msgid = r.target_msgid
+"""
+
+
+def _dumps(value: Any) -> str:
+    """JSON 序列化为文本，供 COPY 写入"""
+    return orjson.dumps(value).decode()
+
+
+class BulkMessageWriter:
+    """基于 COPY + 暂存表合并的批量写入器"""
+
+    def __init__(self, session_maker: async_sessionmaker, corp_id: str = None):
+        self.session_maker = session_maker
+        self.corp_id = corp_id or get_settings().corp_id
+
+    async def write_batch(
+        self,
+        messages: List[Dict[str, Any]],
+        media_files: List[Dict[str, Any]],
+        cursor_seq: Optional[int] = None
+    ) -> Tuple[int, int]:
+        """写入一批消息，返回 (新增数, 重复数)
+
+        cursor_seq 不为空时，在同一事务内把企业同步游标推进到该 seq，
+        保证崩溃后从最后一个已提交批次精确续传。
+        """
+        if not messages and cursor_seq is None:
+            return 0, 0
+
+        inserted_msgids: List[str] = []
+
+        async with self.session_maker() as session:
+            async with session.begin():
+                if messages:
+                    await self._ensure_groups(session, messages)
+                conn = await get_driver_connection(session)
+
+                if messages:
+                    inserted_msgids = await self._merge_batch(conn, messages, media_files)
+                if inserted_msgids:
+                    await self._apply_references(conn, messages, inserted_msgids)
+                    await self._counter_deltas(messages, inserted_msgids).apply(conn)
+
+                if cursor_seq is not None:
+                    await conn.execute(
+                        ADVANCE_CURSOR_SQL,
+                        self.corp_id,
+                        cursor_seq,
+                        max((m["msgtime"] for m in messages), default=None),
+                        len(inserted_msgids)
+                    )
+
+        inserted = len(inserted_msgids)
+        return inserted, len(messages) - inserted
+
+    async def _merge_batch(
+        self,
+        conn,
+        messages: List[Dict[str, Any]],
+        media_files: List[Dict[str, Any]]
+    ) -> List[str]:
+        """COPY 到暂存表后合并，返回新插入的 msgid"""
+        batch_id = uuid.uuid4().hex
+
+        await conn.copy_records_to_table(
+            MESSAGE_STAGING_TABLE,
+            records=[
+                (
+                    batch_id, m["seq"], m["msgid"], m["roomid"], m["msgtype"].name,
+                    m["msgtime"], m["from_user"], m["to_users"], m["content"],
+                    _dumps(m["media_data"]), m["raw_data"],
+                )
+                for m in messages
+            ],
+            columns=MESSAGE_COLUMNS
+        )
+        rows = await conn.fetch(MERGE_MESSAGES_SQL, batch_id)
+        inserted_msgids = [row["msgid"] for row in rows]
+
+        if media_files and inserted_msgids:
+            await conn.copy_records_to_table(
+                MEDIA_STAGING_TABLE,
+                records=[
+                    (
+                        batch_id, f["msgid"], f["file_type"], f["file_name"],
+                        f["original_filename"], f["file_size"], f["file_extension"],
+                        f["md5"], _dumps(f["metadata"]),
+                    )
+                    for f in media_files
+                ],
+                columns=MEDIA_COLUMNS
+            )
+            await conn.execute(MERGE_MEDIA_SQL, batch_id, inserted_msgids)
+            await conn.execute(f"DELETE FROM {MEDIA_STAGING_TABLE} WHERE batch_id = $1", batch_id)
+
+        await conn.execute(f"DELETE FROM {MESSAGE_STAGING_TABLE} WHERE batch_id = $1", batch_id)
+        return inserted_msgids
+
+    @staticmethod
+    async def _apply_references(conn, messages: List[Dict[str, Any]], inserted_msgids: List[str]):
+        """整批解析回复关系和撤回标记，只处理本批新插入的消息"""
+        inserted = set(inserted_msgids)
+
+        await conn.execute(RESOLVE_PENDING_REPLIES_SQL, inserted_msgids)
+        await conn.execute(RESOLVE_PENDING_REVOKES_SQL, inserted_msgids)
+
+        replies = {
+            m["msgid"]: m["reply_to_msgid"]
+            for m in messages
+            if m.get("reply_to_msgid") and m["msgid"] in inserted
+        }
+        if replies:
+            await conn.execute(APPLY_REPLIES_SQL, list(replies), list(replies.values()))
+
+        revokes = [
+            (m["revoke_target"], m["msgid"], m["msgtime"])
+            for m in messages
+            if m.get("revoke_target") and m["msgid"] in inserted
+        ]
+        if revokes:
+            targets, msgids, times = zip(*revokes)
+            await conn.execute(APPLY_REVOKES_SQL, list(targets), list(msgids), list(times))
+
+    @staticmethod
+    def _counter_deltas(messages: List[Dict[str, Any]], inserted_msgids: List[str]) -> CounterDeltas:
+        """只为新插入的消息累计计数，重复消息不重复计数"""
+        inserted = set(inserted_msgids)
+        deltas = CounterDeltas()
+        for m in messages:
+            if m["msgid"] in inserted:
+                deltas.add_message(m["roomid"], m["from_user"], m["msgtime"])
+        return deltas
+
+    async def _ensure_groups(self, session: AsyncSession, messages: List[Dict[str, Any]]):
+        """为尚未入库的群创建占位记录，满足外键约束"""
+        roomids = {m["roomid"] for m in messages}
+        stmt = pg_insert(ChatGroup).values([
+            {"roomid": roomid, "room_name": roomid, "owner_corpid": self.corp_id}
+            for roomid in roomids
+        ]).on_conflict_do_nothing(index_elements=["roomid"])
+        await session.execute(stmt)
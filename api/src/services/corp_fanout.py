@@ -0,0 +1,159 @@
+"""
+多企业同步扇出
+
+定时同步时为每个存档企业创建一个独立的同步通道（子任务），通过 Celery chord
+并行分发到各 worker。每个通道有自己的游标、解密并发预算，失败互不影响；
+全部结束后把各企业的吞吐汇总写回父任务。
+
+父任务只由 chord 回调汇总，通道 worker 退出时回调永远不会触发；定时检查
+（check_running）把长时间没有进度的通道记为失败，所有通道结束后直接从子任务行汇总。
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import structlog
+from celery import chord
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import ChatGroup, SyncTask, TaskStatus
+from .backfill import BackfillService
+from .sync_service import SyncService
+from .task_progress import read_progress, set_progress_status
+
+logger = structlog.get_logger()
+
+FANOUT_TASK_TYPE = "sync_fanout"
+LANE_TASK_TYPE = "sync_messages"
+
+FINISHED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value)
+
+
+class CorpSyncFanout:
+    """多企业同步扇出"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.sync_service = SyncService(db)
+        self.stale_after = get_settings().sync_lane_stale_after
+
+    async def get_corp_ids(self) -> List[str]:
+        """需要同步的企业：已配置凭据的全部企业"""
+        accounts = get_settings().get_corp_accounts()
+
+        result = await self.db.execute(
+            select(ChatGroup.owner_corpid).where(ChatGroup.is_active.is_(True)).distinct()
+        )
+        missing = set(result.scalars().all()) - set(accounts)
+        if missing:
+            logger.warning("Corps without archive credentials are skipped", corp_ids=sorted(missing))
+
+        return list(accounts)
+
+    async def dispatch(self) -> SyncTask:
+        """为每个企业创建子任务并以 chord 并行分发"""
+        from ..tasks import summarize_corp_syncs, sync_messages
+
+        settings = get_settings()
+        corp_ids = await self.get_corp_ids()
+        decrypt_budget = self.split_decrypt_budget(settings.decrypt_workers or os.cpu_count() or 1, len(corp_ids))
+
+        parent = await self.sync_service.create_sync_task(
+            task_type=FANOUT_TASK_TYPE,
+            metadata={"corps": corp_ids},
+            dispatch=False
+        )
+
+        children = []
+        for corp_id in corp_ids:
+            children.append(await self.sync_service.create_sync_task(
+                corp_id=corp_id,
+                metadata={"parent_task_id": parent.task_id, "decrypt_budget": decrypt_budget},
+                dispatch=False
+            ))
+
+        parent.status = TaskStatus.RUNNING.value
+        parent.total_count = len(children)
+        await self.db.commit()
+
+        chord(sync_messages.s(child.task_id) for child in children)(
+            summarize_corp_syncs.s(parent.task_id)
+        )
+
+        logger.info("Corp sync lanes dispatched", task_id=parent.task_id, corps=len(corp_ids))
+        return parent
+
+    @staticmethod
+    def split_decrypt_budget(workers: int, corps: int) -> int:
+        """各通道平分解密进程，每个通道至少 1 个"""
+        return max(1, workers // max(corps, 1))
+
+    async def get_lanes(self, parent_task_id: str) -> List[SyncTask]:
+        """父任务下的全部同步通道"""
+        result = await self.db.execute(
+            select(SyncTask).where(
+                SyncTask.task_type == LANE_TASK_TYPE,
+                SyncTask.__table__.c.metadata["parent_task_id"].astext == parent_task_id
+            )
+        )
+        return list(result.scalars().all())
+
+    async def check_running(self) -> int:
+        """检查全部运行中的扇出任务：回收失联通道，通道全部结束时从子任务行汇总，返回检查的任务数"""
+        result = await self.db.execute(
+            select(SyncTask.task_id).where(
+                SyncTask.task_type == FANOUT_TASK_TYPE,
+                SyncTask.status == TaskStatus.RUNNING.value
+            )
+        )
+        task_ids = list(result.scalars().all())
+        for task_id in task_ids:
+            lanes = await self.get_lanes(task_id)
+            await self._fail_stale_lanes(lanes)
+            if all(lane.status in FINISHED_STATUSES for lane in lanes):
+                await self.summarize(task_id, [SyncService.lane_summary(lane) for lane in lanes])
+            else:
+                await self.db.commit()
+        return len(task_ids)
+
+    async def _fail_stale_lanes(self, lanes: List[SyncTask], now: Optional[datetime] = None):
+        """未结束的通道超过 stale_after 没有进度时记为失败；若 worker 仍在运行，
+        发布取消状态使其在下一批上报时退出"""
+        now = now or datetime.now(timezone.utc)
+        for lane in lanes:
+            if lane.status in FINISHED_STATUSES:
+                continue
+            progress = await read_progress(lane.task_id)
+            if not BackfillService.is_stale(lane, progress, now, self.stale_after):
+                continue
+
+            lane.status = TaskStatus.FAILED.value
+            lane.error_message = f"同步通道超过 {self.stale_after} 秒没有进度，worker 可能已退出"
+            await set_progress_status(lane.task_id, TaskStatus.CANCELLED.value)
+            logger.warning("Stale corp sync lane failed", task_id=lane.task_id,
+                           corp_id=(lane.metadata or {}).get("owner_corpid"))
+
+    async def summarize(self, parent_task_id: str, lanes: List[Dict[str, Any]]) -> SyncTask:
+        """汇总各企业同步通道结果；chord 回调和定时检查都可能调用，重复汇总结果相同"""
+        parent = await self.sync_service.get_task_by_id(parent_task_id)
+        if parent is None:
+            return None
+
+        corps = {lane["corp_id"]: lane for lane in lanes if lane}
+        succeeded = sum(1 for lane in corps.values() if lane["status"] == TaskStatus.COMPLETED.value)
+
+        parent.progress = len(corps)
+        parent.success_count = succeeded
+        parent.error_count = len(corps) - succeeded
+        parent.status = TaskStatus.COMPLETED.value
+        parent.metadata = {**(parent.metadata or {}), "corps": corps}
+        await self.db.commit()
+
+        for corp_id, lane in corps.items():
+            logger.info("Corp sync lane finished", corp_id=corp_id, **{
+                k: lane.get(k) for k in ("status", "inserted", "elapsed_seconds", "messages_per_second")
+            })
+        return parent
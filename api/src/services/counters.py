@@ -0,0 +1,183 @@
+"""
+冗余计数维护
+
+ChatGroup.member_count、ChatMember.message_count、ChatMember.last_seen 不在每条消息上
+单独更新（热点群会产生行锁争用），而是在写入批次内先在内存中按键聚合增量，
+每次刷写对每张表只执行一条分组 UPDATE。CounterReconciler 定期按群分块与源表比对，
+修正漂移。
+
+成员计数只更新已有的在群成员行，不做 upsert：chat_members 的唯一键含 join_time，
+发言人没有成员行时（外部联系人、名册尚未同步的成员）无法构造合法的新行。这些增量
+被丢弃并计入 wechat_counter_deltas_dropped_total；名册同步建立成员行后，
+CounterReconciler 从 chat_messages 重算该成员的发言数和最后发言时间。
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from ..config import get_settings
+from ..models import ChatGroup
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+COUNTER_DRIFT_CORRECTED = Counter(
+    'wechat_counter_drift_corrected_total',
+    'Denormalized counter rows corrected by the reconciler',
+    ['table']
+)
+
+COUNTER_DELTAS_DROPPED = Counter(
+    'wechat_counter_deltas_dropped_total',
+    'Member counter deltas dropped because the sender has no active chat_members row'
+)
+
+APPLY_MEMBER_COUNTERS_SQL = """
+    UPDATE chat_members m
+    SET message_count = COALESCE(m.message_count, 0) + d.delta,
+        last_seen = GREATEST(m.last_seen, d.last_seen),
+        updated_at = now()
+    FROM unnest($1::varchar[], $2::varchar[], $3::int[], $4::timestamptz[])
+        AS d(roomid, userid, delta, last_seen)
+    WHERE m.roomid = d.roomid AND m.userid = d.userid AND m.is_active
+    RETURNING m.roomid, m.userid
+"""
+
+APPLY_GROUP_COUNTERS_SQL = """
+    UPDATE chat_groups g
+    SET member_count = GREATEST(COALESCE(g.member_count, 0) + d.delta, 0),
+        updated_at = now()
+    FROM unnest($1::varchar[], $2::int[]) AS d(roomid, delta)
+    WHERE g.roomid = d.roomid
+"""
+
+RECONCILE_GROUPS_SQL = text("""
+    UPDATE chat_groups g
+    SET member_count = c.active_members, updated_at = now()
+    FROM (
+        SELECT g2.roomid, count(m.id) FILTER (WHERE m.is_active) AS active_members
+        FROM chat_groups g2
+        LEFT JOIN chat_members m ON m.roomid = g2.roomid
+        WHERE g2.roomid = ANY(:roomids)
+        GROUP BY g2.roomid
+    ) c
+    WHERE g.roomid = c.roomid AND g.member_count IS DISTINCT FROM c.active_members
+    RETURNING g.roomid
+""")
+
+RECONCILE_MEMBERS_SQL = text("""
+    UPDATE chat_members m
+    SET message_count = s.message_count, last_seen = s.last_seen, updated_at = now()
+    FROM (
+        SELECT mm.id, count(cm.id) AS message_count, max(cm.msgtime) AS last_seen
+        FROM chat_members mm
+        LEFT JOIN chat_messages cm ON cm.roomid = mm.roomid AND cm.from_user = mm.userid
+        WHERE mm.roomid = ANY(:roomids) AND mm.is_active
+        GROUP BY mm.id
+    ) s
+    WHERE m.id = s.id
+      AND (m.message_count IS DISTINCT FROM s.message_count OR m.last_seen IS DISTINCT FROM s.last_seen)
+    RETURNING m.id
+""")
+
+
+class CounterDeltas:
+    """一个写入批次内聚合的计数增量"""
+
+    def __init__(self):
+        # (roomid, userid) -> [消息数增量, 最后发言时间]
+        self.members: Dict[Tuple[str, str], List[Any]] = {}
+        # roomid -> 成员数增量
+        self.groups: Dict[str, int] = {}
+
+    def add_message(self, roomid: str, userid: Optional[str], msgtime: datetime):
+        """记录一条新入库的消息"""
+        if not userid:
+            return
+        entry = self.members.get((roomid, userid))
+        if entry is None:
+            self.members[(roomid, userid)] = [1, msgtime]
+        else:
+            entry[0] += 1
+            if msgtime > entry[1]:
+                entry[1] = msgtime
+
+    def add_group_members(self, roomid: str, delta: int):
+        """记录群成员数变化（入群为正，退群为负）"""
+        if delta:
+            self.groups[roomid] = self.groups.get(roomid, 0) + delta
+
+    def __bool__(self) -> bool:
+        return bool(self.members or self.groups)
+
+    async def apply(self, conn):
+        """在调用方事务内，每张表一条分组 UPDATE；按键排序以固定加锁顺序，避免并发批次死锁
+
+        返回因没有在群成员行而丢弃的 (roomid, userid) 数
+        """
+        dropped = 0
+        if self.members:
+            keys = sorted(self.members)
+            rows = await conn.fetch(
+                APPLY_MEMBER_COUNTERS_SQL,
+                [roomid for roomid, _ in keys],
+                [userid for _, userid in keys],
+                [self.members[key][0] for key in keys],
+                [self.members[key][1] for key in keys]
+            )
+            dropped = len(set(keys) - {(row["roomid"], row["userid"]) for row in rows})
+            if dropped:
+                COUNTER_DELTAS_DROPPED.inc(dropped)
+                logger.debug("Counter deltas without member rows dropped", count=dropped)
+
+        groups = sorted(roomid for roomid, delta in self.groups.items() if delta)
+        if groups:
+            await conn.execute(
+                APPLY_GROUP_COUNTERS_SQL, groups, [self.groups[roomid] for roomid in groups]
+            )
+        return dropped
+
+
+class CounterReconciler:
+    """按群分块重算冗余计数，只写回有偏差的行"""
+
+    def __init__(self, session_maker: async_sessionmaker, chunk_size: Optional[int] = None):
+        self.session_maker = session_maker
+        self.chunk_size = chunk_size or get_settings().counter_reconcile_chunk_size
+
+    async def reconcile(self) -> Dict[str, int]:
+        """遍历全部群，返回各表修正的行数"""
+        corrected = {"groups": 0, "members": 0}
+        last_roomid = ""
+        chunks = 0
+
+        while True:
+            # 每块一个短事务，避免长时间持有热点群的行锁
+            async with self.session_maker() as session, session.begin():
+                result = await session.execute(
+                    select(ChatGroup.roomid)
+                    .where(ChatGroup.roomid > last_roomid)
+                    .order_by(ChatGroup.roomid)
+                    .limit(self.chunk_size)
+                )
+                roomids = list(result.scalars().all())
+                if not roomids:
+                    break
+
+                groups = await session.execute(RECONCILE_GROUPS_SQL, {"roomids": roomids})
+                corrected["groups"] += len(groups.all())
+                members = await session.execute(RECONCILE_MEMBERS_SQL, {"roomids": roomids})
+                corrected["members"] += len(members.all())
+
+            last_roomid = roomids[-1]
+            chunks += 1
+
+        COUNTER_DRIFT_CORRECTED.labels(table="chat_groups").inc(corrected["groups"])
+        COUNTER_DRIFT_CORRECTED.labels(table="chat_members").inc(corrected["members"])
+        logger.info("Counters reconciled", chunks=chunks, **corrected)
+        return corrected
@@ -0,0 +1,138 @@
+"""
+解密进程池
+
+把 CPU 密集的消息解密放到独立进程池中执行。每个子进程持有一个常驻的
+ChatDataDecryptor，私钥在子进程内按 publickey_ver 只解析一次；每次提交
+一整批 chatdata，减少进程间通信开销。
+
+进程池使用 billiard（Celery 自带的 multiprocessing 分支）：Celery prefork 的
+子进程都是守护进程，标准库不允许它们再派生子进程，billiard 没有这个限制。
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import billiard
+import structlog
+from prometheus_client import Counter, Histogram
+
+from ..config import get_settings
+from .decryptor import ChatDataDecryptor
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+DECRYPT_BATCH_DURATION = Histogram(
+    'wechat_decrypt_batch_duration_seconds',
+    'Chat data batch decrypt latency in seconds',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+DECRYPT_MESSAGES = Counter(
+    'wechat_decrypt_messages_total',
+    'Decrypted chat messages',
+    ['result']
+)
+
+# 子进程内按 (私钥目录, EncodingAESKey)（即企业）缓存的解密器
+_worker_decryptors: Dict[Tuple[str, Optional[str]], ChatDataDecryptor] = {}
+
+
+def _decrypt_in_worker(
+    key_path: str,
+    encoding_aes_key: Optional[str],
+    entries: List[Dict[str, Any]]
+) -> List[Tuple[int, bytes]]:
+    """子进程中解密一整批"""
+    decryptor = _worker_decryptors.get((key_path, encoding_aes_key))
+    if decryptor is None:
+        decryptor = ChatDataDecryptor(key_path=key_path, encoding_aes_key=encoding_aes_key)
+        _worker_decryptors[(key_path, encoding_aes_key)] = decryptor
+    return decryptor.decrypt_batch(entries)
+
+
+class DecryptExecutor:
+    """基于进程池的批量解密执行器"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        settings = get_settings()
+        self.max_workers = max_workers or settings.decrypt_workers or os.cpu_count() or 1
+        self._pool = None
+        self._key_path = settings.msgaudit_private_key_path
+        self._encoding_aes_key = settings.encoding_aes_key
+
+    def _get_pool(self):
+        """延迟创建进程池，首次提交时才派生子进程"""
+        if self._pool is None:
+            self._pool = billiard.Pool(processes=self.max_workers)
+        return self._pool
+
+    def _submit(self, *args) -> asyncio.Future:
+        """把一次调用提交到进程池，结果通过回调线程交回事件循环"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(result):
+            if not future.done():
+                future.set_result(result)
+
+        def reject(error):
+            # billiard 把子进程中的异常包装为 ExceptionInfo
+            if not future.done():
+                future.set_exception(getattr(error, "exception", error))
+
+        self._get_pool().apply_async(
+            _decrypt_in_worker, args,
+            callback=lambda result: loop.call_soon_threadsafe(resolve, result),
+            error_callback=lambda error: loop.call_soon_threadsafe(reject, error)
+        )
+        return future
+
+    async def decrypt_batch(
+        self,
+        entries: List[Dict[str, Any]],
+        key_path: Optional[str] = None,
+        encoding_aes_key: Optional[str] = None
+    ) -> List[Tuple[int, bytes]]:
+        """提交一整批到进程池解密，key_path、encoding_aes_key 指定企业的私钥目录和
+        EncodingAESKey；都不指定时使用主企业的配置"""
+        if key_path is None:
+            key_path, encoding_aes_key = self._key_path, self._encoding_aes_key
+
+        started = time.perf_counter()
+        results = await self._submit(key_path, encoding_aes_key, entries)
+        DECRYPT_BATCH_DURATION.observe(time.perf_counter() - started)
+
+        DECRYPT_MESSAGES.labels(result="success").inc(len(results))
+        if len(results) < len(entries):
+            DECRYPT_MESSAGES.labels(result="failed").inc(len(entries) - len(results))
+        return results
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+# 进程级共享实例
+_decrypt_executor: Optional[DecryptExecutor] = None
+
+
+def get_decrypt_executor() -> DecryptExecutor:
+    """获取进程级共享的解密执行器"""
+    global _decrypt_executor
+    if _decrypt_executor is None:
+        _decrypt_executor = DecryptExecutor()
+    return _decrypt_executor
+
+
+def shutdown_decrypt_executor():
+    """关闭共享解密执行器"""
+    global _decrypt_executor
+    if _decrypt_executor is not None:
+        _decrypt_executor.shutdown()
+        _decrypt_executor = None
@@ -0,0 +1,128 @@
+"""
+会话存档消息解密
+
+使用会话存档私钥（按 publickey_ver 区分）解出随机密钥，再以 AES 解密消息体；
+未携带随机密钥的数据按回调格式使用 encoding_aes_key 解密。
+"""
+
+import base64
+import os
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from Crypto.Cipher import AES, PKCS1_v1_5
+from Crypto.PublicKey import RSA
+
+from ..config import get_settings
+
+logger = structlog.get_logger()
+
+
+class DecryptError(Exception):
+    """消息解密失败"""
+
+
+class DecryptKeyError(DecryptError):
+    """私钥缺失或无法解析，整批都无法解密"""
+
+
+def _pkcs7_unpad(data: bytes) -> bytes:
+    """去除 PKCS#7 填充"""
+    pad = data[-1] if data else 0
+    if pad < 1 or pad > 32:
+        raise DecryptError("Invalid PKCS#7 padding")
+    return data[:-pad]
+
+
+class ChatDataDecryptor:
+    """会话存档数据解密器"""
+
+    def __init__(
+        self,
+        key_path: Optional[str] = None,
+        encoding_aes_key: Optional[str] = None,
+        private_keys: Optional[Dict[int, str]] = None
+    ):
+        self.key_path = key_path or get_settings().msgaudit_private_key_path
+        # 各企业的 EncodingAESKey 不同，由调用方按企业传入；未配置时回调格式的数据无法解密
+        self._aes_key = base64.b64decode(encoding_aes_key + "=") if encoding_aes_key else None
+
+        # publickey_ver -> 已解析的 RSA cipher，私钥只解析一次
+        self._key_ring: Dict[int, Any] = {}
+        for version, pem in (private_keys or {}).items():
+            self.add_private_key(int(version), pem)
+
+    def add_private_key(self, version: int, pem: str):
+        """解析私钥并放入密钥环"""
+        try:
+            self._key_ring[version] = PKCS1_v1_5.new(RSA.import_key(pem))
+        except (ValueError, IndexError, TypeError) as e:
+            raise DecryptKeyError(f"Invalid private key for publickey_ver={version}: {e}") from e
+
+    def _cipher_for(self, version: int):
+        """按 publickey_ver 取 cipher，首次遇到的新版本从密钥目录加载"""
+        cipher = self._key_ring.get(version)
+        if cipher is not None:
+            return cipher
+
+        path = os.path.join(self.key_path, f"v{version}.pem")
+        if not os.path.isfile(path):
+            raise DecryptKeyError(f"No private key for publickey_ver={version}")
+
+        with open(path, "r", encoding="utf-8") as f:
+            self.add_private_key(version, f.read())
+        logger.info("Private key loaded", publickey_ver=version)
+        return self._key_ring[version]
+
+    def decrypt_entry(self, entry: Dict[str, Any]) -> bytes:
+        """解密单条 chatdata，返回消息 JSON 原始字节"""
+        encrypted = base64.b64decode(entry["encrypt_chat_msg"])
+
+        random_key = entry.get("encrypt_random_key")
+        if random_key:
+            plaintext = self._decrypt_with_random_key(
+                int(entry.get("publickey_ver", 0)), random_key, encrypted
+            )
+        else:
+            plaintext = self._decrypt_with_aes_key(encrypted)
+
+        return plaintext
+
+    def decrypt_batch(self, entries: List[Dict[str, Any]]) -> List[Tuple[int, bytes]]:
+        """解密一批 chatdata，返回 (seq, 明文 JSON 字节)；单条数据损坏只跳过该条，
+        私钥缺失等密钥错误直接抛出，整批失败
+
+        只返回原始字节而不在此处反序列化，跨进程传输的是紧凑的 bytes 而不是字典。
+        """
+        results = []
+        for entry in entries:
+            try:
+                plaintext = self.decrypt_entry(entry)
+            except DecryptKeyError:
+                raise
+            except Exception as e:
+                logger.warning("Failed to decrypt chat data", seq=entry.get("seq"), error=str(e))
+                continue
+            results.append((entry["seq"], plaintext))
+        return results
+
+    def _decrypt_with_random_key(self, version: int, random_key: str, encrypted: bytes) -> bytes:
+        """RSA 解出随机密钥后 AES-CBC 解密"""
+        key = self._cipher_for(version).decrypt(base64.b64decode(random_key), None)
+        if not key:
+            raise DecryptError("Failed to decrypt random key")
+
+        key = key[:32].ljust(32, b"\0")
+        aes = AES.new(key, AES.MODE_CBC, key[:16])
+        return _pkcs7_unpad(aes.decrypt(encrypted))
+
+    def _decrypt_with_aes_key(self, encrypted: bytes) -> bytes:
+        """回调格式: random(16) + msg_len(4) + msg + corpid"""
+        if self._aes_key is None:
+            raise DecryptKeyError("No encoding_aes_key configured")
+        aes = AES.new(self._aes_key, AES.MODE_CBC, self._aes_key[:16])
+        content = _pkcs7_unpad(aes.decrypt(encrypted))[16:]
+        (msg_len,) = struct.unpack(">I", content[:4])
+        return content[4:4 + msg_len]
+
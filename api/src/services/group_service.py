@@ -0,0 +1,117 @@
+"""
+群组服务
+
+负责群组、群成员的查询和群组统计。统计直接读取 chat_groups / chat_members 上
+维护的冗余计数，不在请求时聚合消息表。
+"""
+
+import math
+from typing import Any, Dict, Optional
+
+import structlog
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import ChatGroup, ChatMember
+
+logger = structlog.get_logger()
+
+
+def _page_meta(page: int, size: int, total: int) -> Dict[str, Any]:
+    """分页元信息"""
+    pages = math.ceil(total / size) if total else 0
+    return {
+        "page": page,
+        "size": size,
+        "total": total,
+        "pages": pages,
+        "has_next": page < pages,
+        "has_prev": page > 1,
+    }
+
+
+class GroupService:
+    """群组服务"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_groups(
+        self,
+        page: int = 1,
+        size: int = 20,
+        keyword: Optional[str] = None,
+        is_active: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """分页查询群组"""
+        query = select(ChatGroup)
+        if keyword:
+            pattern = f"%{keyword}%"
+            query = query.where(or_(ChatGroup.room_name.ilike(pattern), ChatGroup.roomid.ilike(pattern)))
+        if is_active is not None:
+            query = query.where(ChatGroup.is_active == is_active)
+
+        total = await self.db.scalar(select(func.count()).select_from(query.subquery()))
+        result = await self.db.execute(
+            query.order_by(ChatGroup.created_at.desc()).offset((page - 1) * size).limit(size)
+        )
+        return {"data": result.scalars().all(), "meta": _page_meta(page, size, total)}
+
+    async def get_group_by_id(self, roomid: str) -> Optional[ChatGroup]:
+        """按 roomid 查询群组"""
+        result = await self.db.execute(select(ChatGroup).where(ChatGroup.roomid == roomid))
+        return result.scalar_one_or_none()
+
+    async def get_group_members(
+        self,
+        roomid: str,
+        page: int = 1,
+        size: int = 50,
+        is_active: Optional[bool] = True
+    ) -> Dict[str, Any]:
+        """分页查询群成员，按发言数降序"""
+        query = select(ChatMember).where(ChatMember.roomid == roomid)
+        if is_active is not None:
+            query = query.where(ChatMember.is_active == is_active)
+
+        total = await self.db.scalar(select(func.count()).select_from(query.subquery()))
+        result = await self.db.execute(
+            query.order_by(ChatMember.message_count.desc().nullslast(), ChatMember.id)
+            .offset((page - 1) * size)
+            .limit(size)
+        )
+        return {"data": result.scalars().all(), "meta": _page_meta(page, size, total)}
+
+    async def get_group_stats(self, top: int = 10) -> Dict[str, Any]:
+        """群组统计，读取冗余计数"""
+        totals = (await self.db.execute(
+            select(
+                func.count(ChatGroup.roomid),
+                func.count(ChatGroup.roomid).filter(ChatGroup.is_active.is_(True)),
+                func.coalesce(func.sum(ChatGroup.member_count), 0),
+            )
+        )).one()
+
+        largest = await self.db.execute(
+            select(ChatGroup.roomid, ChatGroup.room_name, ChatGroup.member_count)
+            .where(ChatGroup.is_active.is_(True))
+            .order_by(ChatGroup.member_count.desc().nullslast())
+            .limit(top)
+        )
+        most_active = await self.db.execute(
+            select(ChatMember.roomid, ChatMember.userid, ChatMember.user_name,
+                   ChatMember.message_count, ChatMember.last_seen)
+            .where(ChatMember.is_active.is_(True))
+            .order_by(ChatMember.message_count.desc().nullslast())
+            .limit(top)
+        )
+
+        total_groups, active_groups, total_members = totals
+        return {
+            "total_groups": total_groups,
+            "active_groups": active_groups,
+            "total_members": total_members,
+            "avg_members": round(total_members / active_groups, 1) if active_groups else 0,
+            "largest_groups": [dict(row._mapping) for row in largest],
+            "most_active_members": [dict(row._mapping) for row in most_active],
+        }
@@ -0,0 +1,158 @@
+"""
+共享 HTTP 客户端
+
+进程内按上游地址共享一个 httpx.AsyncClient，保持长连接复用，可选 HTTP/2。
+各接口按 ENDPOINT_PROFILES 限制并发请求数，超时由 REQUEST_TIMEOUT 按接口换算；
+通过 httpcore trace 统计新建连接、TLS 握手与连接复用。
+FastAPI lifespan 和 Celery worker 退出钩子中调用 close_http_clients() 释放连接。
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import structlog
+from prometheus_client import Counter, Histogram
+
+from ..config import get_settings
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+UPSTREAM_REQUESTS = Counter(
+    'wechat_upstream_requests_total',
+    'Upstream HTTP requests',
+    ['endpoint', 'status']
+)
+
+UPSTREAM_LATENCY = Histogram(
+    'wechat_upstream_request_duration_seconds',
+    'Upstream HTTP request latency in seconds',
+    ['endpoint'],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+UPSTREAM_CONNECTIONS = Counter(
+    'wechat_upstream_connections_total',
+    'Upstream requests by connection reuse',
+    ['endpoint', 'connection']
+)
+
+UPSTREAM_TLS_HANDSHAKES = Counter(
+    'wechat_upstream_tls_handshakes_total',
+    'TLS handshakes performed for upstream connections',
+    ['endpoint']
+)
+
+# 各接口的并发上限与超时倍数（相对 REQUEST_TIMEOUT）
+ENDPOINT_PROFILES: Dict[str, Tuple[int, float]] = {
+    "/cgi-bin/gettoken": (4, 0.5),
+    "/cgi-bin/msgaudit/getchatdata": (8, 1.0),
+    "/cgi-bin/msgaudit/getmediadata": (16, 2.0),
+    "/cgi-bin/msgaudit/groupchat/get": (8, 0.5),
+}
+DEFAULT_PROFILE: Tuple[int, float] = (8, 1.0)
+
+# 建连超时上限（秒），连接阶段不需要与读超时一样长
+CONNECT_TIMEOUT = 5.0
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class SharedHTTPClient:
+    """单个上游地址的共享连接池"""
+
+    def __init__(self, base_url: str):
+        settings = get_settings()
+        self.base_url = base_url
+        self.request_timeout = settings.request_timeout
+
+        http2 = settings.http2_enabled
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but h2 is not installed, using HTTP/1.1")
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2,
+            timeout=self._timeout(1.0),
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _timeout(self, factor: float) -> httpx.Timeout:
+        timeout = self.request_timeout * factor
+        return httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout))
+
+    def _semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(endpoint)
+        if semaphore is None:
+            limit, _ = ENDPOINT_PROFILES.get(endpoint, DEFAULT_PROFILE)
+            semaphore = self._semaphores[endpoint] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def request(self, method: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        """在接口并发上限内发送请求并记录指标"""
+        _, factor = ENDPOINT_PROFILES.get(endpoint, DEFAULT_PROFILE)
+        kwargs.setdefault("timeout", self._timeout(factor))
+        connection = {"new": False}
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.complete":
+                connection["new"] = True
+            elif event_name == "connection.start_tls.complete":
+                UPSTREAM_TLS_HANDSHAKES.labels(endpoint=endpoint).inc()
+
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = trace
+
+        async with self._semaphore(endpoint):
+            started = time.perf_counter()
+            try:
+                response = await self._client.request(method, endpoint, extensions=extensions, **kwargs)
+            except httpx.HTTPError as e:
+                UPSTREAM_REQUESTS.labels(endpoint=endpoint, status=type(e).__name__).inc()
+                raise
+            finally:
+                UPSTREAM_LATENCY.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+
+        UPSTREAM_REQUESTS.labels(endpoint=endpoint, status=response.status_code).inc()
+        UPSTREAM_CONNECTIONS.labels(
+            endpoint=endpoint, connection="new" if connection["new"] else "reused"
+        ).inc()
+        return response
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# 进程内按上游地址共享的客户端
+_clients: Dict[str, SharedHTTPClient] = {}
+
+
+def get_http_client(base_url: Optional[str] = None) -> SharedHTTPClient:
+    """获取上游地址对应的共享客户端（首次调用时创建）"""
+    base_url = base_url or get_settings().api_base_url
+    client = _clients.get(base_url)
+    if client is None:
+        client = _clients[base_url] = SharedHTTPClient(base_url)
+    return client
+
+
+async def close_http_clients():
+    """关闭全部共享客户端"""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+    logger.info("Upstream HTTP clients closed")
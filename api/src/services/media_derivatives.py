@@ -0,0 +1,223 @@
+"""
+媒体缩略图与预览图
+
+图片类媒体在首次请求时用 Pillow 生成缩略图和预览图，在独立进程池中执行，
+同一衍生图的并发请求只生成一次。衍生图按 md5 和规格缓存在
+media_storage_path/derivatives/ab/<md5>_<规格>.jpg，内容相同的媒体共用一份；
+命中时刷新 mtime，缓存总大小超过上限后按 mtime 淘汰最久未用的文件。
+"""
+
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter, Histogram
+
+from ..config import get_settings
+from ..models import MediaFile
+from .media_store import MediaStore
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+DERIVATIVE_REQUESTS = Counter(
+    'wechat_media_derivative_requests_total',
+    'Media derivative requests by cache result',
+    ['variant', 'result']
+)
+
+DERIVATIVE_RENDER_DURATION = Histogram(
+    'wechat_media_derivative_render_seconds',
+    'Time spent rendering a media derivative',
+    ['variant'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+DERIVATIVE_EVICTIONS = Counter(
+    'wechat_media_derivative_evictions_total',
+    'Media derivatives evicted from the size-capped cache'
+)
+
+DERIVATIVE_DIR = "derivatives"
+
+# 可生成衍生图的媒体类型
+DERIVATIVE_FILE_TYPES = ("image", "emotion")
+
+JPEG_QUALITY = 82
+
+# 淘汰后保留的缓存比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+def _render(source_path: str, offset: int, length: Optional[int], target_path: str, max_size: int) -> int:
+    """子进程中生成衍生图，返回文件大小；length 不为 None 时原图是打包文件中的一段"""
+    from PIL import Image, ImageOps
+
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temp_path = f"{target_path}.{os.getpid()}.tmp"
+    if length is not None:
+        with open(source_path, "rb") as pack:
+            pack.seek(offset)
+            source_path = io.BytesIO(pack.read(length))
+    try:
+        with Image.open(source_path) as source:
+            # JPEG 解码时直接按 DCT 缩放，大图不必完整解码
+            source.draft("RGB", (max_size, max_size))
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            if image.mode not in ("RGB", "L"):
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            image.save(temp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(temp_path, target_path)
+    finally:
+        # 解码或编码失败时清理写了一半的临时文件，成功时它已被改名
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+    return os.path.getsize(target_path)
+
+
+def _evict(cache_path: str, max_bytes: int) -> Tuple[int, int]:
+    """扫描缓存目录，超过上限时按 mtime 删除最旧的文件；返回 (剩余字节数, 删除文件数)"""
+    entries: List[Tuple[float, int, str]] = []
+    total = 0
+    for root, _, files in os.walk(cache_path):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    evicted = 0
+    if total > max_bytes:
+        target = max_bytes * EVICT_TARGET_RATIO
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+    return total, evicted
+
+
+class MediaDerivativeService:
+    """按需生成并缓存媒体衍生图"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.cache_path = os.path.join(settings.media_storage_path, DERIVATIVE_DIR)
+        self.max_bytes = settings.media_derivative_cache_max_bytes
+        self.max_workers = settings.media_derivative_workers
+        self.variants: Dict[str, int] = {
+            "thumbnail": settings.media_thumbnail_size,
+            "preview": settings.media_preview_size,
+        }
+        self._executor: Optional[Executor] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._cache_bytes: Optional[int] = None
+        self._evicting = False
+
+    @staticmethod
+    def supports(media: MediaFile) -> bool:
+        return media.file_type in DERIVATIVE_FILE_TYPES and media.is_downloaded and bool(media.md5)
+
+    def variant_path(self, md5: str, variant: str) -> str:
+        md5 = md5.lower()
+        return os.path.join(self.cache_path, md5[:2], f"{md5}_{variant}.jpg")
+
+    def _get_executor(self) -> Executor:
+        """延迟创建进程池；守护进程中不能派生子进程，退化为线程池"""
+        if self._executor is None:
+            if multiprocessing.current_process().daemon:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def get(self, media: MediaFile, variant: str) -> str:
+        """返回衍生图路径，缓存未命中时生成"""
+        path = self.variant_path(media.md5, variant)
+        try:
+            os.utime(path)
+            DERIVATIVE_REQUESTS.labels(variant=variant, result="hit").inc()
+            return path
+        except FileNotFoundError:
+            pass
+
+        future = self._pending.get(path)
+        if future is None:
+            DERIVATIVE_REQUESTS.labels(variant=variant, result="miss").inc()
+            future = asyncio.ensure_future(self._generate(MediaStore.locate(media), path, variant))
+            self._pending[path] = future
+            future.add_done_callback(lambda _: self._pending.pop(path, None))
+        else:
+            DERIVATIVE_REQUESTS.labels(variant=variant, result="coalesced").inc()
+        # 单个请求断开不取消其他请求共享的生成任务
+        return await asyncio.shield(future)
+
+    async def _generate(self, source: Tuple[str, int, Optional[int]], path: str, variant: str) -> str:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        size = await loop.run_in_executor(
+            self._get_executor(), _render, *source, path, self.variants[variant]
+        )
+        DERIVATIVE_RENDER_DURATION.labels(variant=variant).observe(time.perf_counter() - started)
+
+        if self._cache_bytes is not None:
+            self._cache_bytes += size
+        if (self._cache_bytes is None or self._cache_bytes > self.max_bytes) and not self._evicting:
+            asyncio.ensure_future(self._evict())
+        return path
+
+    async def _evict(self):
+        """在线程池中扫描并淘汰，不阻塞请求"""
+        self._evicting = True
+        try:
+            loop = asyncio.get_running_loop()
+            self._cache_bytes, evicted = await loop.run_in_executor(None, _evict, self.cache_path, self.max_bytes)
+            if evicted:
+                DERIVATIVE_EVICTIONS.inc(evicted)
+                logger.info("Media derivatives evicted", count=evicted, cache_bytes=self._cache_bytes)
+        except OSError as e:
+            logger.warning("Media derivative eviction failed", error=str(e))
+        finally:
+            self._evicting = False
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 进程级共享实例
+_derivative_service: Optional[MediaDerivativeService] = None
+
+
+def get_derivative_service() -> MediaDerivativeService:
+    """获取进程级共享的衍生图服务"""
+    global _derivative_service
+    if _derivative_service is None:
+        _derivative_service = MediaDerivativeService()
+    return _derivative_service
+
+
+def shutdown_derivative_service():
+    """关闭衍生图进程池"""
+    global _derivative_service
+    if _derivative_service is not None:
+        _derivative_service.shutdown()
+        _derivative_service = None
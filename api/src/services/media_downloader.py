@@ -0,0 +1,340 @@
+"""
+媒体文件断点续传下载
+
+getmediadata 按 indexbuf 分片返回媒体内容。下载器把每个分片直接追加写入
+media_storage_path/.partial 下的临时文件，内存中只保留当前分片，边写边计算 md5。
+每写入 media_checkpoint_bytes 字节就 fsync 并把 (偏移, 下一个 indexbuf) 记到
+MediaFile.metadata["download"]；失败重试时截断临时文件到检查点偏移、重算前缀 md5
+后从该 indexbuf 继续，而不是从头下载。完成后校验 md5，原子改名到正式路径，
+并在一条 UPDATE 中写入状态、路径和 downloaded_at。
+
+内容按 md5 存入 MediaStore；行上已有 md5 且存储中已有同一内容时直接引用，
+不再向上游拉取。
+"""
+
+import base64
+import hashlib
+import mimetypes
+import os
+import time
+from typing import Any, Dict, Optional
+
+import aiofiles
+import orjson
+import structlog
+from prometheus_client import Counter
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from ..config import get_settings
+from ..models import DownloadStatus
+from .media_store import MEDIA_DEDUP_BYTES, MEDIA_DEDUP_HITS, MediaStore
+from .rate_limiter import PRIORITY_BACKGROUND
+from .wechat_client import WeChatArchiveClient
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+MEDIA_DOWNLOADS = Counter(
+    'wechat_media_downloads_total',
+    'Media download attempts by result',
+    ['file_type', 'result']
+)
+
+MEDIA_DOWNLOAD_BYTES = Counter(
+    'wechat_media_download_bytes_total',
+    'Media bytes fetched from upstream',
+    ['file_type']
+)
+
+MEDIA_DOWNLOAD_RESUMED_BYTES = Counter(
+    'wechat_media_download_resumed_bytes_total',
+    'Media bytes skipped by resuming from a checkpoint',
+    ['file_type']
+)
+
+PARTIAL_DIR = ".partial"
+
+# 读取已下载前缀重算 md5 的块大小
+REHASH_BLOCK_SIZE = 1024 * 1024
+
+# 领取下载：待下载、失败，或下载中但长时间没有心跳（worker 中途退出）的文件
+CLAIM_MEDIA_SQL = text("""
+    UPDATE media_files f
+    SET download_status = 'DOWNLOADING',
+        download_attempts = COALESCE(f.download_attempts, 0) + 1,
+        error_message = NULL,
+        scheduled_at = NULL,
+        updated_at = now()
+    FROM chat_messages m
+    JOIN chat_groups g ON g.roomid = m.roomid
+    WHERE f.id = :media_id AND m.msgid = f.msgid
+      AND (
+        f.download_status IN ('PENDING', 'FAILED')
+        OR (f.download_status = 'DOWNLOADING' AND f.updated_at < now() - make_interval(secs => :stale_after))
+      )
+    RETURNING f.id, f.file_type, f.file_size, f.file_extension, f.md5, f.metadata,
+              f.created_at, f.download_attempts, g.owner_corpid
+""")
+
+# 检查点同时作为心跳，刷新 updated_at
+CHECKPOINT_MEDIA_SQL = text("""
+    UPDATE media_files
+    SET metadata = jsonb_set(COALESCE(metadata, '{}'::jsonb), '{download}', CAST(:state AS jsonb)),
+        updated_at = now()
+    WHERE id = :media_id AND download_status = 'DOWNLOADING'
+""")
+
+COMPLETE_MEDIA_SQL = text("""
+    UPDATE media_files
+    SET download_status = 'COMPLETED',
+        downloaded_at = now(),
+        local_path = :local_path,
+        file_url = :file_url,
+        file_size = :file_size,
+        mime_type = COALESCE(mime_type, :mime_type),
+        md5 = COALESCE(md5, :md5),
+        metadata = CASE
+            WHEN CAST(:storage AS jsonb) IS NULL THEN COALESCE(metadata, '{}'::jsonb) - 'download' - 'storage'
+            ELSE jsonb_set(COALESCE(metadata, '{}'::jsonb) - 'download', '{storage}', CAST(:storage AS jsonb))
+        END,
+        error_message = NULL,
+        updated_at = now()
+    WHERE id = :media_id
+""")
+
+# state 为空时丢弃检查点，下次从头下载
+FAIL_MEDIA_SQL = text("""
+    UPDATE media_files
+    SET download_status = 'FAILED',
+        error_message = :error,
+        metadata = CASE
+            WHEN CAST(:state AS jsonb) IS NULL THEN COALESCE(metadata, '{}'::jsonb) - 'download'
+            ELSE jsonb_set(COALESCE(metadata, '{}'::jsonb), '{download}', CAST(:state AS jsonb))
+        END,
+        updated_at = now()
+    WHERE id = :media_id
+""")
+
+
+class MediaDownloadError(Exception):
+    """内容校验失败等需要从头重新下载的错误"""
+
+
+class MediaDownloader:
+    """单个媒体文件的断点续传下载"""
+
+    def __init__(self, session_maker: async_sessionmaker):
+        settings = get_settings()
+        self.session_maker = session_maker
+        self.enabled = settings.enable_media_download
+        self.storage_path = settings.media_storage_path
+        self.store = MediaStore()
+        self.max_file_size = settings.max_file_size
+        self.checkpoint_bytes = settings.media_checkpoint_bytes
+        self.stale_after = settings.media_download_stale_after
+        self.accounts = settings.get_corp_accounts()
+
+    async def download(self, media_id: int) -> Optional[str]:
+        """下载一个媒体文件，返回最终状态；文件未被领取（已完成或正在下载）时返回 None"""
+        if not self.enabled:
+            return None
+
+        media = await self._claim(media_id)
+        if media is None:
+            return None
+
+        file_type = media["file_type"]
+        partial_path = os.path.join(self.storage_path, PARTIAL_DIR, f"{media_id}.part")
+        progress = self._load_checkpoint(media, partial_path)
+        started = time.monotonic()
+
+        # 领取后的任何异常都要落到 _fail，否则行会停在 DOWNLOADING 直到超时才被重新领取
+        try:
+            if media["md5"]:
+                local_path = await self._link_existing(media)
+                if local_path:
+                    self._discard(partial_path)
+                    MEDIA_DOWNLOADS.labels(file_type=file_type, result="deduplicated").inc()
+                    logger.info("Media deduplicated", media_id=media_id, md5=media["md5"], local_path=local_path)
+                    return DownloadStatus.COMPLETED.value
+
+            secret = self.accounts.get(media["owner_corpid"])
+            if not secret:
+                raise MediaDownloadError(f"未配置企业 {media['owner_corpid']} 的会话存档 Secret")
+            if (media["file_size"] or 0) > self.max_file_size:
+                raise MediaDownloadError(f"文件大小 {media['file_size']} 超过上限 {self.max_file_size}")
+
+            async with WeChatArchiveClient(
+                corp_id=media["owner_corpid"], secret=secret, priority=PRIORITY_BACKGROUND
+            ) as client:
+                digest = await self._stream(client, media, partial_path, progress)
+
+            checksum = digest.hexdigest()
+            if media["md5"] and checksum != media["md5"].lower():
+                raise MediaDownloadError(f"md5 校验失败: 期望 {media['md5']}，实际 {checksum}")
+
+            local_path = await self._finalize(media, partial_path, progress["offset"], checksum)
+
+        except MediaDownloadError as e:
+            self._discard(partial_path)
+            await self._fail(media_id, str(e), None)
+            MEDIA_DOWNLOADS.labels(file_type=file_type, result="invalid").inc()
+            logger.warning("Media download rejected", media_id=media_id, error=str(e))
+            return DownloadStatus.FAILED.value
+
+        except Exception as e:
+            # 保留已写入的部分，下次从检查点继续
+            await self._fail(media_id, str(e), progress)
+            MEDIA_DOWNLOADS.labels(file_type=file_type, result="failed").inc()
+            logger.warning("Media download failed", media_id=media_id, attempts=media["download_attempts"],
+                           offset=progress["offset"], error=str(e))
+            return DownloadStatus.FAILED.value
+
+        MEDIA_DOWNLOADS.labels(file_type=file_type, result="completed").inc()
+        logger.info("Media downloaded", media_id=media_id, file_type=file_type, size=progress["offset"],
+                    resumed_from=progress["resumed_from"], elapsed=round(time.monotonic() - started, 3),
+                    local_path=local_path)
+        return DownloadStatus.COMPLETED.value
+
+    async def _claim(self, media_id: int) -> Optional[Dict[str, Any]]:
+        async with self.session_maker() as session, session.begin():
+            result = await session.execute(
+                CLAIM_MEDIA_SQL, {"media_id": media_id, "stale_after": float(self.stale_after)}
+            )
+            row = result.mappings().first()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _load_checkpoint(media: Dict[str, Any], partial_path: str) -> Dict[str, Any]:
+        """读取检查点；临时文件缺失或比检查点短时从头开始"""
+        state = (media["metadata"] or {}).get("download") or {}
+        offset = state.get("offset", 0)
+        if offset and (not os.path.exists(partial_path) or os.path.getsize(partial_path) < offset):
+            offset = 0
+        indexbuf = state.get("indexbuf", "") if offset else ""
+        return {"offset": offset, "indexbuf": indexbuf, "resumed_from": offset}
+
+    async def _stream(
+        self,
+        client: WeChatArchiveClient,
+        media: Dict[str, Any],
+        partial_path: str,
+        progress: Dict[str, Any]
+    ) -> Any:
+        """从检查点开始逐片拉取并写入临时文件，返回整个文件的 md5"""
+        file_type = media["file_type"]
+        sdkfileid = (media["metadata"] or {}).get("sdkfileid")
+        if not sdkfileid:
+            raise MediaDownloadError("缺少 sdkfileid")
+
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+        digest = hashlib.md5()
+        checkpointed = progress["offset"]
+
+        async with aiofiles.open(partial_path, "r+b" if checkpointed else "wb") as f:
+            if checkpointed:
+                # 丢弃检查点之后未确认的字节，重算已确认前缀的 md5
+                await f.truncate(checkpointed)
+                remaining = checkpointed
+                while remaining:
+                    block = await f.read(min(REHASH_BLOCK_SIZE, remaining))
+                    if not block:
+                        raise MediaDownloadError("临时文件读取不完整")
+                    digest.update(block)
+                    remaining -= len(block)
+                MEDIA_DOWNLOAD_RESUMED_BYTES.labels(file_type=file_type).inc(checkpointed)
+
+            while True:
+                page = await client.get_media_data(sdkfileid, progress["indexbuf"])
+                chunk = base64.b64decode(page.get("data") or "")
+                if progress["offset"] + len(chunk) > self.max_file_size:
+                    raise MediaDownloadError(f"文件超过大小上限 {self.max_file_size}")
+
+                await f.write(chunk)
+                digest.update(chunk)
+                MEDIA_DOWNLOAD_BYTES.labels(file_type=file_type).inc(len(chunk))
+                progress["offset"] += len(chunk)
+                progress["indexbuf"] = page.get("outindexbuf", "")
+
+                if page.get("is_finish"):
+                    break
+                if not chunk and not progress["indexbuf"]:
+                    raise MediaDownloadError("上游返回空分片且没有后续 indexbuf")
+
+                if progress["offset"] - checkpointed >= self.checkpoint_bytes:
+                    await self._sync(f)
+                    await self._checkpoint(media["id"], progress)
+                    checkpointed = progress["offset"]
+
+            await self._sync(f)
+        return digest
+
+    @staticmethod
+    async def _sync(f):
+        """确保检查点之前的数据已落盘"""
+        await f.flush()
+        os.fsync(f.fileno())
+
+    async def _checkpoint(self, media_id: int, progress: Dict[str, Any]):
+        async with self.session_maker() as session, session.begin():
+            await session.execute(CHECKPOINT_MEDIA_SQL, {
+                "media_id": media_id,
+                "state": orjson.dumps({"offset": progress["offset"], "indexbuf": progress["indexbuf"]}).decode(),
+            })
+
+    @staticmethod
+    def _mime_type(media: Dict[str, Any]) -> Optional[str]:
+        extension = media["file_extension"]
+        return mimetypes.guess_type(f"media.{extension}")[0] if extension else None
+
+    async def _link_existing(self, media: Dict[str, Any]) -> Optional[str]:
+        """存储中已有相同 md5 的内容时直接引用并标记完成，返回实体路径"""
+        md5 = media["md5"].lower()
+        async with self.session_maker() as session, session.begin():
+            blob = await self.store.acquire(session, md5)
+            if blob is None:
+                return None
+            await session.execute(COMPLETE_MEDIA_SQL, {
+                "media_id": media["id"],
+                "local_path": blob["local_path"],
+                "file_url": self.store.media_url(media["id"]),
+                "file_size": blob["file_size"],
+                "mime_type": self._mime_type(media),
+                "md5": md5,
+                # 内容已在冷存储中时沿用其打包位置
+                "storage": orjson.dumps(blob["storage"]).decode() if blob["storage"] else None,
+            })
+        MEDIA_DEDUP_HITS.labels(file_type=media["file_type"]).inc()
+        MEDIA_DEDUP_BYTES.labels(file_type=media["file_type"]).inc(blob["file_size"] or 0)
+        return blob["local_path"]
+
+    async def _finalize(self, media: Dict[str, Any], partial_path: str, size: int, checksum: str) -> str:
+        """临时文件放入内容寻址存储并标记完成（同一事务）"""
+        async with self.session_maker() as session, session.begin():
+            blob = await self.store.store(session, checksum, partial_path, size)
+            await session.execute(COMPLETE_MEDIA_SQL, {
+                "media_id": media["id"],
+                "local_path": blob["local_path"],
+                "file_url": self.store.media_url(media["id"]),
+                "file_size": size,
+                "mime_type": self._mime_type(media),
+                "md5": checksum,
+                # 内容已迁移到冷存储时沿用其打包位置
+                "storage": orjson.dumps(blob["storage"]).decode() if blob["storage"] else None,
+            })
+        return blob["local_path"]
+
+    async def _fail(self, media_id: int, error: str, progress: Optional[Dict[str, Any]]):
+        state = None
+        if progress and progress["offset"]:
+            state = orjson.dumps({"offset": progress["offset"], "indexbuf": progress["indexbuf"]}).decode()
+        async with self.session_maker() as session, session.begin():
+            await session.execute(FAIL_MEDIA_SQL, {"media_id": media_id, "error": error[:1000], "state": state})
+
+    @staticmethod
+    def _discard(partial_path: str):
+        try:
+            os.remove(partial_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,274 @@
+"""
+媒体完整性校验
+
+后台任务按 id 顺序遍历已下载（COMPLETED）的媒体，游标保存在 Redis，每轮在
+media_integrity_max_seconds 内推进（逐行检查时限，游标停在最后校验的一行），
+下一轮从断点继续，遍历完一遍后从头开始。
+文件用 mmap 映射后按块计算 md5（冷存储条目只映射打包文件中的那一段），读取速度
+受 media_integrity_bytes_per_second 限制，避免与下载、读取争抢磁盘。
+
+文件缺失、长度不足或 md5 不符时，同一份内容的所有 MediaFile 一起改回 PENDING，
+清除存储位置，由下载调度重新下载；损坏的热存储实体文件在同一事务内删除，
+否则重新下载时会按 md5 再次引用它。实体引用数由回收任务重新统计。
+"""
+
+import asyncio
+import hashlib
+import mmap
+import os
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+import orjson
+import structlog
+from prometheus_client import Counter, Gauge
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .. import database
+from ..config import get_settings
+from ..redis_client import get_redis
+from .media_store import TIER_COLD, MediaStore
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+MEDIA_INTEGRITY_CHECKED = Counter(
+    'wechat_media_integrity_checked_total',
+    'Media files checked by the integrity scanner',
+    ['result']
+)
+
+MEDIA_INTEGRITY_BYTES = Counter(
+    'wechat_media_integrity_bytes_total',
+    'Bytes hashed by the media integrity scanner'
+)
+
+MEDIA_INTEGRITY_REPAIRED = Counter(
+    'wechat_media_integrity_repaired_total',
+    'Media files reset to PENDING for re-download after failing verification',
+    ['reason']
+)
+
+MEDIA_INTEGRITY_PASSES = Counter(
+    'wechat_media_integrity_passes_total',
+    'Completed full passes of the media integrity scanner'
+)
+
+MEDIA_INTEGRITY_PROGRESS = Gauge(
+    'wechat_media_integrity_progress_ratio',
+    'Position of the media integrity scanner cursor within the current pass'
+)
+
+CURSOR_KEY = "media_integrity:cursor"
+INTEGRITY_LOCK_KEY = "media_integrity"
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+RESULT_OK = "ok"
+RESULT_MISSING = "missing"
+RESULT_CORRUPT = "corrupt"
+RESULT_UNVERIFIABLE = "unverifiable"
+
+MEDIA_BATCH_SQL = text("""
+    SELECT id, md5, local_path, metadata
+    FROM media_files
+    WHERE id > :after AND download_status = 'COMPLETED'
+    ORDER BY id
+    LIMIT :limit
+""")
+
+MAX_MEDIA_ID_SQL = text("SELECT COALESCE(max(id), 0) FROM media_files")
+
+LOCK_BLOB_SQL = text("SELECT md5 FROM media_blobs WHERE md5 = :md5 FOR UPDATE")
+
+# 共用同一份损坏内容的行一起重置
+RESET_MEDIA_SQL = text("""
+    UPDATE media_files
+    SET download_status = 'PENDING',
+        local_path = NULL,
+        file_url = NULL,
+        downloaded_at = NULL,
+        download_attempts = 0,
+        error_message = :error,
+        metadata = jsonb_set(
+            COALESCE(metadata, '{}'::jsonb) - 'storage' - 'download',
+            '{integrity}', CAST(:integrity AS jsonb)
+        ),
+        updated_at = now()
+    WHERE download_status = 'COMPLETED'
+      AND local_path = :local_path
+      AND (id = :media_id OR md5 = :md5)
+    RETURNING id
+""")
+
+
+class _Throttle:
+    """限制哈希读取速度，在执行哈希的线程中休眠"""
+
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self.started = time.monotonic()
+        self.consumed = 0
+
+    def consume(self, size: int):
+        self.consumed += size
+        if self.bytes_per_second <= 0:
+            return
+        ahead = self.consumed / self.bytes_per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _hash_region(path: str, offset: int, length: Optional[int], throttle: _Throttle) -> Optional[str]:
+    """mmap 计算文件中 [offset, offset + length) 的 md5；文件缺失或长度不足时返回 None"""
+    digest = hashlib.md5()
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            length = size - offset if length is None else length
+            if length < 0 or offset + length > size:
+                return None
+            if length == 0:
+                return digest.hexdigest()
+
+            # mmap 的偏移必须按分配粒度对齐
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            with mmap.mmap(f.fileno(), offset + length - start, access=mmap.ACCESS_READ, offset=start) as mapped:
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mapped) as view:
+                    position, end = offset - start, offset - start + length
+                    while position < end:
+                        chunk_end = min(position + HASH_CHUNK_SIZE, end)
+                        with view[position:chunk_end] as chunk:
+                            digest.update(chunk)
+                        throttle.consume(chunk_end - position)
+                        position = chunk_end
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class MediaIntegrityScanner:
+    """按 id 顺序校验已下载媒体，损坏的重置为待下载"""
+
+    def __init__(self, session_maker: async_sessionmaker):
+        settings = get_settings()
+        self.session_maker = session_maker
+        self.batch_size = settings.media_integrity_batch_size
+        self.bytes_per_second = settings.media_integrity_bytes_per_second
+        self.max_seconds = settings.media_integrity_max_seconds
+        self.store = MediaStore()
+
+    async def scan(self) -> Dict[str, Any]:
+        """从游标处继续校验，直到用完本轮时间或遍历完一遍"""
+        async with database.engine.connect() as conn:
+            acquired = await conn.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": INTEGRITY_LOCK_KEY}
+            )
+            if not acquired:
+                return {"skipped": "locked"}
+            try:
+                return await self._scan()
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": INTEGRITY_LOCK_KEY})
+
+    async def _scan(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        redis = get_redis()
+        throttle = _Throttle(self.bytes_per_second)
+        deadline = time.monotonic() + self.max_seconds
+        totals = {result: 0 for result in (RESULT_OK, RESULT_MISSING, RESULT_CORRUPT, RESULT_UNVERIFIABLE)}
+        totals["repaired"] = 0
+
+        after = int(await redis.get(CURSOR_KEY) or 0)
+        async with self.session_maker() as session:
+            max_id = await session.scalar(MAX_MEDIA_ID_SQL)
+
+        while time.monotonic() < deadline:
+            async with self.session_maker() as session:
+                rows = (await session.execute(
+                    MEDIA_BATCH_SQL, {"after": after, "limit": self.batch_size}
+                )).all()
+            if not rows:
+                # 一遍结束，下一轮从头开始
+                after = 0
+                MEDIA_INTEGRITY_PASSES.inc()
+                logger.info("Media integrity pass completed")
+                break
+
+            # 去重后的媒体共用文件，同一批内同一位置只校验一次
+            verdicts: Dict[Tuple[str, int], str] = {}
+            repaired_ids = set()
+            for row in rows:
+                # 逐行检查时限，大文件批次不会超出本轮时间太多
+                if time.monotonic() >= deadline:
+                    break
+                path, offset, length = self.store.locate(row)
+                if row.id not in repaired_ids and path:
+                    key = (path, offset)
+                    if key not in verdicts:
+                        verdicts[key] = await loop.run_in_executor(
+                            None, self._verify, path, offset, length, row.md5, throttle
+                        )
+                        if verdicts[key] in (RESULT_MISSING, RESULT_CORRUPT):
+                            repaired_ids.update(await self._repair(row, verdicts[key]))
+                    result = verdicts[key]
+                    totals[result] += 1
+                    MEDIA_INTEGRITY_CHECKED.labels(result=result).inc()
+                # 游标只推进到已校验的行，中途超时时下一轮从下一行继续
+                after = row.id
+
+            totals["repaired"] += len(repaired_ids)
+            await redis.set(CURSOR_KEY, after)
+            if max_id:
+                MEDIA_INTEGRITY_PROGRESS.set(min(after / max_id, 1.0))
+
+        await redis.set(CURSOR_KEY, after)
+        MEDIA_INTEGRITY_BYTES.inc(throttle.consumed)
+        if after == 0:
+            MEDIA_INTEGRITY_PROGRESS.set(0)
+
+        if totals["repaired"]:
+            from ..tasks import schedule_media_downloads
+            schedule_media_downloads.delay()
+
+        logger.info("Media integrity scan finished", cursor=after, bytes=throttle.consumed, **totals)
+        return {"cursor": after, "bytes": throttle.consumed, **totals}
+
+    @staticmethod
+    def _verify(path: str, offset: int, length: Optional[int], md5: Optional[str], throttle: _Throttle) -> str:
+        if not md5:
+            return RESULT_UNVERIFIABLE if os.path.exists(path) else RESULT_MISSING
+        checksum = _hash_region(path, offset, length, throttle)
+        if checksum is None:
+            return RESULT_MISSING
+        return RESULT_OK if checksum == md5.lower() else RESULT_CORRUPT
+
+    async def _repair(self, row: Any, reason: str) -> Set[int]:
+        """重置共用这份内容的所有行；损坏的热存储实体在持有实体行锁时删除"""
+        storage = (row.metadata or {}).get("storage") or {}
+        integrity = {"reason": reason, "checked_at": time.time(), "tier": storage.get("tier") or "hot"}
+        async with self.session_maker() as session, session.begin():
+            if row.md5:
+                await session.execute(LOCK_BLOB_SQL, {"md5": row.md5.lower()})
+            result = await session.execute(RESET_MEDIA_SQL, {
+                "media_id": row.id,
+                "md5": row.md5,
+                "local_path": row.local_path,
+                "error": f"完整性校验失败: {reason}",
+                "integrity": orjson.dumps(integrity).decode(),
+            })
+            ids = {r.id for r in result}
+            if ids and reason == RESULT_CORRUPT and storage.get("tier") != TIER_COLD:
+                try:
+                    os.remove(row.local_path)
+                except FileNotFoundError:
+                    pass
+
+        MEDIA_INTEGRITY_REPAIRED.labels(reason=reason).inc(len(ids))
+        logger.warning("Media failed integrity check", media_id=row.id, md5=row.md5,
+                       path=row.local_path, reason=reason, reset=len(ids))
+        return ids
+
@@ -0,0 +1,183 @@
+"""
+媒体下载调度
+
+download_media 任务只由调度器投递。每轮调度先统计在途的文件数和字节数
+（下载中且有心跳，或已投递尚未开始），再按 created_at 从部分索引取最新的一段
+待下载文件（窗口大小 media_schedule_window），在 Python 中打分排序后在两个上限内
+投递。优先级分数越小越先下载：文件类型权重 + ln(1 + MB) + ln(1 + 消息距今小时数)，
+因此刚发的图片和语音排在大视频和历史文件前面；窗口之外的历史文件在积压消化后
+进入窗口。
+失败的文件按 download_attempts 指数退避后重新参与调度，超过次数上限不再重试。
+调度由定时任务和每个下载结束时触发，advisory lock 保证同一时刻只有一轮调度。
+"""
+
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping
+
+import structlog
+from prometheus_client import Counter, Gauge
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from ..config import get_settings
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+MEDIA_SCHEDULED = Counter(
+    'wechat_media_scheduled_total',
+    'Media downloads dispatched by the scheduler',
+    ['file_type']
+)
+
+MEDIA_INFLIGHT = Gauge(
+    'wechat_media_inflight',
+    'Media downloads in flight as seen by the scheduler',
+    ['kind']
+)
+
+SCHEDULER_LOCK_KEY = "media_scheduler"
+
+# 已投递但尚未被 worker 领取的文件记 scheduled_at，领取时清空
+IN_FLIGHT_SQL = text("""
+    SELECT count(*) AS files, COALESCE(sum(file_size), 0) AS bytes
+    FROM media_files
+    WHERE (download_status = 'DOWNLOADING' AND updated_at > now() - make_interval(secs => CAST(:stale_after AS float8)))
+       OR (scheduled_at > now() - make_interval(secs => CAST(:stale_after AS float8))
+           AND download_status IN ('PENDING', 'FAILED'))
+""")
+
+# 先在 idx_media_files_schedulable 上按 created_at 倒序取窗口，再关联消息时间
+CANDIDATES_SQL = text("""
+    SELECT f.id, f.file_type, f.file_size, m.msgtime
+    FROM (
+        SELECT id, msgid, file_type, COALESCE(file_size, 0) AS file_size
+        FROM media_files
+        WHERE download_status IN ('PENDING', 'FAILED')
+          AND (
+            download_status = 'PENDING'
+            OR (
+                COALESCE(download_attempts, 0) < :max_attempts
+                AND updated_at < now() - make_interval(secs => LEAST(
+                    :backoff_max, :backoff_base * power(2, GREATEST(COALESCE(download_attempts, 1), 1) - 1)
+                ))
+            )
+          )
+          AND (scheduled_at IS NULL OR scheduled_at < now() - make_interval(secs => CAST(:stale_after AS float8)))
+        ORDER BY created_at DESC
+        LIMIT :window
+        FOR UPDATE SKIP LOCKED
+    ) f
+    JOIN chat_messages m ON m.msgid = f.msgid
+""")
+
+MARK_SCHEDULED_SQL = text("""
+    UPDATE media_files
+    SET scheduled_at = now()
+    WHERE id = ANY(CAST(:ids AS int[]))
+""")
+
+
+class MediaDownloadScheduler:
+    """在并发上限内按优先级投递媒体下载"""
+
+    def __init__(self, session_maker: async_sessionmaker):
+        settings = get_settings()
+        self.session_maker = session_maker
+        self.enabled = settings.enable_media_download
+        self.max_files = settings.media_max_inflight_files
+        self.max_bytes = settings.media_max_inflight_bytes
+        self.max_attempts = settings.media_max_attempts
+        self.backoff_base = settings.media_retry_backoff_base
+        self.backoff_max = settings.media_retry_backoff_max
+        self.stale_after = settings.media_download_stale_after
+        self.window = settings.media_schedule_window
+        self.type_weights = settings.get_media_type_weights()
+        self.default_weight = self.type_weights.get("default", 1.0)
+
+    async def schedule(self) -> Dict[str, Any]:
+        """执行一轮调度，返回本轮投递情况"""
+        from ..tasks import download_media
+
+        if not self.enabled:
+            return {"dispatched": 0}
+
+        async with self.session_maker() as session, session.begin():
+            locked = await session.scalar(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"), {"key": SCHEDULER_LOCK_KEY}
+            )
+            if not locked:
+                return {"dispatched": 0, "skipped": "locked"}
+
+            in_flight = (await session.execute(
+                IN_FLIGHT_SQL, {"stale_after": float(self.stale_after)}
+            )).mappings().one()
+            files_in_flight, bytes_in_flight = in_flight["files"], int(in_flight["bytes"])
+            MEDIA_INFLIGHT.labels(kind="files").set(files_in_flight)
+            MEDIA_INFLIGHT.labels(kind="bytes").set(bytes_in_flight)
+
+            free_files = self.max_files - files_in_flight
+            if free_files <= 0:
+                return {"dispatched": 0, "files_in_flight": files_in_flight, "bytes_in_flight": bytes_in_flight}
+
+            result = await session.execute(CANDIDATES_SQL, {
+                "max_attempts": self.max_attempts,
+                "backoff_base": float(self.backoff_base),
+                "backoff_max": float(self.backoff_max),
+                "stale_after": float(self.stale_after),
+                "window": self.window,
+            })
+            candidates = self._rank(result.mappings().all(), self.type_weights, self.default_weight,
+                                    datetime.now(timezone.utc))
+            chosen = self._select(candidates, free_files, self.max_bytes - bytes_in_flight,
+                                  idle=files_in_flight == 0)
+            if chosen:
+                await session.execute(MARK_SCHEDULED_SQL, {"ids": [row["id"] for row in chosen]})
+
+        # 事务提交后再投递，worker 领取时一定能看到 scheduled_at
+        for row in chosen:
+            download_media.delay(row["id"])
+            MEDIA_SCHEDULED.labels(file_type=row["file_type"]).inc()
+
+        dispatched_bytes = sum(row["file_size"] for row in chosen)
+        if chosen:
+            logger.info("Media downloads scheduled", count=len(chosen), bytes=dispatched_bytes,
+                        files_in_flight=files_in_flight, bytes_in_flight=bytes_in_flight)
+        return {
+            "dispatched": len(chosen),
+            "dispatched_bytes": dispatched_bytes,
+            "files_in_flight": files_in_flight + len(chosen),
+            "bytes_in_flight": bytes_in_flight + dispatched_bytes,
+        }
+
+    @staticmethod
+    def _rank(candidates: List[Mapping[str, Any]], weights: Dict[str, float], default_weight: float,
+              now: datetime) -> List[Mapping[str, Any]]:
+        """按优先级分数从小到大排序，分数相同按 id"""
+        def score(row):
+            msgtime = row["msgtime"]
+            if msgtime.tzinfo is None:
+                msgtime = msgtime.replace(tzinfo=timezone.utc)
+            age_hours = max((now - msgtime).total_seconds(), 0) / 3600
+            return (
+                weights.get(row["file_type"], default_weight)
+                + math.log1p(row["file_size"] / 1048576)
+                + math.log1p(age_hours),
+                row["id"],
+            )
+
+        return sorted(candidates, key=score)
+
+    @staticmethod
+    def _select(candidates: List[Any], free_files: int, free_bytes: int, idle: bool) -> List[Dict[str, Any]]:
+        """按优先级顺序在文件数和字节预算内挑选；超出字节预算的大文件只在空闲时单独下载"""
+        chosen = []
+        for row in candidates:
+            if len(chosen) >= free_files:
+                break
+            if row["file_size"] > free_bytes and not (idle and not chosen):
+                continue
+            chosen.append(dict(row))
+            free_bytes -= row["file_size"]
+        return chosen
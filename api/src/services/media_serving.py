@@ -0,0 +1,202 @@
+"""
+媒体文件下载响应
+
+按 MediaFile 返回存储中的文件，支持单段 Range（视频拖动、断点续传）、
+基于 md5 的 ETag 条件请求（If-None-Match / If-Range）和 HEAD。
+配置 media_x_accel_redirect_prefix 后只返回 X-Accel-Redirect 头，由 nginx 用
+sendfile 发送文件内容，Python worker 不经手数据。否则 ASGI 服务器提供
+http.response.zerocopy 扩展时交给服务器 sendfile，提供 http.response.pathsend
+时整文件按路径发送；都没有（如 uvicorn）时在线程中按块 pread 流式发送，
+内存占用与文件大小无关。
+"""
+
+import os
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from ..config import get_settings
+from ..models import MediaFile
+
+# 流式发送的块大小
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# 内容由 md5 决定，不会变化
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+class RangeNotSatisfiable(Exception):
+    """Range 超出文件范围"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 Range，返回闭区间 (start, end)
+
+    没有 Range、多段或无法识别时返回 None（返回整个文件）；范围不可满足时抛出 RangeNotSatisfiable。
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start_text:
+            # 后缀范围：最后 N 个字节
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - suffix), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def media_etag(media: MediaFile, size: int) -> str:
+    if media.md5:
+        return f'"{media.md5.lower()}"'
+    return f'W/"{media.id}-{size}"'
+
+
+def _etag_matches(header: Optional[str], etag: str, strong: bool = False) -> bool:
+    """If-None-Match 用弱比较；If-Range 用强比较，任一方是弱 ETag 都不匹配（RFC 9110 8.8.3.2）"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return not strong
+    candidates = [tag.strip() for tag in header.split(",")]
+    if strong:
+        return not etag.startswith("W/") and etag in candidates
+    weak_etag = etag[2:] if etag.startswith("W/") else etag
+    return any((tag[2:] if tag.startswith("W/") else tag) == weak_etag for tag in candidates)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match 命中当前 ETag（弱比较）时应返回 304"""
+    return _etag_matches(request.headers.get("if-none-match"), etag)
+
+
+def _content_disposition(media: MediaFile, attachment: bool) -> str:
+    filename = media.original_filename or media.file_name
+    if not filename:
+        filename = f"{media.id}.{media.file_extension}" if media.file_extension else str(media.id)
+    disposition = "attachment" if attachment else "inline"
+    return f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+
+class RangeFileResponse(Response):
+    """从文件的 [offset, offset + length) 流式发送内容"""
+
+    def __init__(
+        self,
+        path: str,
+        offset: int,
+        length: int,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        media_type: Optional[str] = None
+    ):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopy" in extensions:
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": f,
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False,
+                })
+            return
+        if (
+            "http.response.pathsend" in extensions
+            and self.offset == 0
+            and self.length == os.path.getsize(self.path)
+        ):
+            # pathsend 只能发送整个文件
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            position, remaining = self.offset, self.length
+            while remaining:
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, fd, min(STREAM_CHUNK_SIZE, remaining), position
+                )
+                if not chunk:
+                    raise RuntimeError(f"文件在发送过程中被截断: {self.path}")
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+        finally:
+            os.close(fd)
+
+
+def build_media_response(
+    request: Request,
+    media: MediaFile,
+    path: str,
+    offset: int = 0,
+    size: Optional[int] = None,
+    attachment: bool = False
+) -> Response:
+    """为已定位到磁盘文件（或文件中的一段）的媒体构造响应"""
+    settings = get_settings()
+    whole_file = size is None
+    size = os.path.getsize(path) - offset if whole_file else size
+    etag = media_etag(media, size)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": _content_disposition(media, attachment),
+    }
+    media_type = media.mime_type or "application/octet-stream"
+
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={k: headers[k] for k in ("ETag", "Cache-Control")})
+
+    accel_prefix = settings.media_x_accel_redirect_prefix
+    storage_path = os.path.abspath(settings.media_storage_path)
+    if accel_prefix and whole_file and offset == 0 and os.path.abspath(path).startswith(storage_path + os.sep):
+        # nginx 处理 Range 并用 sendfile 发送
+        relative_path = os.path.relpath(path, storage_path).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = f"{accel_prefix.rstrip('/')}/{quote(relative_path)}"
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or _etag_matches(if_range, etag, strong=True):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", "ETag": etag})
+
+    if byte_range is None:
+        return RangeFileResponse(path, offset, size, headers=headers, media_type=media_type)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return RangeFileResponse(path, offset + start, end - start + 1, status_code=206,
+                             headers=headers, media_type=media_type)
@@ -0,0 +1,254 @@
+"""
+内容寻址媒体存储
+
+媒体内容按 md5 存放在 media_storage_path/blobs/ab/cd/<md5>，两级目录按哈希前缀
+分散文件。同一文件被转发到多个群时只存一份，media_blobs.ref_count 记录引用它的
+已下载 MediaFile 数。下载前先按 md5 查找已有实体，命中则直接引用，不再向上游拉取。
+
+引用计数的增减都在修改 media_blobs 行的事务中完成：新实体先写行（持有行锁）再
+改名落盘，回收任务删除行后在同一事务内删除文件，二者通过行锁串行。
+MediaBlobReclaimer 先按块锁定实体行重新统计引用数（修正绕过下载器删除 MediaFile
+造成的漂移），再回收引用数为 0 且超过宽限期的实体。
+
+冷数据迁移（media_tiering）后实体位于打包文件中，位置记录在
+MediaFile.metadata["storage"]；读取方统一通过 locate() 取得 (文件, 偏移, 长度)。
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config import get_settings
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+MEDIA_DEDUP_HITS = Counter(
+    'wechat_media_dedup_hits_total',
+    'Media downloads skipped because the content was already stored',
+    ['file_type']
+)
+
+MEDIA_DEDUP_BYTES = Counter(
+    'wechat_media_dedup_bytes_total',
+    'Media bytes not fetched thanks to content deduplication',
+    ['file_type']
+)
+
+MEDIA_BLOBS_RECLAIMED = Counter(
+    'wechat_media_blobs_reclaimed_total',
+    'Unreferenced media blobs deleted by the reclaim job'
+)
+
+MEDIA_BLOB_REFS_CORRECTED = Counter(
+    'wechat_media_blob_refs_corrected_total',
+    'Media blob reference counts corrected by the reclaim job'
+)
+
+BLOB_DIR = "blobs"
+
+TIER_HOT = "hot"
+TIER_COLD = "cold"
+
+# 锁定已有实体行，与冷数据迁移、回收串行
+LOCK_BLOB_SQL = text("""
+    SELECT md5 FROM media_blobs WHERE md5 = :md5 FOR UPDATE
+""")
+
+# 引用已有实体
+ACQUIRE_BLOB_SQL = text("""
+    UPDATE media_blobs
+    SET ref_count = ref_count + 1, released_at = NULL, updated_at = now()
+    WHERE md5 = :md5
+    RETURNING file_size
+""")
+
+# 已迁移到冷存储的同一内容
+COLD_PLACEMENT_SQL = text("""
+    SELECT local_path, metadata->'storage' AS storage
+    FROM media_files
+    WHERE md5 = :md5 AND download_status = 'COMPLETED' AND metadata->'storage'->>'tier' = 'cold'
+    LIMIT 1
+""")
+
+# 新下载的实体：行不存在则创建，否则增加引用；返回是否新建
+STORE_BLOB_SQL = text("""
+    INSERT INTO media_blobs (md5, file_size, ref_count, created_at, updated_at)
+    VALUES (:md5, :file_size, 1, now(), now())
+    ON CONFLICT (md5) DO UPDATE SET
+        ref_count = media_blobs.ref_count + 1,
+        released_at = NULL,
+        updated_at = now()
+    RETURNING (xmax = 0) AS inserted
+""")
+
+LOCK_BLOBS_SQL = text("""
+    SELECT md5 FROM media_blobs
+    WHERE md5 > :after
+    ORDER BY md5
+    LIMIT :limit
+    FOR UPDATE
+""")
+
+RECOUNT_BLOBS_SQL = text("""
+    UPDATE media_blobs b
+    SET ref_count = c.refs,
+        released_at = CASE WHEN c.refs = 0 THEN COALESCE(b.released_at, now()) END,
+        updated_at = now()
+    FROM (
+        SELECT b2.md5, count(f.id) AS refs
+        FROM media_blobs b2
+        LEFT JOIN media_files f ON f.md5 = b2.md5 AND f.download_status = 'COMPLETED'
+        WHERE b2.md5 = ANY(CAST(:md5s AS varchar[]))
+        GROUP BY b2.md5
+    ) c
+    WHERE b.md5 = c.md5
+      AND (b.ref_count IS DISTINCT FROM c.refs OR (c.refs = 0 AND b.released_at IS NULL))
+    RETURNING b.md5
+""")
+
+DELETE_UNREFERENCED_SQL = text("""
+    DELETE FROM media_blobs
+    WHERE md5 IN (
+        SELECT md5 FROM media_blobs
+        WHERE ref_count = 0 AND released_at < now() - make_interval(secs => CAST(:grace AS float8))
+        ORDER BY released_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    AND ref_count = 0
+    RETURNING md5
+""")
+
+
+class MediaStore:
+    """按 md5 寻址的媒体实体存储"""
+
+    def __init__(self, storage_path: Optional[str] = None, url_prefix: Optional[str] = None):
+        settings = get_settings()
+        self.storage_path = storage_path or settings.media_storage_path
+        self.url_prefix = (url_prefix or settings.media_url_prefix).rstrip("/")
+
+    def blob_path(self, md5: str) -> str:
+        md5 = md5.lower()
+        return os.path.join(self.storage_path, BLOB_DIR, md5[:2], md5[2:4], md5)
+
+    def media_url(self, media_id: int) -> str:
+        """媒体下载路由地址"""
+        return f"{self.url_prefix}/{media_id}"
+
+    @staticmethod
+    def locate(media: Any) -> Tuple[str, int, Optional[int]]:
+        """媒体内容所在的 (文件路径, 偏移, 长度)；热存储文件的长度为 None 表示整个文件"""
+        storage = (media.metadata or {}).get("storage") or {}
+        if storage.get("tier") == TIER_COLD:
+            return storage["pack"], storage["offset"], storage["length"]
+        return media.local_path, 0, None
+
+    async def acquire(self, session: AsyncSession, md5: str) -> Optional[Dict[str, Any]]:
+        """引用已有实体，返回 {file_size, local_path, storage}；实体不存在时返回 None（不改变引用数）
+
+        必须在调用方事务内执行。先锁定实体行再判断内容位置：冷数据迁移在同一行锁下
+        记录打包位置、提交后才删除热存储文件，因此先查已提交的冷存储位置，没有时
+        热存储文件才可靠。
+        """
+        md5 = md5.lower()
+        if (await session.execute(LOCK_BLOB_SQL, {"md5": md5})).first() is None:
+            return None
+
+        cold = (await session.execute(COLD_PLACEMENT_SQL, {"md5": md5})).first()
+        if cold is not None:
+            local_path, storage = cold.local_path, cold.storage
+        elif os.path.exists(self.blob_path(md5)):
+            local_path, storage = self.blob_path(md5), None
+        else:
+            return None
+
+        row = (await session.execute(ACQUIRE_BLOB_SQL, {"md5": md5})).first()
+        return {"file_size": row.file_size, "local_path": local_path, "storage": storage}
+
+    async def store(self, session: AsyncSession, md5: str, source_path: str, file_size: int) -> Dict[str, Any]:
+        """把已校验的临时文件放入存储并增加引用，返回 {local_path, storage}
+
+        必须在调用方事务内执行：先写 media_blobs 行取得行锁，再改名落盘。
+        内容相同的实体已存在时丢弃临时文件。与 acquire 一样先查已提交的冷存储位置：
+        迁移提交后、删除热存储文件前，热存储文件仍在但即将被删除，不能引用它。
+        """
+        md5 = md5.lower()
+        path = self.blob_path(md5)
+        await session.execute(STORE_BLOB_SQL, {"md5": md5, "file_size": file_size})
+
+        cold = (await session.execute(COLD_PLACEMENT_SQL, {"md5": md5})).first()
+        if cold is not None:
+            os.remove(source_path)
+            return {"local_path": cold.local_path, "storage": cold.storage}
+
+        if os.path.exists(path):
+            os.remove(source_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(source_path, path)
+        return {"local_path": path, "storage": None}
+
+
+class MediaBlobReclaimer:
+    """校正实体引用数并回收无引用实体"""
+
+    def __init__(self, session_maker: async_sessionmaker, chunk_size: Optional[int] = None):
+        settings = get_settings()
+        self.session_maker = session_maker
+        self.chunk_size = chunk_size or settings.media_blob_reclaim_chunk_size
+        self.grace = settings.media_blob_reclaim_grace
+        self.store = MediaStore()
+
+    async def reclaim(self) -> Dict[str, Any]:
+        corrected = await self._recount()
+        reclaimed, freed = await self._delete_unreferenced()
+        logger.info("Media blobs reclaimed", refs_corrected=corrected, reclaimed=reclaimed, freed_bytes=freed)
+        return {"refs_corrected": corrected, "reclaimed": reclaimed, "freed_bytes": freed}
+
+    async def _recount(self) -> int:
+        """按 md5 键集分块：先锁定实体行，再统计引用，保证与并发下载的增减不交错"""
+        corrected = 0
+        after = ""
+        while True:
+            async with self.session_maker() as session, session.begin():
+                result = await session.execute(LOCK_BLOBS_SQL, {"after": after, "limit": self.chunk_size})
+                md5s: List[str] = [row.md5 for row in result]
+                if not md5s:
+                    break
+                result = await session.execute(RECOUNT_BLOBS_SQL, {"md5s": md5s})
+                corrected += len(result.all())
+            after = md5s[-1]
+
+        if corrected:
+            MEDIA_BLOB_REFS_CORRECTED.inc(corrected)
+        return corrected
+
+    async def _delete_unreferenced(self):
+        """删除行后在同一事务内删除文件，期间新的引用会等待行锁"""
+        reclaimed = freed = 0
+        while True:
+            async with self.session_maker() as session, session.begin():
+                result = await session.execute(
+                    DELETE_UNREFERENCED_SQL, {"grace": float(self.grace), "limit": self.chunk_size}
+                )
+                md5s = [row.md5 for row in result]
+                for md5 in md5s:
+                    path = self.store.blob_path(md5)
+                    try:
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            reclaimed += len(md5s)
+            if len(md5s) < self.chunk_size:
+                break
+
+        if reclaimed:
+            MEDIA_BLOBS_RECLAIMED.inc(reclaimed)
+        return reclaimed, freed
@@ -0,0 +1,286 @@
+"""
+媒体冷热分层
+
+热存储中每个实体是一个独立文件（blobs/ab/cd/<md5>）。下载时间超过
+media_cold_after_days，或超过 media_cold_idle_days 没有被访问的实体，由后台任务
+顺序追加到冷存储的打包段文件（packs/seg-000001.pack），每个段旁边有一个追加写的
+索引文件（seg-000001.idx，每行 "md5 偏移 长度"），段达到 media_pack_segment_size
+后换新段。写入时重新校验 md5，打包位置写入该 md5 所有 MediaFile 的
+metadata["storage"]，事务提交后再删除热存储文件。读取方通过 MediaStore.locate()
+透明地从任一层读取。
+
+打包条目不压缩：会话存档的图片、语音、视频本身已是压缩格式，原样存放才能按偏移
+直接做 Range 读取。段文件只追加不改写，回收后的空间留待整段重写时释放。
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import structlog
+from prometheus_client import Counter
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .. import database
+from ..config import get_settings
+from ..models import MediaFile
+from .media_store import TIER_COLD
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+MEDIA_TIER_MIGRATED = Counter(
+    'wechat_media_tier_migrated_total',
+    'Media blobs moved from hot storage into cold pack segments',
+    ['result']
+)
+
+MEDIA_TIER_MIGRATED_BYTES = Counter(
+    'wechat_media_tier_migrated_bytes_total',
+    'Bytes moved from hot storage into cold pack segments'
+)
+
+PACK_DIR = "packs"
+TIERING_LOCK_KEY = "media_tiering"
+
+# 访问时间最多每天记录一次，避免每次读取都写库
+ACCESS_TOUCH_INTERVAL = 86400
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# 按 md5 键集分批；同一内容的所有行都满足条件才迁移
+COLD_CANDIDATES_SQL = text("""
+    SELECT f.md5, array_agg(DISTINCT f.local_path) AS local_paths
+    FROM media_files f
+    WHERE f.download_status = 'COMPLETED'
+      AND f.md5 > :after
+      AND f.local_path IS NOT NULL
+      AND COALESCE(f.metadata->'storage'->>'tier', 'hot') <> 'cold'
+      AND COALESCE(f.file_size, 0) <= :max_entry_size
+    GROUP BY f.md5
+    HAVING max(f.downloaded_at) < now() - make_interval(days => CAST(:cold_after_days AS int))
+        OR max(GREATEST(
+            f.downloaded_at, to_timestamp(COALESCE((f.metadata->>'accessed_at')::float8, 0))
+        )) < now() - make_interval(days => CAST(:idle_days AS int))
+    ORDER BY f.md5
+    LIMIT :limit
+""")
+
+LOCK_BLOBS_SQL = text("""
+    SELECT md5 FROM media_blobs WHERE md5 = ANY(CAST(:md5s AS varchar[])) ORDER BY md5 FOR UPDATE
+""")
+
+SET_PLACEMENT_SQL = text("""
+    UPDATE media_files
+    SET metadata = jsonb_set(COALESCE(metadata, '{}'::jsonb), '{storage}', CAST(:storage AS jsonb)),
+        local_path = :pack,
+        updated_at = now()
+    WHERE md5 = :md5 AND download_status = 'COMPLETED'
+      AND COALESCE(metadata->'storage'->>'tier', 'hot') <> 'cold'
+""")
+
+TOUCH_ACCESS_SQL = text("""
+    UPDATE media_files
+    SET metadata = jsonb_set(COALESCE(metadata, '{}'::jsonb), '{accessed_at}', to_jsonb(extract(epoch FROM now())))
+    WHERE id = :media_id
+""")
+
+
+async def record_access(db: AsyncSession, media: MediaFile):
+    """记录媒体被读取的时间，供冷数据判定使用"""
+    accessed_at = (media.metadata or {}).get("accessed_at") or 0
+    if time.time() - accessed_at < ACCESS_TOUCH_INTERVAL:
+        return
+    await db.execute(TOUCH_ACCESS_SQL, {"media_id": media.id})
+    await db.commit()
+
+
+class PackWriter:
+    """向当前段文件追加条目，段满后换新段"""
+
+    def __init__(self, pack_path: str, segment_size: int):
+        self.pack_path = pack_path
+        self.segment_size = segment_size
+        os.makedirs(pack_path, exist_ok=True)
+        self._pack = None
+        self._index = None
+        self._segment = self._last_segment()
+
+    def _last_segment(self) -> int:
+        segments = [
+            int(name[4:10]) for name in os.listdir(self.pack_path)
+            if name.startswith("seg-") and name.endswith(".pack")
+        ]
+        return max(segments, default=1)
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.pack_path, f"seg-{segment:06d}.pack")
+
+    def _open(self):
+        if self._pack is not None and self._pack.tell() < self.segment_size:
+            return
+        if self._pack is not None:
+            self.close()
+            self._segment += 1
+        path = self.segment_path(self._segment)
+        self._pack = open(path, "ab")
+        self._index = open(path[:-len(".pack")] + ".idx", "a")
+        if self._pack.tell() >= self.segment_size:
+            self._open()
+
+    def append(self, md5: str, source_path: str) -> Optional[Dict[str, Any]]:
+        """复制一个实体并校验 md5，返回打包位置；内容不符时回退本次写入并返回 None"""
+        self._open()
+        offset = self._pack.tell()
+        digest = hashlib.md5()
+        try:
+            with open(source_path, "rb") as source:
+                while True:
+                    block = source.read(COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    self._pack.write(block)
+        except OSError:
+            self._rollback(offset)
+            raise
+
+        length = self._pack.tell() - offset
+        if digest.hexdigest() != md5:
+            self._rollback(offset)
+            return None
+
+        self._index.write(f"{md5} {offset} {length}\n")
+        return {
+            "tier": TIER_COLD,
+            "pack": self.segment_path(self._segment),
+            "offset": offset,
+            "length": length,
+            "packed_at": time.time(),
+        }
+
+    def _rollback(self, offset: int):
+        self._pack.truncate(offset)
+        self._pack.seek(offset)
+
+    def close(self):
+        """落盘后关闭，数据库只引用已 fsync 的条目"""
+        for f in (self._pack, self._index):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        self._pack = self._index = None
+
+
+class MediaTieringService:
+    """把冷数据从热存储迁移到打包段文件"""
+
+    def __init__(self, session_maker: async_sessionmaker):
+        settings = get_settings()
+        self.session_maker = session_maker
+        self.pack_path = settings.media_cold_storage_path or os.path.join(settings.media_storage_path, PACK_DIR)
+        self.segment_size = settings.media_pack_segment_size
+        self.max_entry_size = settings.media_pack_max_entry_size
+        self.cold_after_days = settings.media_cold_after_days
+        self.idle_days = settings.media_cold_idle_days
+        self.batch_size = settings.media_tiering_batch_size
+
+    async def migrate(self) -> Dict[str, Any]:
+        """执行一轮迁移；段文件只能有一个写入者，用 advisory lock 保证全局只有一个迁移在运行"""
+        async with database.engine.connect() as conn:
+            acquired = await conn.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": TIERING_LOCK_KEY}
+            )
+            if not acquired:
+                return {"skipped": "locked"}
+            try:
+                return await self._migrate_all()
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": TIERING_LOCK_KEY})
+
+    async def _migrate_all(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+
+        writer = PackWriter(self.pack_path, self.segment_size)
+        totals = {"migrated": 0, "bytes": 0, "skipped": 0}
+        after = ""
+        try:
+            while True:
+                async with self.session_maker() as session, session.begin():
+                    result = await session.execute(COLD_CANDIDATES_SQL, {
+                        "after": after,
+                        "max_entry_size": self.max_entry_size,
+                        "cold_after_days": self.cold_after_days,
+                        "idle_days": self.idle_days,
+                        "limit": self.batch_size,
+                    })
+                    candidates = [(row.md5, [p for p in row.local_paths if p]) for row in result]
+                    if not candidates:
+                        break
+                    after = candidates[-1][0]
+
+                    # 锁定实体行，与下载引用、回收串行
+                    await session.execute(LOCK_BLOBS_SQL, {"md5s": [md5 for md5, _ in candidates]})
+                    placements, skipped = await loop.run_in_executor(None, self._pack_batch, writer, candidates)
+                    for md5, placement in placements.items():
+                        await session.execute(SET_PLACEMENT_SQL, {
+                            "md5": md5,
+                            "pack": placement["pack"],
+                            "storage": orjson.dumps(placement).decode(),
+                        })
+
+                # 提交后再删除热存储文件
+                removed = await loop.run_in_executor(None, self._remove_hot, candidates, placements)
+                totals["migrated"] += len(placements)
+                totals["bytes"] += removed
+                totals["skipped"] += skipped
+                MEDIA_TIER_MIGRATED.labels(result="migrated").inc(len(placements))
+                MEDIA_TIER_MIGRATED.labels(result="skipped").inc(skipped)
+                MEDIA_TIER_MIGRATED_BYTES.inc(removed)
+        finally:
+            writer.close()
+
+        logger.info("Media tiering finished", **totals)
+        return totals
+
+    @staticmethod
+    def _pack_batch(
+        writer: PackWriter,
+        candidates: List[Tuple[str, List[str]]]
+    ) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """把一批实体写入段文件并落盘，返回 (md5 -> 位置, 跳过数)"""
+        placements = {}
+        skipped = 0
+        for md5, paths in candidates:
+            source = next((path for path in paths if os.path.exists(path)), None)
+            try:
+                placement = writer.append(md5, source) if source else None
+            except OSError:
+                placement = None
+            if placement is None:
+                # 文件缺失或内容损坏，留给完整性扫描处理
+                skipped += 1
+                logger.warning("Media blob not packed", md5=md5, source=source)
+                continue
+            placements[md5] = placement
+        writer.close()
+        return placements, skipped
+
+    @staticmethod
+    def _remove_hot(candidates: List[Tuple[str, List[str]]], placements: Dict[str, Dict[str, Any]]) -> int:
+        removed = 0
+        for md5, paths in candidates:
+            if md5 not in placements:
+                continue
+            for path in paths:
+                try:
+                    removed += os.path.getsize(path)
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return removed
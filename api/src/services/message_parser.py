@@ -0,0 +1,97 @@
+"""
+会话消息解析
+
+把解密后的消息 JSON 逐条转换为 chat_messages / media_files 的行数据。
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from ..models import MessageType
+
+# 企业微信 msgtype 到本地消息类型的映射
+MSGTYPE_MAPPING = {
+    "text": MessageType.TEXT,
+    "image": MessageType.IMAGE,
+    "voice": MessageType.VOICE,
+    "video": MessageType.VIDEO,
+    "file": MessageType.FILE,
+    "location": MessageType.LOCATION,
+    "link": MessageType.LINK,
+    "weapp": MessageType.MINIPROGRAM,
+    "card": MessageType.CARD,
+    "revoke": MessageType.REVOKE,
+    "emotion": MessageType.EMOTION,
+}
+
+# 携带媒体文件的消息类型
+MEDIA_MSGTYPES = {"image", "voice", "video", "file", "emotion"}
+
+
+def parse_msgtime(value: Any) -> datetime:
+    """毫秒时间戳转换为 UTC 时间"""
+    return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+
+
+def parse_chat_message(seq: int, raw: bytes) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """解析单条消息明文，返回 (消息行, 媒体文件行列表)；非群聊或切换企业日志返回 None
+
+    raw_data 直接保留解密得到的 JSON 文本，不再重新序列化；解析出的字典只在本函数内使用。
+    """
+    data = orjson.loads(raw)
+    roomid = data.get("roomid")
+    raw_type = data.get("msgtype")
+    if not roomid or not raw_type or data.get("action") == "switch":
+        return None
+
+    msgtype = MSGTYPE_MAPPING.get(raw_type, MessageType.SYSTEM)
+    if data.get("action") == "recall":
+        msgtype = MessageType.REVOKE
+
+    body = data.get(raw_type) or {}
+    content = body.get("content") if raw_type == "text" else None
+
+    message = {
+        "seq": seq,
+        "msgid": data["msgid"],
+        "roomid": roomid,
+        "msgtype": msgtype,
+        "msgtime": parse_msgtime(data["msgtime"]),
+        "from_user": data.get("from"),
+        "to_users": data.get("tolist") or [],
+        "content": content,
+        "media_data": body if raw_type != "text" else {},
+        "raw_data": raw.decode("utf-8"),
+        # 以下两项不是表字段，由写入器在整批插入后统一解析
+        "reply_to_msgid": (body.get("quote") or {}).get("msgid"),
+        "revoke_target": body.get("pre_msgid") if msgtype == MessageType.REVOKE else None,
+    }
+
+    media_files = []
+    if raw_type in MEDIA_MSGTYPES and body.get("sdkfileid"):
+        media_files.append(_parse_media_file(data["msgid"], raw_type, body))
+
+    return message, media_files
+
+
+def _parse_media_file(msgid: str, file_type: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """提取媒体文件行"""
+    extension = body.get("fileext")
+    if not extension:
+        extension = {"image": "jpg", "voice": "amr", "video": "mp4", "emotion": "gif"}.get(file_type)
+
+    return {
+        "msgid": msgid,
+        "file_type": file_type,
+        "file_name": body.get("filename"),
+        "original_filename": body.get("filename"),
+        "file_size": body.get("filesize") or body.get("voice_size") or body.get("imagesize"),
+        "file_extension": extension,
+        "md5": body.get("md5sum"),
+        "metadata": {
+            "sdkfileid": body["sdkfileid"],
+            "play_length": body.get("play_length"),
+        },
+    }
@@ -0,0 +1,218 @@
+"""
+已入库 msgid 的布隆过滤器
+
+每个企业一个布隆过滤器，位图保存在 Redis（SETBIT 增量写入，重启后可恢复），
+进程内保留一份副本用于查询，副本按间隔从 Redis 重新加载，以获得其他进程写入和
+重建任务生成的位。getchatdata 的 msgid 在加密体之外，因此可以在解密前
+判断：过滤器判定为已存在的 msgid 再用一次批量查询确认后丢弃，误判的条目照常处理，
+不会丢消息；未命中的条目一定是新消息，无需访问数据库。
+"""
+
+import hashlib
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter, Gauge
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from ..config import get_settings
+from ..models import ChatGroup, ChatMessage
+from ..redis_client import get_redis
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+MSGID_FILTER_CHECKS = Counter(
+    'wechat_msgid_filter_checks_total',
+    'Msgid filter lookups by outcome',
+    ['corp_id', 'result']
+)
+
+MSGID_FILTER_FALSE_POSITIVE_RATE = Gauge(
+    'wechat_msgid_filter_false_positive_rate',
+    'Estimated msgid filter false positive rate from fill ratio',
+    ['corp_id']
+)
+
+REDIS_KEY_PREFIX = "msgid_bloom"
+
+
+class BloomFilter:
+    """位图布隆过滤器，位序与 Redis SETBIT 一致（字节内高位在前）"""
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[bytes] = None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+
+        size = (self.num_bits + 7) // 8
+        self.bits = bytearray(size)
+        if bits:
+            self.bits[:min(len(bits), size)] = bits[:size]
+
+    def positions(self, key: str) -> List[int]:
+        """双重哈希得到 k 个位偏移"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add_positions(self, positions: Iterable[int]):
+        for pos in positions:
+            self.bits[pos >> 3] |= 0x80 >> (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (0x80 >> (pos & 7)) for pos in self.positions(key))
+
+    def estimated_false_positive_rate(self, count: int) -> float:
+        """按已插入数量估算当前误判率"""
+        return (1 - math.exp(-self.num_hashes * count / self.num_bits)) ** self.num_hashes
+
+
+class MsgidFilter:
+    """单个企业的已入库 msgid 过滤器"""
+
+    def __init__(self, corp_id: str, session_maker: async_sessionmaker):
+        settings = get_settings()
+        self.corp_id = corp_id
+        self.session_maker = session_maker
+        self.capacity = settings.msgid_filter_capacity
+        self.error_rate = settings.msgid_filter_error_rate
+        self.refresh_interval = settings.msgid_filter_refresh_interval
+        self.bits_key = f"{REDIS_KEY_PREFIX}:{corp_id}"
+        self.meta_key = f"{REDIS_KEY_PREFIX}:{corp_id}:meta"
+
+        self.bloom: Optional[BloomFilter] = None
+        self.count = 0
+        self.loaded_at = 0.0
+
+    async def load(self):
+        """从 Redis 恢复位图；参数变化时丢弃旧位图"""
+        redis = get_redis()
+        meta = await redis.hgetall(self.meta_key)
+        bits = None
+
+        if meta and int(meta.get(b"capacity", 0)) == self.capacity \
+                and float(meta.get(b"error_rate", 0)) == self.error_rate:
+            bits = await redis.get(self.bits_key)
+            self.count = int(meta.get(b"count", 0))
+        else:
+            await redis.delete(self.bits_key)
+            await redis.hset(self.meta_key, mapping={
+                "capacity": self.capacity, "error_rate": self.error_rate, "count": 0
+            })
+            self.count = 0
+
+        self.bloom = BloomFilter(self.capacity, self.error_rate, bits)
+        self.loaded_at = time.monotonic()
+        self._update_gauge()
+        logger.info("Msgid filter loaded", corp_id=self.corp_id, count=self.count)
+
+    async def refresh(self):
+        """副本超过刷新间隔时从 Redis 重新加载；本进程加入的位已写入 Redis，不会丢失"""
+        if time.monotonic() - self.loaded_at >= self.refresh_interval:
+            await self.load()
+
+    async def drop_known(self, entries: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """去掉确认已入库的条目，返回 (保留条目, 丢弃数)"""
+        if self.bloom is None or not entries:
+            return entries, 0
+
+        await self.refresh()
+        candidates = [entry["msgid"] for entry in entries if entry["msgid"] in self.bloom]
+        if not candidates:
+            MSGID_FILTER_CHECKS.labels(corp_id=self.corp_id, result="negative").inc(len(entries))
+            return entries, 0
+
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(ChatMessage.msgid).where(ChatMessage.msgid.in_(candidates))
+            )
+            known = set(result.scalars().all())
+
+        checks = MSGID_FILTER_CHECKS
+        checks.labels(corp_id=self.corp_id, result="negative").inc(len(entries) - len(candidates))
+        checks.labels(corp_id=self.corp_id, result="duplicate").inc(len(known))
+        checks.labels(corp_id=self.corp_id, result="false_positive").inc(len(candidates) - len(known))
+
+        kept = [entry for entry in entries if entry["msgid"] not in known]
+        return kept, len(entries) - len(kept)
+
+    async def add(self, msgids: Iterable[str]):
+        """把已提交的 msgid 加入过滤器，同时增量写入 Redis 位图"""
+        if self.bloom is None:
+            return
+
+        positions: List[int] = []
+        added = 0
+        for msgid in msgids:
+            if msgid in self.bloom:
+                continue
+            msgid_positions = self.bloom.positions(msgid)
+            self.bloom.add_positions(msgid_positions)
+            positions.extend(msgid_positions)
+            added += 1
+
+        if not added:
+            return
+
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for pos in positions:
+                pipe.setbit(self.bits_key, pos, 1)
+            pipe.hincrby(self.meta_key, "count", added)
+            results = await pipe.execute()
+
+        self.count = results[-1]
+        self._update_gauge()
+
+    async def rebuild_from_db(self, chunk_size: int = 50000) -> int:
+        """按主键分块扫描该企业的全部消息，重建过滤器"""
+        await get_redis().delete(self.bits_key, self.meta_key)
+        await self.load()
+
+        last_id = 0
+        total = 0
+        while True:
+            async with self.session_maker() as session:
+                result = await session.execute(
+                    select(ChatMessage.id, ChatMessage.msgid)
+                    .join(ChatGroup, ChatGroup.roomid == ChatMessage.roomid)
+                    .where(ChatGroup.owner_corpid == self.corp_id, ChatMessage.id > last_id)
+                    .order_by(ChatMessage.id)
+                    .limit(chunk_size)
+                )
+                rows = result.all()
+
+            if not rows:
+                break
+            await self.add(row.msgid for row in rows)
+            last_id = rows[-1].id
+            total += len(rows)
+
+        logger.info("Msgid filter rebuilt", corp_id=self.corp_id, messages=total)
+        return total
+
+    def _update_gauge(self):
+        MSGID_FILTER_FALSE_POSITIVE_RATE.labels(corp_id=self.corp_id).set(
+            self.bloom.estimated_false_positive_rate(self.count)
+        )
+
+
+# 进程内按企业缓存的过滤器
+_filters: Dict[str, MsgidFilter] = {}
+
+
+async def get_msgid_filter(corp_id: str, session_maker: async_sessionmaker) -> MsgidFilter:
+    """获取企业的过滤器，进程内首次使用时从 Redis 加载，之后按间隔刷新"""
+    msgid_filter = _filters.get(corp_id)
+    if msgid_filter is None:
+        msgid_filter = MsgidFilter(corp_id, session_maker)
+        await msgid_filter.load()
+        _filters[corp_id] = msgid_filter
+    else:
+        await msgid_filter.refresh()
+    return msgid_filter
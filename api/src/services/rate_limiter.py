@@ -0,0 +1,139 @@
+"""
+上游接口配额限流
+
+API、消息同步和媒体下载共用同一套企业微信接口配额。每个 (企业, 接口族) 一个
+Redis 令牌桶，所有进程出站调用前都先取令牌。按优先级设置桶内保留水位：
+交互请求（通过 API 手动发起的同步）可以用尽令牌，定时同步和回补保留一部分，
+后台下载和群成员同步只能使用水位以上的令牌，因此大批量媒体回补不会饿死消息同步。Redis 不可用时放行，不阻塞调用。
+"""
+
+import asyncio
+import random
+import time
+from typing import Optional
+
+import structlog
+from prometheus_client import Histogram
+from redis.exceptions import RedisError
+
+from ..config import get_settings
+from ..redis_client import get_redis
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+RATE_LIMIT_WAIT = Histogram(
+    'wechat_rate_limit_wait_seconds',
+    'Time spent waiting for upstream quota tokens',
+    ['family', 'priority'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+RATE_LIMIT_KEY_PREFIX = "ratelimit"
+
+# 接口 → 接口族
+ENDPOINT_FAMILIES = {
+    "/cgi-bin/gettoken": "token",
+    "/cgi-bin/msgaudit/getchatdata": "chatdata",
+    "/cgi-bin/msgaudit/getmediadata": "media",
+    "/cgi-bin/msgaudit/groupchat/get": "roster",
+}
+DEFAULT_FAMILY = "default"
+
+# 优先级 → 桶内保留水位（占容量的比例），低于水位时该优先级不能取令牌
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_SYNC = "sync"
+PRIORITY_BACKGROUND = "background"
+PRIORITY_RESERVES = {
+    PRIORITY_INTERACTIVE: 0.0,
+    PRIORITY_SYNC: 0.2,
+    PRIORITY_BACKGROUND: 0.5,
+}
+
+# 单次等待上限（秒），避免按估算时间长睡后错过高优先级让出的令牌
+MAX_SLEEP = 1.0
+
+# 令牌桶：KEYS[1]=桶；ARGV=速率(个/秒)、容量、本次消耗、保留水位、当前时间(秒)
+# 返回 0 表示取到令牌，否则返回建议等待的毫秒数
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local reserve = tonumber(ARGV[4])
+local now = tonumber(ARGV[5])
+
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens - cost >= reserve then
+    tokens = tokens - cost
+else
+    wait = math.ceil((reserve + cost - tokens) / rate * 1000)
+end
+
+redis.call('hset', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('expire', KEYS[1], math.ceil(capacity / rate) + 60)
+return wait
+"""
+
+
+class UpstreamRateLimiter:
+    """集群共享的令牌桶限流器"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.enable_rate_limit
+        self.rates = settings.get_rate_limits()
+        self.burst_seconds = settings.rate_limit_burst
+        self._script = None
+        self._warned = False
+
+    async def acquire(
+        self,
+        corp_id: str,
+        endpoint: str,
+        priority: str = PRIORITY_SYNC,
+        cost: float = 1.0
+    ):
+        """取令牌，配额不足时等待"""
+        family = ENDPOINT_FAMILIES.get(endpoint, DEFAULT_FAMILY)
+        rate = self.rates.get(family) or self.rates.get(DEFAULT_FAMILY)
+        if not self.enabled or not rate:
+            return
+
+        capacity = max(cost, rate * self.burst_seconds)
+        reserve = capacity * PRIORITY_RESERVES.get(priority, PRIORITY_RESERVES[PRIORITY_SYNC])
+        key = f"{RATE_LIMIT_KEY_PREFIX}:{corp_id}:{family}"
+
+        started = time.monotonic()
+        while True:
+            try:
+                if self._script is None:
+                    self._script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+                wait_ms = await self._script(keys=[key], args=[rate, capacity, cost, reserve, time.time()])
+            except RedisError as e:
+                if not self._warned:
+                    logger.warning("Rate limiter unavailable, allowing calls", error=str(e))
+                    self._warned = True
+                return
+
+            if not wait_ms:
+                break
+            # 加少量抖动，避免多个进程同时醒来争抢
+            await asyncio.sleep(min(MAX_SLEEP, wait_ms / 1000) * random.uniform(1.0, 1.2))
+
+        RATE_LIMIT_WAIT.labels(family=family, priority=priority).observe(time.monotonic() - started)
+
+
+_limiter: Optional[UpstreamRateLimiter] = None
+
+
+def get_rate_limiter() -> UpstreamRateLimiter:
+    """获取进程级限流器"""
+    global _limiter
+    if _limiter is None:
+        _limiter = UpstreamRateLimiter()
+    return _limiter
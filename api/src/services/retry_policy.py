@@ -0,0 +1,194 @@
+"""
+上游调用重试策略与熔断
+
+按错误类型决定是否重试：access_token 失效、可重试（系统繁忙、网络错误、5xx）、
+限流（频率超限、429）和不可重试（参数、权限等确定性错误）。重试使用带抖动的指数退避，
+限流使用更长的退避基数。每个接口一个熔断器，连续失败达到阈值后打开，
+冷却期内直接拒绝调用，冷却结束后放行一次探测请求，成功则恢复。
+"""
+
+import random
+import time
+from enum import Enum
+from typing import Dict, Optional
+
+import httpx
+import structlog
+from prometheus_client import Counter, Gauge
+
+from ..config import get_settings
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+UPSTREAM_RETRIES = Counter(
+    'wechat_upstream_retries_total',
+    'Upstream call retries by error class',
+    ['endpoint', 'error_class']
+)
+
+CIRCUIT_STATE = Gauge(
+    'wechat_circuit_breaker_state',
+    'Circuit breaker state per endpoint (0=closed, 1=half_open, 2=open)',
+    ['endpoint']
+)
+
+CIRCUIT_REJECTIONS = Counter(
+    'wechat_circuit_breaker_rejections_total',
+    'Upstream calls rejected by an open circuit breaker',
+    ['endpoint']
+)
+
+# access_token 无效或过期
+INVALID_TOKEN_ERRCODES = {40001, 40014, 42001}
+# 系统繁忙
+RETRYABLE_ERRCODES = {-1}
+# 接口调用频率或并发超限
+RATE_LIMITED_ERRCODES = {45009, 45011, 45033}
+
+
+class ErrorClass(str, Enum):
+    """上游错误分类"""
+    TOKEN = "token"
+    RETRYABLE = "retryable"
+    RATE_LIMITED = "rate_limited"
+    FATAL = "fatal"
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用被拒绝"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"[{endpoint}] circuit open, retry after {retry_after:.1f}s")
+
+
+def classify_error(error: Exception) -> ErrorClass:
+    """对上游调用异常分类；errcode 来自 WeChatAPIError"""
+    errcode = getattr(error, "errcode", None)
+    if errcode is not None:
+        if errcode in INVALID_TOKEN_ERRCODES:
+            return ErrorClass.TOKEN
+        if errcode in RATE_LIMITED_ERRCODES:
+            return ErrorClass.RATE_LIMITED
+        if errcode in RETRYABLE_ERRCODES:
+            return ErrorClass.RETRYABLE
+        return ErrorClass.FATAL
+
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status == 429:
+            return ErrorClass.RATE_LIMITED
+        if status >= 500:
+            return ErrorClass.RETRYABLE
+        return ErrorClass.FATAL
+
+    if isinstance(error, httpx.HTTPError):
+        # 超时、连接失败等传输层错误
+        return ErrorClass.RETRYABLE
+    return ErrorClass.FATAL
+
+
+class RetryPolicy:
+    """带抖动的指数退避"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.max_attempts = max(1, settings.max_retry_attempts)
+        self.base = settings.retry_backoff_base
+        self.rate_limit_base = settings.rate_limit_backoff_base
+        self.cap = settings.retry_backoff_max
+
+    def backoff(self, attempt: int, error_class: ErrorClass) -> float:
+        """第 attempt 次失败后的等待时间（full jitter）；token 失效立即重试"""
+        if error_class == ErrorClass.TOKEN:
+            return 0.0
+        base = self.rate_limit_base if error_class == ErrorClass.RATE_LIMITED else self.base
+        return random.uniform(0, min(self.cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """单个接口的熔断器（进程内）"""
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, endpoint: str, failure_threshold: int, reset_timeout: float):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._export()
+
+    def before_call(self):
+        """调用前检查；打开状态下冷却未结束则拒绝，结束后只放行一个探测请求"""
+        if self.state == self.CLOSED:
+            return
+
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == self.OPEN and elapsed >= self.reset_timeout:
+            self._transition(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+
+        CIRCUIT_REJECTIONS.labels(endpoint=self.endpoint).inc()
+        raise CircuitOpenError(self.endpoint, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != self.OPEN:
+                self._transition(self.OPEN)
+
+    def release(self):
+        """调用以不计入熔断的结果结束（如确定性错误），释放探测名额"""
+        self._probing = False
+
+    def _transition(self, state: str):
+        logger.warning("Circuit breaker state changed", endpoint=self.endpoint,
+                       old_state=self.state, new_state=state, failures=self.failures)
+        self.state = state
+        self._export()
+
+    def _export(self):
+        CIRCUIT_STATE.labels(endpoint=self.endpoint).set(self._STATE_VALUES[self.state])
+
+
+# 进程内按接口共享
+_breakers: Dict[str, CircuitBreaker] = {}
+_policy: Optional[RetryPolicy] = None
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """获取接口对应的熔断器"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        settings = get_settings()
+        breaker = _breakers[endpoint] = CircuitBreaker(
+            endpoint, settings.circuit_failure_threshold, settings.circuit_reset_timeout
+        )
+    return breaker
+
+
+def get_retry_policy() -> RetryPolicy:
+    """获取进程级重试策略"""
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy()
+    return _policy
@@ -0,0 +1,274 @@
+"""
+群成员增量同步
+
+逐群拉取成员列表，先与 chat_groups.metadata 中记录的名单哈希比较，未变化的群直接跳过；
+有变化的群在内存中按 (roomid, userid) 与在群成员比对，只产出入群、退群和角色变化，
+分块以批量语句写入（入群按 idx_members_unique 做 upsert）。
+"""
+
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from ..config import get_settings
+from ..database import get_driver_connection
+from ..models import ChatGroup, ChatMember, MemberType
+from .counters import CounterDeltas
+from .wechat_client import WeChatArchiveClient
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+ROSTER_CHANGES = Counter(
+    'wechat_roster_changes_total',
+    'Group roster changes applied by roster sync',
+    ['change']
+)
+
+ROSTER_GROUPS = Counter(
+    'wechat_roster_groups_total',
+    'Groups processed by roster sync',
+    ['result']
+)
+
+UPSERT_JOINS_SQL = """
+    INSERT INTO chat_members (
+        roomid, userid, join_time, member_type, inviter, is_active,
+        message_count, metadata, created_at, updated_at
+    )
+    SELECT d.roomid, d.userid, d.join_time, d.member_type::membertype, d.inviter, TRUE,
+        0, '{}'::jsonb, now(), now()
+    FROM unnest($1::varchar[], $2::varchar[], $3::timestamptz[], $4::text[], $5::varchar[])
+        AS d(roomid, userid, join_time, member_type, inviter)
+    ON CONFLICT (roomid, userid, join_time) DO UPDATE SET
+        is_active = TRUE,
+        quit_time = NULL,
+        member_type = EXCLUDED.member_type,
+        updated_at = now()
+"""
+
+APPLY_QUITS_SQL = """
+    UPDATE chat_members m
+    SET is_active = FALSE, quit_time = now(), updated_at = now()
+    FROM unnest($1::bigint[]) AS d(id)
+    WHERE m.id = d.id AND m.is_active
+"""
+
+APPLY_ROLE_CHANGES_SQL = """
+    UPDATE chat_members m
+    SET member_type = d.member_type::membertype, updated_at = now()
+    FROM unnest($1::bigint[], $2::text[]) AS d(id, member_type)
+    WHERE m.id = d.id
+"""
+
+UPDATE_GROUPS_SQL = """
+    UPDATE chat_groups g
+    SET room_name = COALESCE(NULLIF(d.room_name, ''), g.room_name),
+        notice = d.notice,
+        metadata = COALESCE(g.metadata, '{}'::jsonb) || jsonb_build_object('roster_hash', d.roster_hash),
+        last_sync_time = now(),
+        updated_at = now()
+    FROM unnest($1::varchar[], $2::varchar[], $3::text[], $4::text[])
+        AS d(roomid, room_name, notice, roster_hash)
+    WHERE g.roomid = d.roomid
+"""
+
+# 群内的一名成员：(角色, 入群时间, 邀请人)
+RosterEntry = Tuple[MemberType, datetime, Optional[str]]
+
+
+def parse_roster(data: Dict[str, Any]) -> Dict[str, RosterEntry]:
+    """把 groupchat/get 的响应解析为 userid -> 成员信息；群创建者记为群主"""
+    creator = data.get("creator")
+    admins = set(data.get("admin_list") or [])
+    roster: Dict[str, RosterEntry] = {}
+
+    for member in data.get("members") or []:
+        userid = member.get("memberid")
+        if not userid:
+            continue
+        if userid == creator:
+            member_type = MemberType.OWNER
+        elif userid in admins:
+            member_type = MemberType.ADMIN
+        else:
+            member_type = MemberType.MEMBER
+        join_time = datetime.fromtimestamp(int(member.get("jointime") or 0), tz=timezone.utc)
+        roster[userid] = (member_type, join_time, member.get("invitor"))
+
+    return roster
+
+
+def roster_hash(data: Dict[str, Any], roster: Dict[str, RosterEntry]) -> str:
+    """名单及群资料的内容哈希，用于跳过未变化的群"""
+    digest = hashlib.sha1()
+    digest.update(f"{data.get('roomname', '')}\x1f{data.get('notice', '')}\x1e".encode())
+    for userid in sorted(roster):
+        member_type, join_time, _ = roster[userid]
+        digest.update(f"{userid}\x1f{member_type.name}\x1f{int(join_time.timestamp())}\x1e".encode())
+    return digest.hexdigest()
+
+
+class RosterDiff:
+    """一个分块内全部群的成员变化"""
+
+    def __init__(self):
+        self.joins: List[Tuple[str, str, datetime, str, Optional[str]]] = []
+        self.quits: List[int] = []
+        self.role_changes: List[Tuple[int, str]] = []
+        self.groups: List[Tuple[str, str, str, str]] = []
+        self.counters = CounterDeltas()
+
+    def add_group(
+        self,
+        roomid: str,
+        data: Dict[str, Any],
+        roster: Dict[str, RosterEntry],
+        active: Dict[str, Tuple[int, MemberType, datetime]],
+        content_hash: str
+    ):
+        """按 userid 比对新名单与在群成员"""
+        delta = 0
+        for userid, (member_type, join_time, inviter) in roster.items():
+            current = active.get(userid)
+            if current is not None and current[2] == join_time:
+                if current[1] != member_type:
+                    self.role_changes.append((current[0], member_type.name))
+                continue
+            if current is not None:
+                # 退群后重新入群：旧记录标记退出，按新的入群时间插入新记录
+                self.quits.append(current[0])
+                delta -= 1
+            self.joins.append((roomid, userid, join_time, member_type.name, inviter))
+            delta += 1
+
+        for userid, (member_id, _, _) in active.items():
+            if userid not in roster:
+                self.quits.append(member_id)
+                delta -= 1
+
+        self.counters.add_group_members(roomid, delta)
+        self.groups.append((roomid, data.get("roomname") or "", data.get("notice") or "", content_hash))
+
+    async def apply(self, conn):
+        """在调用方事务内，每类变化一条批量语句"""
+        if self.quits:
+            await conn.execute(APPLY_QUITS_SQL, sorted(self.quits))
+        if self.joins:
+            await conn.execute(UPSERT_JOINS_SQL, *[list(column) for column in zip(*self.joins)])
+        if self.role_changes:
+            await conn.execute(APPLY_ROLE_CHANGES_SQL, *[list(column) for column in zip(*self.role_changes)])
+        if self.groups:
+            await conn.execute(UPDATE_GROUPS_SQL, *[list(column) for column in zip(*self.groups)])
+        await self.counters.apply(conn)
+
+        ROSTER_CHANGES.labels(change="join").inc(len(self.joins))
+        ROSTER_CHANGES.labels(change="quit").inc(len(self.quits))
+        ROSTER_CHANGES.labels(change="role").inc(len(self.role_changes))
+
+
+class RosterSyncService:
+    """单个企业的群成员增量同步"""
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        client: WeChatArchiveClient,
+        corp_id: str,
+        chunk_size: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        settings = get_settings()
+        self.session_maker = session_maker
+        self.client = client
+        self.corp_id = corp_id
+        self.chunk_size = chunk_size or settings.roster_sync_chunk_size
+        self._semaphore = asyncio.Semaphore(concurrency or settings.roster_sync_concurrency)
+
+    async def sync_all(self) -> Dict[str, int]:
+        """按 roomid 分块遍历企业的在用群"""
+        summary = {"groups": 0, "unchanged": 0, "changed": 0, "failed": 0,
+                   "joins": 0, "quits": 0, "role_changes": 0}
+        last_roomid = ""
+
+        while True:
+            async with self.session_maker() as session:
+                result = await session.execute(
+                    select(ChatGroup.roomid, ChatGroup.__table__.c.metadata["roster_hash"].astext)
+                    .where(
+                        ChatGroup.owner_corpid == self.corp_id,
+                        ChatGroup.is_active.is_(True),
+                        ChatGroup.roomid > last_roomid
+                    )
+                    .order_by(ChatGroup.roomid)
+                    .limit(self.chunk_size)
+                )
+                groups = result.all()
+
+            if not groups:
+                break
+            await self._sync_chunk({row[0]: row[1] for row in groups}, summary)
+            last_roomid = groups[-1][0]
+
+        logger.info("Roster sync finished", corp_id=self.corp_id, **summary)
+        return summary
+
+    async def _sync_chunk(self, known_hashes: Dict[str, Optional[str]], summary: Dict[str, int]):
+        """并发拉取一块群的名单，跳过未变化的群，其余一次事务写入"""
+        fetched = await asyncio.gather(*(self._fetch(roomid) for roomid in known_hashes))
+
+        changed: Dict[str, Tuple[Dict[str, Any], Dict[str, RosterEntry], str]] = {}
+        for roomid, data in zip(known_hashes, fetched):
+            summary["groups"] += 1
+            if data is None:
+                summary["failed"] += 1
+                ROSTER_GROUPS.labels(result="failed").inc()
+                continue
+            roster = parse_roster(data)
+            content_hash = roster_hash(data, roster)
+            if content_hash == known_hashes[roomid]:
+                summary["unchanged"] += 1
+                ROSTER_GROUPS.labels(result="unchanged").inc()
+                continue
+            changed[roomid] = (data, roster, content_hash)
+
+        if not changed:
+            return
+
+        async with self.session_maker() as session:
+            async with session.begin():
+                result = await session.execute(
+                    select(ChatMember.id, ChatMember.roomid, ChatMember.userid,
+                           ChatMember.member_type, ChatMember.join_time)
+                    .where(ChatMember.roomid.in_(list(changed)), ChatMember.is_active.is_(True))
+                )
+                active: Dict[str, Dict[str, Tuple[int, MemberType, datetime]]] = {}
+                for row in result:
+                    active.setdefault(row.roomid, {})[row.userid] = (row.id, row.member_type, row.join_time)
+
+                diff = RosterDiff()
+                for roomid, (data, roster, content_hash) in changed.items():
+                    diff.add_group(roomid, data, roster, active.get(roomid, {}), content_hash)
+
+                await diff.apply(await get_driver_connection(session))
+
+        summary["changed"] += len(changed)
+        summary["joins"] += len(diff.joins)
+        summary["quits"] += len(diff.quits)
+        summary["role_changes"] += len(diff.role_changes)
+        ROSTER_GROUPS.labels(result="changed").inc(len(changed))
+
+    async def _fetch(self, roomid: str) -> Optional[Dict[str, Any]]:
+        """拉取单个群的名单；失败的群本轮跳过，哈希不更新，下一轮重试"""
+        async with self._semaphore:
+            try:
+                return await self.client.get_group_chat(roomid)
+            except Exception as e:
+                logger.warning("Failed to fetch group roster", roomid=roomid, error=str(e))
+                return None
@@ -0,0 +1,343 @@
+"""
+消息同步流水线
+
+把同步拆分为 fetch → decrypt → parse → persist 四个阶段，阶段之间通过有界队列
+连接：拉取下一页、解密当前页、写入上一页可以同时进行，队列满时上游自动等待（背压）。
+"""
+
+import asyncio
+import collections
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import structlog
+
+from ..config import get_settings
+from .batch_controller import AdaptiveBatchController
+from .decrypt_executor import DecryptExecutor
+from .msgid_filter import MsgidFilter
+from .message_parser import parse_chat_message
+from .bulk_writer import BulkMessageWriter
+from .wechat_client import WeChatArchiveClient
+
+logger = structlog.get_logger()
+
+# 队列结束标记
+_STOP = object()
+
+
+class StageStats:
+    """单个阶段的计时统计"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.batches = 0
+        self.items = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wait_seconds": round(self.wait_seconds, 3),
+            "batches": self.batches,
+            "items": self.items,
+        }
+
+
+class SyncPipeline:
+    """消息同步流水线"""
+
+    def __init__(
+        self,
+        client: WeChatArchiveClient,
+        decryptor: DecryptExecutor,
+        writer: BulkMessageWriter,
+        key_path: Optional[str] = None,
+        encoding_aes_key: Optional[str] = None,
+        decrypt_parallelism: Optional[int] = None,
+        msgid_filter: Optional[MsgidFilter] = None,
+        start_seq: int = 0,
+        end_seq: Optional[int] = None,
+        roomid: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        controller: Optional[AdaptiveBatchController] = None,
+        queue_size: Optional[int] = None,
+        on_batch: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ):
+        settings = get_settings()
+        self.client = client
+        self.decryptor = decryptor
+        self.writer = writer
+        self.key_path = key_path
+        self.encoding_aes_key = encoding_aes_key
+        self.msgid_filter = msgid_filter
+        self.decrypt_parallelism = decrypt_parallelism or decryptor.max_workers
+        self.start_seq = start_seq
+        self.end_seq = end_seq
+        self.roomid = roomid
+        self.start_time = start_time
+        self.end_time = end_time
+        self.controller = controller or AdaptiveBatchController()
+        self.queue_size = queue_size or settings.sync_queue_size
+        self.on_batch = on_batch
+        # 带群组或时间窗口过滤的同步会跳过范围外的消息，不能推进企业游标
+        self.advance_cursor = not (roomid or start_time or end_time)
+        # 有消息解密失败时，游标最多推进到第一条失败消息之前，下次同步从该处重新拉取
+        self.cursor_ceiling: Optional[int] = None
+
+        self.stages = {name: StageStats(name) for name in ("fetch", "decrypt", "parse", "persist")}
+        self.last_seq = start_seq
+        self.fetched_count = 0
+        self.inserted_count = 0
+        self.duplicate_count = 0
+        self.skipped_count = 0
+        self.failed_count = 0
+        self.filtered_count = 0
+
+    async def run(self) -> Dict[str, Any]:
+        """运行流水线直到上游数据拉取完毕，任一阶段失败则整体失败"""
+        decrypt_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        parse_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        persist_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        started = time.perf_counter()
+        tasks = [
+            asyncio.create_task(self._fetch_stage(decrypt_queue)),
+            asyncio.create_task(self._decrypt_stage(decrypt_queue, parse_queue)),
+            asyncio.create_task(self._parse_stage(parse_queue, persist_queue)),
+            asyncio.create_task(self._persist_stage(persist_queue)),
+        ]
+
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        summary = self.summary()
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+
+    def summary(self) -> Dict[str, Any]:
+        """流水线统计摘要"""
+        return {
+            "last_seq": self.last_seq,
+            "fetched": self.fetched_count,
+            "inserted": self.inserted_count,
+            "duplicates": self.duplicate_count,
+            "skipped": self.skipped_count,
+            "failed": self.failed_count,
+            "filtered": self.filtered_count,
+            "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+            "batch_controller": self.controller.to_dict(),
+        }
+
+    async def _get(self, queue: asyncio.Queue, stats: StageStats):
+        """从队列取数据并记录等待时间"""
+        started = time.perf_counter()
+        item = await queue.get()
+        stats.wait_seconds += time.perf_counter() - started
+        return item
+
+    async def _put(self, queue: asyncio.Queue, item, stats: StageStats):
+        """向队列放数据，队列满时的阻塞计入等待时间"""
+        started = time.perf_counter()
+        await queue.put(item)
+        stats.wait_seconds += time.perf_counter() - started
+
+    async def _fetch_stage(self, out_queue: asyncio.Queue):
+        """拉取阶段：按 seq 顺序翻页"""
+        stats = self.stages["fetch"]
+        seq = self.start_seq
+
+        while True:
+            limit = self.controller.fetch_limit
+            started = time.perf_counter()
+            page = await self.client.get_chat_data(seq, limit)
+            elapsed = time.perf_counter() - started
+            stats.busy_seconds += elapsed
+
+            chatdata = page.get("chatdata") or []
+            self.controller.observe_fetch(elapsed, len(chatdata), limit)
+            reached_end = False
+            if self.end_seq is not None and chatdata and chatdata[-1]["seq"] >= self.end_seq:
+                # 分片同步只处理 (start_seq, end_seq] 区间
+                chatdata = [entry for entry in chatdata if entry["seq"] <= self.end_seq]
+                reached_end = True
+            if not chatdata:
+                break
+
+            stats.batches += 1
+            stats.items += len(chatdata)
+            self.fetched_count += len(chatdata)
+            seq = chatdata[-1]["seq"]
+
+            await self._put(out_queue, (seq, chatdata), stats)
+            if reached_end or len(chatdata) < limit:
+                break
+
+        await self._put(out_queue, _STOP, stats)
+
+    async def _decrypt_stage(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """解密阶段：先剔除确认已入库的 msgid，再整批提交到解密进程池，
+        最多 decrypt_parallelism 批并行，按提交顺序输出"""
+        stats = self.stages["decrypt"]
+        in_flight: Deque = collections.deque()
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self._get(in_queue, stats)
+            if item is _STOP:
+                break
+
+            batch_seq, chatdata = item
+            if self.msgid_filter is not None:
+                chatdata, dropped = await self.msgid_filter.drop_known(chatdata)
+                self.duplicate_count += dropped
+                self.filtered_count += dropped
+
+            if chatdata:
+                future = asyncio.ensure_future(self.decryptor.decrypt_batch(
+                    chatdata, self.key_path, self.encoding_aes_key
+                ))
+            else:
+                # 整批都是已知消息，仍需向下游传递 seq 以推进游标
+                future = loop.create_future()
+                future.set_result([])
+            in_flight.append((batch_seq, chatdata, future))
+            if len(in_flight) >= self.decrypt_parallelism:
+                await self._emit_decrypted(in_flight.popleft(), out_queue, stats)
+
+        while in_flight:
+            await self._emit_decrypted(in_flight.popleft(), out_queue, stats)
+
+        await self._put(out_queue, _STOP, stats)
+
+    async def _emit_decrypted(self, item, out_queue: asyncio.Queue, stats: StageStats):
+        """等待最早提交的一批解密完成并传给下游"""
+        batch_seq, chatdata, future = item
+        started = time.perf_counter()
+        decrypted = await future
+        elapsed = time.perf_counter() - started
+        stats.busy_seconds += elapsed
+        self.controller.observe_decrypt(elapsed, len(chatdata), self.decrypt_parallelism)
+        stats.batches += 1
+        stats.items += len(decrypted)
+        if len(decrypted) < len(chatdata):
+            self.failed_count += len(chatdata) - len(decrypted)
+            self._hold_cursor(chatdata, decrypted)
+
+        await self._put(out_queue, (batch_seq, decrypted), stats)
+
+    def _hold_cursor(self, chatdata: List[Dict[str, Any]], decrypted: List[Any]):
+        """记录第一条解密失败的 seq，游标不越过它"""
+        decrypted_seqs = {seq for seq, _ in decrypted}
+        first_failed = next(entry["seq"] for entry in chatdata if entry["seq"] not in decrypted_seqs)
+        if self.cursor_ceiling is None or first_failed - 1 < self.cursor_ceiling:
+            self.cursor_ceiling = first_failed - 1
+            logger.warning("Cursor held before undecryptable message", seq=first_failed)
+
+    async def _parse_stage(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """解析阶段：逐条解码明文并转换为行数据，按群组、时间窗口过滤"""
+        stats = self.stages["parse"]
+
+        while True:
+            item = await self._get(in_queue, stats)
+            if item is _STOP:
+                break
+
+            batch_seq, decrypted = item
+            started = time.perf_counter()
+            messages: List[Dict[str, Any]] = []
+            media_files: List[Dict[str, Any]] = []
+            for seq, raw in decrypted:
+                try:
+                    parsed = parse_chat_message(seq, raw)
+                except (KeyError, ValueError) as e:
+                    logger.warning("Failed to parse chat message", seq=seq, error=str(e))
+                    self.failed_count += 1
+                    continue
+                if parsed is None or not self._in_scope(parsed[0]):
+                    self.skipped_count += 1
+                    continue
+                messages.append(parsed[0])
+                media_files.extend(parsed[1])
+            # 尽早释放明文字节，等待下游期间只持有紧凑的行数据
+            del item, decrypted
+            stats.busy_seconds += time.perf_counter() - started
+            stats.batches += 1
+            stats.items += len(messages)
+
+            await self._put(out_queue, (batch_seq, messages, media_files), stats)
+
+        await self._put(out_queue, _STOP, stats)
+
+    async def _persist_stage(self, in_queue: asyncio.Queue):
+        """写入阶段：按 flush_size 合并多批后一次提交"""
+        stats = self.stages["persist"]
+        messages: List[Dict[str, Any]] = []
+        media_files: List[Dict[str, Any]] = []
+        batch_seq = None
+
+        while True:
+            item = await self._get(in_queue, stats)
+            if item is _STOP:
+                break
+
+            batch_seq, batch_messages, batch_media = item
+            messages.extend(batch_messages)
+            media_files.extend(batch_media)
+            if len(messages) >= self.controller.flush_size:
+                await self._flush(batch_seq, messages, media_files, stats)
+                messages, media_files, batch_seq = [], [], None
+
+        if batch_seq is not None:
+            await self._flush(batch_seq, messages, media_files, stats)
+
+    async def _flush(
+        self,
+        batch_seq: int,
+        messages: List[Dict[str, Any]],
+        media_files: List[Dict[str, Any]],
+        stats: StageStats
+    ):
+        """提交一次写入"""
+        cursor_seq = None
+        if self.advance_cursor:
+            cursor_seq = batch_seq if self.cursor_ceiling is None else min(batch_seq, self.cursor_ceiling)
+
+        started = time.perf_counter()
+        inserted, duplicates = await self.writer.write_batch(messages, media_files, cursor_seq=cursor_seq)
+        elapsed = time.perf_counter() - started
+        stats.busy_seconds += elapsed
+        stats.batches += 1
+        stats.items += inserted
+        self.controller.observe_commit(elapsed, len(messages))
+
+        self.inserted_count += inserted
+        self.duplicate_count += duplicates
+        self.last_seq = batch_seq
+
+        if self.msgid_filter is not None:
+            await self.msgid_filter.add(m["msgid"] for m in messages)
+
+        if self.on_batch is not None:
+            await self.on_batch(self.summary())
+
+    def _in_scope(self, message: Dict[str, Any]) -> bool:
+        """是否属于本次同步的群组和时间范围"""
+        if self.roomid and message["roomid"] != self.roomid:
+            return False
+        if self.start_time and message["msgtime"] < self.start_time:
+            return False
+        if self.end_time and message["msgtime"] > self.end_time:
+            return False
+        return True
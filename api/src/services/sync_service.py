@@ -0,0 +1,331 @@
+"""
+同步任务服务
+
+负责同步任务的创建、查询、取消，以及在 Celery worker 中执行同步流水线。
+"""
+
+import math
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import structlog
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import database
+from ..config import get_settings
+from ..models import ChatGroup, SyncCursor, SyncTask, TaskStatus
+from .bulk_writer import BulkMessageWriter
+from .decrypt_executor import get_decrypt_executor
+from .msgid_filter import get_msgid_filter
+from .rate_limiter import PRIORITY_SYNC
+from .sync_pipeline import SyncPipeline
+from .task_progress import TaskProgress, is_fresher, read_progress, set_progress_status
+from .wechat_client import WeChatArchiveClient
+
+logger = structlog.get_logger()
+
+
+class SyncCancelledError(Exception):
+    """同步任务已被取消"""
+
+
+class SyncService:
+    """同步任务服务"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_sync_task(
+        self,
+        roomid: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        task_type: str = "sync_messages",
+        corp_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        dispatch: bool = True
+    ) -> SyncTask:
+        """创建同步任务，dispatch 为真时投递到 sync 队列"""
+        if corp_id is None and roomid:
+            corp_id = await self.db.scalar(
+                select(ChatGroup.owner_corpid).where(ChatGroup.roomid == roomid)
+            )
+
+        task = SyncTask(
+            task_id=uuid.uuid4().hex,
+            roomid=roomid,
+            task_type=task_type,
+            status=TaskStatus.PENDING.value,
+            start_time=start_time,
+            end_time=end_time,
+            metadata={**(metadata or {}), "owner_corpid": corp_id or get_settings().corp_id},
+        )
+        self.db.add(task)
+        await self.db.commit()
+        await self.db.refresh(task)
+
+        if dispatch:
+            from ..tasks import run_backfill, sync_messages
+            if task_type == "backfill":
+                run_backfill.delay(task.task_id)
+            else:
+                sync_messages.delay(task.task_id)
+
+        logger.info("Sync task created", task_id=task.task_id, roomid=roomid)
+        return task
+
+    async def get_task_by_id(self, task_id: str) -> Optional[SyncTask]:
+        """按任务ID查询"""
+        result = await self.db.execute(select(SyncTask).where(SyncTask.task_id == task_id))
+        return result.scalar_one_or_none()
+
+    async def get_task_with_progress(self, task_id: str) -> Optional[SyncTask]:
+        """按任务ID查询，运行中的任务以 Redis 中更新的进度覆盖数据库行（不写回）"""
+        task = await self.get_task_by_id(task_id)
+        if task is None or task.status != TaskStatus.RUNNING.value:
+            return task
+
+        progress = await read_progress(task_id)
+        if progress and is_fresher(progress, task):
+            self.db.expunge(task)
+            for field, value in progress.items():
+                setattr(task, field, value)
+        return task
+
+    async def get_tasks(
+        self,
+        page: int = 1,
+        size: int = 20,
+        status: Optional[str] = None,
+        roomid: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """分页查询同步任务"""
+        query = select(SyncTask)
+        if status:
+            query = query.where(SyncTask.status == status)
+        if roomid:
+            query = query.where(SyncTask.roomid == roomid)
+
+        total = await self.db.scalar(select(func.count()).select_from(query.subquery()))
+        result = await self.db.execute(
+            query.order_by(SyncTask.created_at.desc()).offset((page - 1) * size).limit(size)
+        )
+        pages = math.ceil(total / size) if total else 0
+
+        return {
+            "data": result.scalars().all(),
+            "meta": {
+                "page": page,
+                "size": size,
+                "total": total,
+                "pages": pages,
+                "has_next": page < pages,
+                "has_prev": page > 1,
+            },
+        }
+
+    async def cancel_task(self, task_id: str) -> bool:
+        """取消待执行或执行中的任务"""
+        task = await self.get_task_by_id(task_id)
+        if task is None or task.status not in (TaskStatus.PENDING.value, TaskStatus.RUNNING.value):
+            return False
+
+        task.status = TaskStatus.CANCELLED.value
+        await self.db.commit()
+        await set_progress_status(task_id, TaskStatus.CANCELLED.value)
+        logger.info("Sync task cancelled", task_id=task_id)
+        return True
+
+    async def run_sync_task(self, task_id: str) -> Optional[SyncTask]:
+        """执行同步任务（由 Celery worker 调用）"""
+        task = await self.get_task_by_id(task_id)
+        if task is None:
+            logger.warning("Sync task not found", task_id=task_id)
+            return None
+        if task.status == TaskStatus.CANCELLED.value:
+            return task
+
+        settings = get_settings()
+        corp_id = (task.metadata or {}).get("owner_corpid") or settings.corp_id
+        secret = settings.get_corp_accounts().get(corp_id)
+        if secret is None:
+            task.status = TaskStatus.FAILED.value
+            task.error_message = f"未配置企业 {corp_id} 的会话存档 Secret"
+            await self.db.commit()
+            return task
+
+        # 全量增量同步从游标续传并独占该企业的同步通道；
+        # 带过滤条件的手动同步从头扫描并按范围过滤，不推进游标
+        filtered = bool(task.roomid or task.start_time or task.end_time)
+
+        async with self._corp_lane(corp_id, exclusive=not filtered) as acquired:
+            if not acquired:
+                task.status = TaskStatus.CANCELLED.value
+                task.error_message = "该企业已有同步任务在运行"
+                await self.db.commit()
+                logger.info("Corp sync lane busy", task_id=task_id, corp_id=corp_id)
+                return task
+
+            task.status = TaskStatus.RUNNING.value
+            await self.db.commit()
+
+            # 回补分片只处理分配给它的 (seq_start, seq_end] 区间
+            start_seq = (task.metadata or {}).get("seq_start", 0) if filtered \
+                else await self.get_resume_seq(corp_id)
+            await self._run_pipeline(task, corp_id, secret, start_seq, (task.metadata or {}).get("seq_end"))
+
+        return task
+
+    async def _run_pipeline(
+        self,
+        task: SyncTask,
+        corp_id: str,
+        secret: str,
+        start_seq: int,
+        end_seq: Optional[int] = None
+    ):
+        """运行同步流水线并把结果写回任务行"""
+        task_id = task.task_id
+        settings = get_settings()
+        progress = TaskProgress(task_id)
+
+        async def on_batch(summary: Dict[str, Any]):
+            # 每批只累加 Redis 计数；任务行按间隔节流刷写
+            status = await progress.report(self._progress_counts(summary))
+            if status == TaskStatus.CANCELLED.value:
+                raise SyncCancelledError(task_id)
+            if not progress.flush_due():
+                return
+
+            await self.db.refresh(task, ["status"])
+            if task.status == TaskStatus.CANCELLED.value:
+                raise SyncCancelledError(task_id)
+            self._apply_summary(task, summary)
+            await self.db.commit()
+            progress.mark_flushed()
+
+        msgid_filter = None
+        if settings.enable_msgid_filter:
+            try:
+                msgid_filter = await get_msgid_filter(corp_id, database.async_session_maker)
+            except Exception as e:
+                # 过滤器只是优化，Redis 不可用时退化为全部交给 ON CONFLICT 去重
+                logger.warning("Msgid filter unavailable", corp_id=corp_id, error=str(e))
+
+        try:
+            async with WeChatArchiveClient(
+                corp_id=corp_id, secret=secret, priority=(task.metadata or {}).get("priority", PRIORITY_SYNC)
+            ) as client:
+                pipeline = SyncPipeline(
+                    client=client,
+                    decryptor=get_decrypt_executor(),
+                    writer=BulkMessageWriter(database.async_session_maker, corp_id=corp_id),
+                    key_path=settings.get_private_key_path(corp_id),
+                    encoding_aes_key=settings.get_encoding_aes_key(corp_id),
+                    decrypt_parallelism=(task.metadata or {}).get("decrypt_budget"),
+                    msgid_filter=msgid_filter,
+                    start_seq=start_seq,
+                    end_seq=end_seq,
+                    roomid=task.roomid,
+                    start_time=task.start_time,
+                    end_time=task.end_time,
+                    on_batch=on_batch
+                )
+                summary = await pipeline.run()
+
+            self._apply_summary(task, summary)
+            task.status = TaskStatus.COMPLETED.value
+            await self.db.commit()
+            await progress.finish()
+            logger.info("Sync task completed", task_id=task_id, corp_id=corp_id, **{
+                k: summary[k] for k in ("fetched", "inserted", "duplicates", "elapsed_seconds")
+            })
+
+        except SyncCancelledError:
+            await progress.finish()
+            logger.info("Sync task stopped by cancellation", task_id=task_id)
+
+        except Exception as e:
+            await self.db.rollback()
+            task.status = TaskStatus.FAILED.value
+            task.error_message = str(e)
+            await self.db.commit()
+            await progress.finish()
+            logger.error("Sync task failed", task_id=task_id, corp_id=corp_id, error=str(e))
+            raise
+
+    @asynccontextmanager
+    async def _corp_lane(self, corp_id: str, exclusive: bool = True) -> AsyncIterator[bool]:
+        """企业同步通道：用 PostgreSQL 会话级 advisory lock 保证同一企业只有一个游标推进者"""
+        if not exclusive:
+            yield True
+            return
+
+        async with database.engine.connect() as conn:
+            acquired = await conn.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": f"sync:{corp_id}"}
+            )
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    await conn.execute(
+                        text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": f"sync:{corp_id}"}
+                    )
+
+    async def get_cursor(self, corp_id: Optional[str] = None) -> Optional[SyncCursor]:
+        """读取企业同步游标（主键查询）"""
+        return await self.db.get(SyncCursor, corp_id or get_settings().corp_id)
+
+    async def get_cursors(self) -> List[SyncCursor]:
+        """读取所有企业的同步游标"""
+        result = await self.db.execute(select(SyncCursor).order_by(SyncCursor.owner_corpid))
+        return result.scalars().all()
+
+    async def get_resume_seq(self, corp_id: Optional[str] = None) -> int:
+        """续传位置：最后一个已提交批次的 seq"""
+        cursor = await self.get_cursor(corp_id)
+        return cursor.last_seq if cursor else 0
+
+    @staticmethod
+    def lane_summary(task: SyncTask) -> Dict[str, Any]:
+        """单个同步通道的吞吐摘要"""
+        pipeline = (task.metadata or {}).get("pipeline") or {}
+        elapsed = pipeline.get("elapsed_seconds") or 0
+        inserted = pipeline.get("inserted", 0)
+        return {
+            "task_id": task.task_id,
+            "corp_id": (task.metadata or {}).get("owner_corpid"),
+            "status": task.status,
+            "fetched": pipeline.get("fetched", 0),
+            "inserted": inserted,
+            "duplicates": pipeline.get("duplicates", 0),
+            "elapsed_seconds": elapsed,
+            "messages_per_second": round(inserted / elapsed, 1) if elapsed else 0,
+            "error": task.error_message,
+        }
+
+    @staticmethod
+    def _progress_counts(summary: Dict[str, Any]) -> Dict[str, int]:
+        """流水线统计换算为任务进度：新增计入 success_count，重复和解密失败计入 error_count"""
+        return {
+            "total_count": summary["fetched"],
+            "progress": sum(summary[k] for k in ("inserted", "duplicates", "skipped", "failed")),
+            "success_count": summary["inserted"],
+            "error_count": summary["duplicates"] + summary["failed"],
+        }
+
+    @classmethod
+    def _apply_summary(cls, task: SyncTask, summary: Dict[str, Any]):
+        """把流水线统计写入任务行"""
+        for field, value in cls._progress_counts(summary).items():
+            setattr(task, field, value)
+        pipeline = {k: v for k, v in summary.items() if k != "batch_controller"}
+        task.metadata = {
+            **(task.metadata or {}),
+            "pipeline": pipeline,
+            "batch_controller": summary["batch_controller"],
+        }
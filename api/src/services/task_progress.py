@@ -0,0 +1,124 @@
+"""
+同步任务进度通道
+
+运行中的进度计数用 Redis HINCRBY 原子累加，sync_tasks 行只按 PROGRESS_FLUSH_INTERVAL
+节流刷写、并在任务结束时写入最终值，避免频繁改写同一行造成表膨胀。
+查询任务时如果 Redis 中的进度比数据库行更新，则以 Redis 为准。
+Redis 不可用时退化为每批直接写库。
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import structlog
+
+from ..config import get_settings
+from ..models import SyncTask
+from ..redis_client import get_redis
+
+logger = structlog.get_logger()
+
+PROGRESS_KEY_PREFIX = "sync_progress"
+PROGRESS_FIELDS = ("progress", "total_count", "success_count", "error_count")
+
+# 进度键的过期时间（秒），防止异常退出的任务残留
+PROGRESS_TTL = 86400
+
+
+def progress_key(task_id: str) -> str:
+    return f"{PROGRESS_KEY_PREFIX}:{task_id}"
+
+
+class TaskProgress:
+    """单个同步任务的进度上报与节流刷写"""
+
+    def __init__(self, task_id: str, flush_interval: Optional[float] = None):
+        self.task_id = task_id
+        self.key = progress_key(task_id)
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else get_settings().progress_flush_interval
+        )
+        self._reported = dict.fromkeys(PROGRESS_FIELDS, 0)
+        self._last_flush = time.monotonic()
+        self._redis_ok = True
+
+    async def report(self, counts: Dict[str, int]) -> Optional[str]:
+        """把累计计数的增量原子累加到 Redis，返回 Redis 中记录的任务状态（用于感知取消）"""
+        deltas = {field: counts[field] - self._reported[field] for field in PROGRESS_FIELDS}
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                for field, delta in deltas.items():
+                    if delta:
+                        pipe.hincrby(self.key, field, delta)
+                pipe.hset(self.key, "updated_at", time.time())
+                pipe.expire(self.key, PROGRESS_TTL)
+                pipe.hget(self.key, "status")
+                results = await pipe.execute()
+        except Exception as e:
+            if self._redis_ok:
+                logger.warning("Progress channel unavailable", task_id=self.task_id, error=str(e))
+            self._redis_ok = False
+            return None
+
+        self._redis_ok = True
+        self._reported = dict(counts)
+        status = results[-1]
+        return status.decode() if status else None
+
+    def flush_due(self) -> bool:
+        """是否需要刷写数据库：距上次刷写已超过间隔，或 Redis 不可用"""
+        return not self._redis_ok or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def mark_flushed(self):
+        self._last_flush = time.monotonic()
+
+    async def finish(self):
+        """任务结束、最终值已写库后删除进度键"""
+        await clear_progress(self.task_id)
+
+
+async def clear_progress(task_id: str):
+    """删除任务的进度键（含状态），任务重新执行时从零开始计数"""
+    try:
+        await get_redis().delete(progress_key(task_id))
+    except Exception as e:
+        logger.warning("Failed to clear progress", task_id=task_id, error=str(e))
+
+
+async def set_progress_status(task_id: str, status: str):
+    """记录任务状态（如取消），运行中的任务在下一批上报时即可感知"""
+    try:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hset(progress_key(task_id), "status", status)
+            pipe.expire(progress_key(task_id), PROGRESS_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to publish task status", task_id=task_id, error=str(e))
+
+
+async def read_progress(task_id: str) -> Optional[Dict[str, Any]]:
+    """读取 Redis 中的进度，不存在或不可用时返回 None"""
+    try:
+        data = await get_redis().hgetall(progress_key(task_id))
+    except Exception as e:
+        logger.warning("Failed to read progress", task_id=task_id, error=str(e))
+        return None
+    if not data or b"updated_at" not in data:
+        return None
+
+    progress: Dict[str, Any] = {
+        field: int(data[field.encode()]) for field in PROGRESS_FIELDS if field.encode() in data
+    }
+    progress["updated_at"] = datetime.fromtimestamp(float(data[b"updated_at"]), tz=timezone.utc)
+    return progress
+
+
+def is_fresher(progress: Dict[str, Any], task: SyncTask) -> bool:
+    """Redis 进度是否比数据库行新"""
+    updated_at = task.updated_at
+    if updated_at is None:
+        return True
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return progress["updated_at"] > updated_at
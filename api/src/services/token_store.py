@@ -0,0 +1,182 @@
+"""
+access_token 分布式缓存
+
+每个 corp_id/secret 的 token 存在 Redis 中，所有 API 与 Celery worker 进程共享；
+进程内再保留一份副本，未进入提前刷新窗口时不访问 Redis。
+刷新时先抢 Redis 锁，只有一个进程调用 gettoken，其余进程继续使用旧 token
+或短暂等待新 token 写入（single-flight）。上游返回 token 失效时调用 invalidate。
+Redis 不可用时退化为进程内缓存。
+"""
+
+import asyncio
+import hashlib
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+import structlog
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+from ..config import get_settings
+from ..redis_client import get_redis
+
+logger = structlog.get_logger()
+
+# Prometheus 指标
+TOKEN_LOOKUPS = Counter(
+    'wechat_access_token_lookups_total',
+    'Access token lookups by source',
+    ['corp_id', 'source']
+)
+
+TOKEN_KEY_PREFIX = "access_token"
+
+# 锁持有时间（毫秒），应大于一次 gettoken 的耗时
+LOCK_TTL_MS = 10000
+
+# 未抢到锁且本地没有可用 token 时，等待其他进程写入的最长时间（秒）
+WAIT_TIMEOUT = 5.0
+WAIT_INTERVAL = 0.1
+
+# 只删除自己持有的锁 / 只删除仍是失效 token 的缓存
+COMPARE_AND_DELETE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+COMPARE_TOKEN_AND_DELETE = """
+local value = redis.call('get', KEYS[1])
+if value and cjson.decode(value)['token'] == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# 返回 (token, expires_in 秒)
+TokenFetcher = Callable[[], Awaitable[Tuple[str, int]]]
+
+
+class AccessTokenStore:
+    """单个 corp_id/secret 的 token 缓存"""
+
+    def __init__(self, corp_id: str, secret: str):
+        settings = get_settings()
+        self.corp_id = corp_id
+        self.max_ttl = settings.token_cache_ttl
+        self.refresh_margin = settings.token_refresh_margin
+
+        secret_hash = hashlib.sha1(secret.encode()).hexdigest()[:12]
+        self.key = f"{TOKEN_KEY_PREFIX}:{corp_id}:{secret_hash}"
+        self.lock_key = f"{self.key}:lock"
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._local_lock = asyncio.Lock()
+
+    def _fresh(self, now: float) -> bool:
+        """本地副本是否未进入提前刷新窗口"""
+        return self._token is not None and now < self._expires_at - self.refresh_margin
+
+    def _valid(self, now: float) -> bool:
+        return self._token is not None and now < self._expires_at
+
+    async def get(self, fetch: TokenFetcher) -> str:
+        """获取 token；同一进程内的并发调用合并为一次查询或刷新"""
+        if self._fresh(time.time()):
+            TOKEN_LOOKUPS.labels(corp_id=self.corp_id, source="local").inc()
+            return self._token
+
+        async with self._local_lock:
+            if self._fresh(time.time()):
+                TOKEN_LOOKUPS.labels(corp_id=self.corp_id, source="local").inc()
+                return self._token
+            try:
+                return await self._get_shared(fetch)
+            except RedisError as e:
+                logger.warning("Token store unavailable, refreshing locally", corp_id=self.corp_id, error=str(e))
+                if self._valid(time.time()):
+                    return self._token
+                return await self._refresh_local(fetch)
+
+    async def _get_shared(self, fetch: TokenFetcher) -> str:
+        redis = get_redis()
+        self._load(await redis.get(self.key))
+        if self._fresh(time.time()):
+            TOKEN_LOOKUPS.labels(corp_id=self.corp_id, source="redis").inc()
+            return self._token
+
+        owner = uuid.uuid4().hex
+        if await redis.set(self.lock_key, owner, nx=True, px=LOCK_TTL_MS):
+            try:
+                token, expires_in = await fetch()
+                ttl = max(1, min(self.max_ttl, expires_in))
+                self._token, self._expires_at = token, time.time() + ttl
+                await redis.set(
+                    self.key,
+                    orjson.dumps({"token": token, "expires_at": self._expires_at}),
+                    ex=ttl
+                )
+                TOKEN_LOOKUPS.labels(corp_id=self.corp_id, source="refresh").inc()
+                logger.info("Access token refreshed", corp_id=self.corp_id, ttl=ttl)
+                return token
+            finally:
+                await redis.eval(COMPARE_AND_DELETE, 1, self.lock_key, owner)
+
+        # 其他进程正在刷新：旧 token 仍有效就继续使用
+        if self._valid(time.time()):
+            TOKEN_LOOKUPS.labels(corp_id=self.corp_id, source="stale").inc()
+            return self._token
+
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(WAIT_INTERVAL)
+            self._load(await redis.get(self.key))
+            if self._valid(time.time()):
+                TOKEN_LOOKUPS.labels(corp_id=self.corp_id, source="waited").inc()
+                return self._token
+
+        logger.warning("Timed out waiting for token refresh", corp_id=self.corp_id)
+        return await self._refresh_local(fetch)
+
+    async def _refresh_local(self, fetch: TokenFetcher) -> str:
+        token, expires_in = await fetch()
+        self._token = token
+        self._expires_at = time.time() + max(1, min(self.max_ttl, expires_in))
+        TOKEN_LOOKUPS.labels(corp_id=self.corp_id, source="refresh").inc()
+        return token
+
+    def _load(self, value: Optional[bytes]):
+        """用 Redis 中的值更新本地副本"""
+        if not value:
+            return
+        data = orjson.loads(value)
+        if data["expires_at"] > self._expires_at:
+            self._token, self._expires_at = data["token"], data["expires_at"]
+
+    async def invalidate(self, token: Optional[str] = None):
+        """上游报告 token 失效：丢弃本地副本，并在 Redis 中仍是该 token 时删除"""
+        token = token or self._token
+        self._token, self._expires_at = None, 0.0
+        if not token:
+            return
+        try:
+            await get_redis().eval(COMPARE_TOKEN_AND_DELETE, 1, self.key, token)
+        except RedisError as e:
+            logger.warning("Failed to invalidate shared token", corp_id=self.corp_id, error=str(e))
+        logger.info("Access token invalidated", corp_id=self.corp_id)
+
+
+# 进程内按 corp_id/secret 共享
+_stores: Dict[Tuple[str, str], AccessTokenStore] = {}
+
+
+def get_token_store(corp_id: str, secret: str) -> AccessTokenStore:
+    """获取 corp_id/secret 对应的 token 缓存"""
+    store = _stores.get((corp_id, secret))
+    if store is None:
+        store = _stores[(corp_id, secret)] = AccessTokenStore(corp_id, secret)
+    return store
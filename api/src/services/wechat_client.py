@@ -0,0 +1,171 @@
+"""
+企业微信会话存档接口客户端
+
+封装 access_token 获取、getchatdata 拉取、群成员查询等上游接口调用。
+连接由进程内共享的 HTTP 客户端复用（见 http_client），客户端实例本身很轻。
+"""
+
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import orjson
+import structlog
+
+from ..config import get_settings
+from .archive_replay import get_archive_recorder
+from .http_client import get_http_client
+from .rate_limiter import PRIORITY_SYNC, get_rate_limiter
+from .retry_policy import (
+    UPSTREAM_RETRIES, ErrorClass, classify_error, get_circuit_breaker, get_retry_policy
+)
+from .token_store import get_token_store
+
+logger = structlog.get_logger()
+
+
+class WeChatAPIError(Exception):
+    """企业微信接口错误"""
+
+    def __init__(self, errcode: int, errmsg: str = "", endpoint: str = ""):
+        self.errcode = errcode
+        self.errmsg = errmsg
+        self.endpoint = endpoint
+        super().__init__(f"[{endpoint}] errcode={errcode} errmsg={errmsg}")
+
+
+class WeChatArchiveClient:
+    """企业微信会话存档客户端"""
+
+    def __init__(
+        self,
+        corp_id: Optional[str] = None,
+        secret: Optional[str] = None,
+        base_url: Optional[str] = None,
+        priority: str = PRIORITY_SYNC
+    ):
+        settings = get_settings()
+        self.corp_id = corp_id or settings.corp_id
+        self.secret = secret or settings.secret
+        self.base_url = base_url or settings.api_base_url
+        self.token_cache_ttl = settings.token_cache_ttl
+
+        self.recorder = get_archive_recorder()
+        self._http = get_http_client(self.base_url)
+        self.token_store = get_token_store(self.corp_id, self.secret)
+        # 配额优先级：interactive / sync / background
+        self.priority = priority
+        self.rate_limiter = get_rate_limiter()
+
+    async def __aenter__(self) -> "WeChatArchiveClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """连接属于进程级共享客户端，这里不关闭，由进程退出钩子统一释放"""
+
+    async def get_access_token(self) -> str:
+        """获取 access_token（Redis 共享缓存，进程内副本，单进程刷新）"""
+        return await self.token_store.get(self._fetch_access_token)
+
+    async def _fetch_access_token(self) -> Tuple[str, int]:
+        """调用 gettoken，返回 (token, expires_in)"""
+        data = await self._request(
+            "GET",
+            "/cgi-bin/gettoken",
+            params={"corpid": self.corp_id, "corpsecret": self.secret},
+            with_token=False
+        )
+        return data["access_token"], int(data.get("expires_in", self.token_cache_ttl))
+
+    async def get_chat_data(self, seq: int, limit: int, timeout: int = 5) -> Dict[str, Any]:
+        """拉取 seq 之后的一页会话存档数据"""
+        return await self._request(
+            "POST",
+            "/cgi-bin/msgaudit/getchatdata",
+            json={"seq": seq, "limit": limit, "timeout": timeout}
+        )
+
+    async def get_media_data(self, sdkfileid: str, indexbuf: str = "", timeout: int = 5) -> Dict[str, Any]:
+        """拉取媒体文件的一个分片"""
+        return await self._request(
+            "POST",
+            "/cgi-bin/msgaudit/getmediadata",
+            json={"sdkfileid": sdkfileid, "indexbuf": indexbuf, "timeout": timeout}
+        )
+
+    async def get_group_chat(self, roomid: str) -> Dict[str, Any]:
+        """获取内部群信息及成员列表"""
+        return await self._request(
+            "POST",
+            "/cgi-bin/msgaudit/groupchat/get",
+            json={"roomid": roomid}
+        )
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        with_token: bool = True,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """发送请求并校验 errcode；按错误分类退避重试，经过接口熔断器"""
+        breaker = get_circuit_breaker(path)
+        policy = get_retry_policy()
+        token: Optional[str] = None
+
+        for attempt in range(1, policy.max_attempts + 1):
+            if with_token:
+                # 在 try 之外获取：gettoken 有自己的重试和熔断器，失败时直接抛出，
+                # 不计入本接口的熔断统计，也不会被本循环再次重试（否则重试次数相乘）
+                token = await self.get_access_token()
+                params = dict(kwargs.pop("params", None) or {})
+                params["access_token"] = token
+                kwargs["params"] = params
+
+            breaker.before_call()
+            try:
+                await self.rate_limiter.acquire(self.corp_id, path, self.priority)
+                response = await self._http.request(method, path, **kwargs)
+                response.raise_for_status()
+                # 直接从响应字节解码，不经过中间的 str
+                data = orjson.loads(response.content)
+
+                errcode = data.get("errcode", 0)
+                if errcode != 0:
+                    raise WeChatAPIError(errcode, data.get("errmsg", ""), path)
+
+                breaker.record_success()
+                if self.recorder is not None:
+                    await self.recorder.record(path, kwargs.get("json"), response.content)
+                return data
+
+            except (httpx.HTTPError, WeChatAPIError) as e:
+                error_class = classify_error(e)
+                if error_class in (ErrorClass.RETRYABLE, ErrorClass.RATE_LIMITED):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+
+                logger.warning(
+                    "WeChat API request failed",
+                    endpoint=path,
+                    attempt=attempt,
+                    error_class=error_class.value,
+                    error=str(e)
+                )
+                if error_class == ErrorClass.FATAL or attempt == policy.max_attempts:
+                    raise
+
+                if error_class == ErrorClass.TOKEN and token:
+                    # token 被上游判定失效（如其他系统重置了 Secret），作废缓存后重新获取
+                    await self.token_store.invalidate(token)
+                UPSTREAM_RETRIES.labels(endpoint=path, error_class=error_class.value).inc()
+                await asyncio.sleep(policy.backoff(attempt, error_class))
+
+            except BaseException:
+                # 限流等待被取消、任务取消等：不计入本接口的熔断统计
+                breaker.release()
+                raise
@@ -0,0 +1,271 @@
+"""
+Celery 异步任务
+
+定义 Celery 应用以及消息同步相关的后台任务。
+"""
+
+import asyncio
+from typing import Any, Coroutine
+
+import structlog
+from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from . import database
+from .config import get_settings
+from .redis_client import close_redis
+
+logger = structlog.get_logger()
+
+settings = get_settings()
+
+celery_app = Celery("wechat_archive")
+celery_app.conf.update(**settings.celery_config)
+
+# 每个 worker 进程持有一个事件循环，数据库连接池与之绑定
+_loop = None
+
+
+def run_async(coro: Coroutine) -> Any:
+    """在当前进程的事件循环中执行协程"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """worker 进程启动时初始化数据库连接"""
+    run_async(database.init_db())
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """worker 进程退出时释放连接、上游连接池和解密进程池"""
+    from .services.decrypt_executor import shutdown_decrypt_executor
+    from .services.http_client import close_http_clients
+
+    shutdown_decrypt_executor()
+    run_async(close_http_clients())
+    run_async(close_redis())
+    run_async(database.close_db())
+
+
+@celery_app.task(name="src.tasks.sync_messages")
+def sync_messages(task_id: str):
+    """执行单个同步任务，返回通道吞吐摘要；失败只记录在任务行，不影响其他企业"""
+    from .services.sync_service import SyncService
+
+    async def _run():
+        async with database.async_session_maker() as session:
+            service = SyncService(session)
+            try:
+                task = await service.run_sync_task(task_id)
+            except Exception as e:
+                logger.error("Sync lane failed", task_id=task_id, error=str(e))
+                task = await service.get_task_by_id(task_id)
+            return SyncService.lane_summary(task) if task else None
+
+    return run_async(_run())
+
+
+@celery_app.task(name="src.tasks.sync_all_groups_messages")
+def sync_all_groups_messages():
+    """定时增量同步：每个企业一个独立通道并行执行"""
+    if not settings.enable_auto_sync:
+        return None
+
+    from .services.corp_fanout import CorpSyncFanout
+
+    async def _run():
+        async with database.async_session_maker() as session:
+            parent = await CorpSyncFanout(session).dispatch()
+            return parent.task_id
+
+    return run_async(_run())
+
+
+@celery_app.task(name="src.tasks.summarize_corp_syncs")
+def summarize_corp_syncs(lanes, parent_task_id: str):
+    """汇总各企业同步通道的吞吐"""
+    from .services.corp_fanout import CorpSyncFanout
+
+    async def _run():
+        async with database.async_session_maker() as session:
+            await CorpSyncFanout(session).summarize(parent_task_id, lanes)
+
+    run_async(_run())
+
+
+@celery_app.task(name="src.tasks.check_sync_fanouts")
+def check_sync_fanouts():
+    """定期检查运行中的多企业同步，回收 worker 已退出的通道并补做汇总"""
+    from .services.corp_fanout import CorpSyncFanout
+
+    async def _run():
+        async with database.async_session_maker() as session:
+            return await CorpSyncFanout(session).check_running()
+
+    return run_async(_run())
+
+
+@celery_app.task(name="src.tasks.run_backfill")
+def run_backfill(task_id: str):
+    """规划历史回补分片并按并发上限投递"""
+    from .models import TaskStatus
+    from .services.backfill import BackfillService, SeqLocator
+    from .services.decrypt_executor import get_decrypt_executor
+    from .services.wechat_client import WeChatArchiveClient
+
+    async def _run():
+        async with database.async_session_maker() as session:
+            service = BackfillService(session)
+            parent = await service.sync_service.get_task_by_id(task_id)
+            if parent is None or parent.status != TaskStatus.PENDING.value:
+                return None
+
+            corp_id = (parent.metadata or {}).get("owner_corpid") or settings.corp_id
+            secret = settings.get_corp_accounts().get(corp_id)
+            parent.status = TaskStatus.RUNNING.value
+            await session.commit()
+
+            try:
+                if secret is None:
+                    raise ValueError(f"未配置企业 {corp_id} 的会话存档 Secret")
+                async with WeChatArchiveClient(corp_id=corp_id, secret=secret) as client:
+                    locator = SeqLocator(
+                        client,
+                        get_decrypt_executor(),
+                        settings.get_private_key_path(corp_id),
+                        settings.get_encoding_aes_key(corp_id)
+                    )
+                    await service.plan(parent, locator)
+            except Exception as e:
+                await session.rollback()
+                parent.status = TaskStatus.FAILED.value
+                parent.error_message = f"回补规划失败: {e}"
+                await session.commit()
+                logger.error("Backfill planning failed", task_id=task_id, error=str(e))
+                return None
+
+            await service.dispatch_pending(task_id)
+            return task_id
+
+    return run_async(_run())
+
+
+@celery_app.task(name="src.tasks.backfill_slice_done")
+def backfill_slice_done(lane, parent_task_id: str):
+    """回补分片结束：投递下一个分片，全部结束时汇总父任务"""
+    from .services.backfill import BackfillService
+
+    async def _run():
+        async with database.async_session_maker() as session:
+            await BackfillService(session).dispatch_pending(parent_task_id)
+
+    logger.info("Backfill slice finished", parent_task_id=parent_task_id, **{
+        k: (lane or {}).get(k) for k in ("task_id", "status", "inserted", "elapsed_seconds")
+    })
+    run_async(_run())
+
+
+@celery_app.task(name="src.tasks.check_backfills")
+def check_backfills():
+    """定期检查运行中的回补任务，回收 worker 已退出的分片"""
+    from .services.backfill import BackfillService
+
+    async def _run():
+        async with database.async_session_maker() as session:
+            return await BackfillService(session).check_running()
+
+    return run_async(_run())
+
+
+@celery_app.task(name="src.tasks.download_media")
+def download_media(media_id: int):
+    """断点续传下载单个媒体文件，返回最终下载状态；结束后触发调度补充在途名额"""
+    from .services.media_downloader import MediaDownloader
+
+    status = run_async(MediaDownloader(database.async_session_maker).download(media_id))
+    if status is not None:
+        schedule_media_downloads.delay()
+    return status
+
+
+@celery_app.task(name="src.tasks.schedule_media_downloads")
+def schedule_media_downloads():
+    """按优先级在并发上限内投递待下载媒体"""
+    from .services.media_scheduler import MediaDownloadScheduler
+
+    return run_async(MediaDownloadScheduler(database.async_session_maker).schedule())
+
+
+@celery_app.task(name="src.tasks.reclaim_media_blobs")
+def reclaim_media_blobs():
+    """校正媒体实体引用数并删除无引用的实体"""
+    from .services.media_store import MediaBlobReclaimer
+
+    return run_async(MediaBlobReclaimer(database.async_session_maker).reclaim())
+
+
+@celery_app.task(name="src.tasks.migrate_cold_media")
+def migrate_cold_media():
+    """把冷媒体从热存储迁移到打包段文件"""
+    from .services.media_tiering import MediaTieringService
+
+    return run_async(MediaTieringService(database.async_session_maker).migrate())
+
+
+@celery_app.task(name="src.tasks.verify_media_integrity")
+def verify_media_integrity():
+    """从断点继续校验已下载媒体，损坏或缺失的重新排入下载"""
+    from .services.media_integrity import MediaIntegrityScanner
+
+    return run_async(MediaIntegrityScanner(database.async_session_maker).scan())
+
+
+@celery_app.task(name="src.tasks.rebuild_msgid_filters")
+def rebuild_msgid_filters():
+    """从 chat_messages 重建各企业的 msgid 布隆过滤器"""
+    from .services.msgid_filter import get_msgid_filter
+
+    async def _run():
+        totals = {}
+        for corp_id in settings.get_corp_accounts():
+            msgid_filter = await get_msgid_filter(corp_id, database.async_session_maker)
+            totals[corp_id] = await msgid_filter.rebuild_from_db()
+        return totals
+
+    return run_async(_run())
+
+
+@celery_app.task(name="src.tasks.reconcile_counters")
+def reconcile_counters():
+    """按群分块校正冗余计数"""
+    from .services.counters import CounterReconciler
+
+    return run_async(CounterReconciler(database.async_session_maker).reconcile())
+
+
+@celery_app.task(name="src.tasks.sync_group_rosters")
+def sync_group_rosters():
+    """增量同步各企业的群成员名单"""
+    from .services.rate_limiter import PRIORITY_BACKGROUND
+    from .services.roster_sync import RosterSyncService
+    from .services.wechat_client import WeChatArchiveClient
+
+    async def _run():
+        summaries = {}
+        for corp_id, secret in settings.get_corp_accounts().items():
+            if not secret:
+                continue
+            async with WeChatArchiveClient(
+                corp_id=corp_id, secret=secret, priority=PRIORITY_BACKGROUND
+            ) as client:
+                service = RosterSyncService(database.async_session_maker, client, corp_id)
+                summaries[corp_id] = await service.sync_all()
+        return summaries
+
+    return run_async(_run())
@@ -0,0 +1,57 @@
+"""
+配置解析单元测试
+"""
+
+import pytest
+
+from src.config import Settings
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name, value in {
+        "CORP_ID": "main", "SECRET": "s", "ENCODING_AES_KEY": "main-key",
+        "DATABASE_URL": "postgresql://db/x",
+    }.items():
+        monkeypatch.setenv(name, value)
+    return monkeypatch
+
+
+def test_empty_extra_corps_from_env(env):
+    """.env.example 中的空值不能让启动失败"""
+    env.setenv("EXTRA_CORP_ACCOUNTS", "")
+    env.setenv("EXTRA_CORP_AES_KEYS", "")
+    settings = Settings(_env_file=None)
+
+    assert settings.get_corp_accounts() == {"main": "s"}
+    assert settings.get_encoding_aes_key("other") is None
+
+
+def test_extra_corps_from_env(env):
+    env.setenv("EXTRA_CORP_ACCOUNTS", "other:s2, third:s3,bad,main:ignored")
+    env.setenv("EXTRA_CORP_AES_KEYS", "other:other-key")
+    settings = Settings(_env_file=None)
+
+    assert settings.get_corp_accounts() == {"main": "s", "other": "s2", "third": "s3"}
+    assert settings.get_encoding_aes_key("other") == "other-key"
+    assert settings.get_encoding_aes_key("third") is None
+
+
+def test_rate_limits_from_env(env):
+    env.setenv("UPSTREAM_RATE_LIMITS", "token:1,chatdata:10,media:2.5")
+
+    assert Settings(_env_file=None).get_rate_limits() == {"token": 1.0, "chatdata": 10.0, "media": 2.5}
+
+
+def test_default_rate_limits():
+    assert Settings(
+        corp_id="main", secret="s", encoding_aes_key="k", database_url="postgresql://db/x", _env_file=None
+    ).get_rate_limits()["chatdata"] == 10.0
+
+
+def test_media_type_weights_from_env(env):
+    env.setenv("MEDIA_TYPE_WEIGHTS", "voice:0,image:0,video:3,default:1")
+
+    assert Settings(_env_file=None).get_media_type_weights() == {
+        "voice": 0.0, "image": 0.0, "video": 3.0, "default": 1.0,
+    }
@@ -0,0 +1,59 @@
+"""
+会话存档录制与回放单元测试
+"""
+
+import os
+
+import orjson
+import pytest
+
+from src.services.archive_replay import ArchiveRecorder, ArchiveReplayStore
+
+
+def _chat_page(*seqs: int) -> bytes:
+    return orjson.dumps({
+        "errcode": 0,
+        "chatdata": [{"seq": seq, "msgid": f"m{seq}", "encrypt_chat_msg": "x"} for seq in seqs],
+    }, option=orjson.OPT_INDENT_2)
+
+
+@pytest.mark.asyncio
+async def test_recorded_pages_replay_in_seq_order(tmp_path):
+    recorder = ArchiveRecorder(str(tmp_path))
+    await recorder.record("/cgi-bin/msgaudit/getchatdata", {"seq": 2}, _chat_page(3, 4))
+    await recorder.record("/cgi-bin/msgaudit/getchatdata", {"seq": 0}, _chat_page(1, 2))
+    await recorder.record("/cgi-bin/gettoken", None, b'{"access_token": "t"}')
+    recorder.close()
+
+    store = ArchiveReplayStore(str(tmp_path))
+    assert [entry["seq"] for entry in store.get_chat_data(1, 2)] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_segments_rotate_by_size_and_carry_pid(tmp_path):
+    recorder = ArchiveRecorder(str(tmp_path), segment_size=200)
+    for seq in range(1, 4):
+        await recorder.record("/cgi-bin/msgaudit/getchatdata", {"seq": seq - 1}, _chat_page(seq))
+    recorder.close()
+
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 3
+    assert all(name.startswith(recorder.prefix) and str(os.getpid()) in name for name in files)
+    assert all(os.path.getsize(tmp_path / name) <= 200 for name in files)
+
+
+@pytest.mark.asyncio
+async def test_recorders_of_different_processes_use_separate_segments(tmp_path):
+    """多个进程录制到同一目录时各写各的分段文件"""
+    first = ArchiveRecorder(str(tmp_path))
+    second = ArchiveRecorder(str(tmp_path))
+    second.prefix = f"{second.prefix}-other"
+
+    await first.record("/cgi-bin/msgaudit/getchatdata", {"seq": 0}, _chat_page(1))
+    await second.record("/cgi-bin/msgaudit/getchatdata", {"seq": 1}, _chat_page(2))
+    first.close()
+    second.close()
+
+    assert len(os.listdir(tmp_path)) == 2
+    store = ArchiveReplayStore(str(tmp_path))
+    assert [entry["seq"] for entry in store.get_chat_data(0, 10)] == [1, 2]
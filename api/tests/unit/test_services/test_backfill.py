@@ -0,0 +1,114 @@
+"""
+分片回补单元测试
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.models import SyncTask, TaskStatus
+from src.services import task_progress as task_progress_module
+from src.services.backfill import BackfillService, SeqLocateError, SeqLocator
+from src.services.task_progress import TaskProgress, clear_progress, read_progress, set_progress_status
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeClient:
+    """seq 1..last 的存档，每条消息在 T0 之后 seq 分钟"""
+
+    def __init__(self, last: int):
+        self.last = last
+
+    async def get_chat_data(self, seq, limit):
+        return {"chatdata": [{"seq": s} for s in range(seq + 1, min(seq + limit, self.last) + 1)]}
+
+
+class FakeDecryptor:
+    """undecryptable 中的 seq 解密失败，其余返回带时间的消息"""
+
+    def __init__(self, undecryptable=()):
+        self.undecryptable = set(undecryptable)
+
+    async def decrypt_batch(self, entries, key_path=None, encoding_aes_key=None):
+        return [
+            (entry["seq"], orjson.dumps({
+                "msgtime": int((T0 + timedelta(minutes=entry["seq"])).timestamp() * 1000)
+            }))
+            for entry in entries
+            if entry["seq"] not in self.undecryptable
+        ]
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(server=FakeServer())
+    monkeypatch.setattr(task_progress_module, "get_redis", lambda: client)
+    return client
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("minute, expected", [(0, 0), (1, 0), (500, 499), (1000, 999), (5000, 1000)])
+async def test_locate_finds_first_seq_not_before_time(minute, expected):
+    locator = SeqLocator(FakeClient(1000), FakeDecryptor(), initial_step=16)
+
+    assert await locator.locate(T0 + timedelta(minutes=minute)) == expected
+
+
+@pytest.mark.asyncio
+async def test_locate_end_of_data():
+    locator = SeqLocator(FakeClient(1000), FakeDecryptor(), initial_step=16)
+
+    assert await locator.locate(None, low=200) == 1000
+
+
+@pytest.mark.asyncio
+async def test_locate_skips_undecryptable_messages():
+    locator = SeqLocator(FakeClient(100), FakeDecryptor(range(40, 60)), initial_step=16)
+
+    assert await locator.locate(T0 + timedelta(minutes=50)) == 39
+
+
+@pytest.mark.asyncio
+async def test_probe_gives_up_after_page_cap():
+    """连续大段无法解密时不会一直翻到存档末尾"""
+    client = FakeClient(1000)
+    locator = SeqLocator(client, FakeDecryptor(range(1, 1001)), max_probe_pages=3)
+
+    with pytest.raises(SeqLocateError):
+        await locator.locate(T0)
+    assert locator.probes == 3
+
+
+def _slice(updated_at):
+    return SyncTask(task_id="s1", status=TaskStatus.RUNNING.value, updated_at=updated_at, metadata={})
+
+
+def test_slice_is_stale_without_recent_activity():
+    now = T0 + timedelta(hours=1)
+
+    assert BackfillService.is_stale(_slice(T0), None, now, 1800)
+    assert not BackfillService.is_stale(_slice(now - timedelta(minutes=5)), None, now, 1800)
+    assert not BackfillService.is_stale(_slice(None), None, now, 1800)
+
+
+def test_recent_progress_report_keeps_slice_alive():
+    """数据库行按间隔节流刷写，以 Redis 进度的更新时间为准"""
+    now = T0 + timedelta(hours=1)
+    progress = {"updated_at": now - timedelta(minutes=1)}
+
+    assert not BackfillService.is_stale(_slice(T0.replace(tzinfo=None)), progress, now, 1800)
+
+
+@pytest.mark.asyncio
+async def test_cleared_progress_no_longer_reports_cancelled(redis):
+    await set_progress_status("s1", TaskStatus.CANCELLED.value)
+    assert await TaskProgress("s1").report(dict.fromkeys(task_progress_module.PROGRESS_FIELDS, 0)) == "cancelled"
+
+    await clear_progress("s1")
+    progress = TaskProgress("s1")
+    assert await progress.report({"progress": 5, "total_count": 5, "success_count": 5, "error_count": 0}) is None
+    assert (await read_progress("s1"))["progress"] == 5
@@ -0,0 +1,65 @@
+"""
+自适应批大小控制器单元测试
+"""
+
+from src.services.batch_controller import AdaptiveBatchController
+
+
+def _controller(**kwargs) -> AdaptiveBatchController:
+    controller = AdaptiveBatchController(**kwargs)
+    controller.fetch_min, controller.fetch_max = 50, 1000
+    controller.flush_min, controller.flush_max = 100, 5000
+    controller.target_fetch_latency = 2.0
+    controller.target_commit_latency = 1.0
+    controller.fetch_limit, controller.flush_size = 200, 400
+    return controller
+
+
+def test_initial_values_are_clamped():
+    controller = AdaptiveBatchController(fetch_limit=10 ** 9, flush_size=1)
+
+    assert controller.fetch_limit == controller.fetch_max
+    assert controller.flush_size == controller.flush_min
+
+
+def test_fast_full_page_increases_fetch_limit():
+    controller = _controller()
+    controller.observe_fetch(0.1, 200, 200)
+
+    assert controller.fetch_limit == 250
+    assert controller.decisions[-1]["reason"] == "upstream_fast"
+
+
+def test_slow_upstream_halves_fetch_limit_down_to_min():
+    controller = _controller()
+    for _ in range(5):
+        controller.observe_fetch(10.0, 200, controller.fetch_limit)
+
+    assert controller.fetch_limit == 50
+
+
+def test_short_page_keeps_fetch_limit():
+    """已追平上游时不加大批次"""
+    controller = _controller()
+    controller.observe_fetch(0.1, 20, 200)
+
+    assert controller.fetch_limit == 200
+    assert not controller.decisions
+
+
+def test_decrypt_bound_keeps_fetch_limit():
+    controller = _controller()
+    controller.observe_decrypt(1.0, 100)
+    controller.observe_fetch(0.1, 200, 200)
+
+    assert controller.fetch_limit == 200
+
+
+def test_commit_latency_drives_flush_size():
+    controller = _controller()
+    controller.observe_commit(0.1, 400)
+    assert controller.flush_size == 450
+
+    controller.observe_commit(5.0, 450)
+    assert controller.flush_size == 225
+    assert [d["reason"] for d in controller.decisions] == ["commit_fast", "commit_slow"]
@@ -0,0 +1,133 @@
+"""
+批量消息写入单元测试
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from src.models import MessageType, media_staging, message_staging
+from src.services.bulk_writer import (
+    APPLY_REPLIES_SQL,
+    APPLY_REVOKES_SQL,
+    MEDIA_COLUMNS,
+    MEDIA_STAGING_TABLE,
+    MERGE_MEDIA_SQL,
+    MESSAGE_COLUMNS,
+    MESSAGE_STAGING_TABLE,
+    BulkMessageWriter,
+)
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeConnection:
+    """MERGE 只返回 new_msgids 中的消息，模拟 ON CONFLICT DO NOTHING"""
+
+    def __init__(self, new_msgids):
+        self.new_msgids = new_msgids
+        self.copies = []
+        self.executed = []
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copies.append((table, list(records)))
+
+    async def fetch(self, sql, batch_id):
+        staged = [record[2] for table, records in self.copies if table == MESSAGE_STAGING_TABLE
+                  for record in records]
+        return [{"msgid": msgid} for msgid in staged if msgid in self.new_msgids]
+
+    async def execute(self, sql, *args):
+        self.executed.append((sql, args))
+
+
+def _message(msgid, **fields):
+    message = {
+        "seq": 1, "msgid": msgid, "roomid": "r1", "msgtype": MessageType.TEXT, "msgtime": T0,
+        "from_user": "alice", "to_users": ["bob"], "content": "hi", "media_data": None,
+        "raw_data": '{"msgid": "%s"}' % msgid, "reply_to_msgid": None, "revoke_target": None,
+    }
+    message.update(fields)
+    return message
+
+
+def _media(msgid):
+    return {
+        "msgid": msgid, "file_type": "image", "file_name": None, "original_filename": None,
+        "file_size": 10, "file_extension": "jpg", "md5": "a" * 32, "metadata": {"sdkfileid": "x"},
+    }
+
+
+def _writer():
+    return BulkMessageWriter(session_maker=None, corp_id="corp")
+
+
+@pytest.mark.asyncio
+async def test_merge_copies_rows_and_returns_new_msgids():
+    writer = _writer()
+    conn = FakeConnection({"m1"})
+
+    inserted = await writer._merge_batch(conn, [_message("m1"), _message("m2")], [])
+
+    assert inserted == ["m1"]
+    (table, records), = conn.copies
+    assert table == MESSAGE_STAGING_TABLE
+    assert records[0][4:] == ("TEXT", T0, "alice", ["bob"], "hi", "null", '{"msgid": "m1"}')
+
+
+@pytest.mark.asyncio
+async def test_merge_runs_no_ddl():
+    """暂存表随 schema 创建，写入时不执行 DDL"""
+    conn = FakeConnection(set())
+
+    await _writer()._merge_batch(conn, [_message("m1")], [])
+
+    assert not any(sql.lstrip().upper().startswith(("CREATE", "ALTER")) for sql, _ in conn.executed)
+
+
+def test_staging_tables_are_unlogged_with_copy_columns():
+    for table, columns in ((message_staging, MESSAGE_COLUMNS), (media_staging, MEDIA_COLUMNS)):
+        assert str(CreateTable(table).compile(dialect=postgresql.dialect())).lstrip().startswith("CREATE UNLOGGED TABLE")
+        assert tuple(table.columns.keys()) == columns
+
+
+@pytest.mark.asyncio
+async def test_media_merged_only_for_new_messages():
+    conn = FakeConnection({"m1"})
+    await _writer()._merge_batch(conn, [_message("m1"), _message("m2")], [_media("m1"), _media("m2")])
+
+    assert [table for table, _ in conn.copies] == [MESSAGE_STAGING_TABLE, MEDIA_STAGING_TABLE]
+    merge_args = next(args for sql, args in conn.executed if sql == MERGE_MEDIA_SQL)
+    assert merge_args[1] == ["m1"]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_batch_skips_media():
+    conn = FakeConnection(set())
+    await _writer()._merge_batch(conn, [_message("m1")], [_media("m1")])
+
+    assert [table for table, _ in conn.copies] == [MESSAGE_STAGING_TABLE]
+
+
+@pytest.mark.asyncio
+async def test_references_applied_only_for_inserted_messages():
+    conn = FakeConnection(set())
+    messages = [
+        _message("m2", reply_to_msgid="m1"),
+        _message("m3", reply_to_msgid="m1"),
+        _message("m4", msgtype=MessageType.REVOKE, revoke_target="m1"),
+    ]
+
+    await BulkMessageWriter._apply_references(conn, messages, ["m2", "m4"])
+
+    calls = dict(conn.executed)
+    assert calls[APPLY_REPLIES_SQL] == (["m2"], ["m1"])
+    assert calls[APPLY_REVOKES_SQL] == (["m1"], ["m4"], [T0])
+
+
+def test_counter_deltas_skip_duplicates():
+    deltas = BulkMessageWriter._counter_deltas([_message("m1"), _message("m2")], ["m2"])
+
+    assert deltas.members == {("r1", "alice"): [1, T0]}
@@ -0,0 +1,177 @@
+"""
+多企业同步扇出单元测试
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.models import SyncTask, TaskStatus
+from src.services import corp_fanout as corp_fanout_module
+from src.services import task_progress as task_progress_module
+from src.services.corp_fanout import CorpSyncFanout
+from src.services.task_progress import TaskProgress, read_progress
+
+NOW = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+
+class FakeResult:
+    def __init__(self, values):
+        self.values = values
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.values
+
+
+class FakeSession:
+    """execute 依次返回 results 中的结果"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.commits = 0
+
+    async def execute(self, statement):
+        return FakeResult(self.results.pop(0))
+
+    async def commit(self):
+        self.commits += 1
+
+
+class FakeSyncService:
+    def __init__(self):
+        self.tasks = {}
+
+    async def create_sync_task(self, task_type="sync_messages", corp_id=None, metadata=None, dispatch=True):
+        task = SyncTask(
+            task_id=f"t{len(self.tasks)}", task_type=task_type, status=TaskStatus.PENDING.value,
+            metadata={**(metadata or {}), "owner_corpid": corp_id},
+        )
+        self.tasks[task.task_id] = task
+        return task
+
+    async def get_task_by_id(self, task_id):
+        return self.tasks.get(task_id)
+
+
+async def _async(value):
+    return value
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(server=FakeServer())
+    monkeypatch.setattr(task_progress_module, "get_redis", lambda: client)
+    return client
+
+
+def _fanout(*results):
+    fanout = CorpSyncFanout(FakeSession(*results))
+    fanout.sync_service = FakeSyncService()
+    fanout.stale_after = 1800
+    return fanout
+
+
+def _lane(task_id, corp_id, status, updated_at=NOW, inserted=0, elapsed=0):
+    return SyncTask(
+        task_id=task_id, task_type="sync_messages", status=status, updated_at=updated_at,
+        metadata={"owner_corpid": corp_id, "parent_task_id": "p",
+                  "pipeline": {"inserted": inserted, "elapsed_seconds": elapsed}},
+    )
+
+
+@pytest.mark.parametrize("workers, corps, expected", [(8, 2, 4), (8, 3, 2), (2, 4, 1), (0, 1, 1)])
+def test_split_decrypt_budget(workers, corps, expected):
+    assert CorpSyncFanout.split_decrypt_budget(workers, corps) == expected
+
+
+@pytest.mark.asyncio
+async def test_dispatch_creates_one_lane_per_corp_with_budget(monkeypatch):
+    dispatched = []
+    monkeypatch.setattr(corp_fanout_module, "chord",
+                        lambda header: lambda callback: dispatched.append((list(header), callback)))
+    fanout = _fanout()
+    fanout.get_corp_ids = lambda: _async(["corp-a", "corp-b"])
+    monkeypatch.setattr(corp_fanout_module.get_settings(), "decrypt_workers", 6)
+
+    parent = await fanout.dispatch()
+
+    lanes = [task for task in fanout.sync_service.tasks.values() if task is not parent]
+    assert (parent.task_type, parent.status, parent.total_count) == ("sync_fanout", TaskStatus.RUNNING.value, 2)
+    assert [lane.metadata["owner_corpid"] for lane in lanes] == ["corp-a", "corp-b"]
+    assert {lane.metadata["decrypt_budget"] for lane in lanes} == {3}
+    assert {lane.metadata["parent_task_id"] for lane in lanes} == {parent.task_id}
+    (header, callback), = dispatched
+    assert len(header) == 2 and callback.args == (parent.task_id,)
+
+
+@pytest.mark.asyncio
+async def test_summarize_aggregates_lanes():
+    fanout = _fanout()
+    parent = await fanout.sync_service.create_sync_task(task_type="sync_fanout")
+    lanes = [
+        {"corp_id": "corp-a", "status": TaskStatus.COMPLETED.value, "inserted": 10},
+        {"corp_id": "corp-b", "status": TaskStatus.FAILED.value, "inserted": 0},
+        None,
+    ]
+
+    await fanout.summarize(parent.task_id, lanes)
+
+    assert parent.status == TaskStatus.COMPLETED.value
+    assert (parent.progress, parent.success_count, parent.error_count) == (2, 1, 1)
+    assert set(parent.metadata["corps"]) == {"corp-a", "corp-b"}
+
+
+@pytest.mark.asyncio
+async def test_stale_lane_failed_and_cancelled(redis):
+    """没有进度的通道记为失败并发布取消；最近有 Redis 进度上报的通道保持运行"""
+    fanout = _fanout()
+    stale = _lane("l1", "corp-a", TaskStatus.RUNNING.value, updated_at=NOW - timedelta(hours=1))
+    reporting = _lane("l2", "corp-b", TaskStatus.RUNNING.value, updated_at=NOW - timedelta(hours=1))
+    done = _lane("l3", "corp-c", TaskStatus.COMPLETED.value, updated_at=NOW - timedelta(hours=1))
+    await TaskProgress("l2").report({"progress": 1, "total_count": 1, "success_count": 1, "error_count": 0})
+
+    await fanout._fail_stale_lanes([stale, reporting, done], now=(await read_progress("l2"))["updated_at"])
+
+    assert [lane.status for lane in (stale, reporting, done)] == [
+        TaskStatus.FAILED.value, TaskStatus.RUNNING.value, TaskStatus.COMPLETED.value
+    ]
+    assert await TaskProgress("l1").report(dict.fromkeys(task_progress_module.PROGRESS_FIELDS, 0)) == "cancelled"
+
+
+@pytest.mark.asyncio
+async def test_check_running_summarizes_from_lane_rows_when_callback_lost(redis):
+    """chord 回调丢失时，通道全部结束后由定时检查从子任务行汇总"""
+    fanout = _fanout(["p"])
+    parent = SyncTask(task_id="p", task_type="sync_fanout", status=TaskStatus.RUNNING.value, metadata={})
+    fanout.sync_service.tasks["p"] = parent
+    lanes = [
+        _lane("l1", "corp-a", TaskStatus.COMPLETED.value, inserted=100, elapsed=10),
+        _lane("l2", "corp-b", TaskStatus.RUNNING.value, updated_at=NOW - timedelta(days=1)),
+    ]
+    fanout.get_lanes = lambda parent_task_id: _async(lanes)
+
+    assert await fanout.check_running() == 1
+
+    assert parent.status == TaskStatus.COMPLETED.value
+    assert (parent.success_count, parent.error_count) == (1, 1)
+    assert parent.metadata["corps"]["corp-a"]["messages_per_second"] == 10
+    assert parent.metadata["corps"]["corp-b"]["status"] == TaskStatus.FAILED.value
+
+
+@pytest.mark.asyncio
+async def test_check_running_leaves_active_fanout_running(redis):
+    fanout = _fanout(["p"])
+    parent = SyncTask(task_id="p", task_type="sync_fanout", status=TaskStatus.RUNNING.value, metadata={})
+    fanout.sync_service.tasks["p"] = parent
+    lanes = [_lane("l1", "corp-a", TaskStatus.RUNNING.value, updated_at=datetime.now(timezone.utc))]
+    fanout.get_lanes = lambda parent_task_id: _async(lanes)
+
+    await fanout.check_running()
+
+    assert parent.status == TaskStatus.RUNNING.value
+    assert lanes[0].status == TaskStatus.RUNNING.value
@@ -0,0 +1,80 @@
+"""
+冗余计数增量单元测试
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.services.counters import APPLY_GROUP_COUNTERS_SQL, APPLY_MEMBER_COUNTERS_SQL, CounterDeltas
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeConnection:
+    """只更新 members 中已有的 (roomid, userid)，与 UPDATE ... FROM unnest 的行为一致"""
+
+    def __init__(self, members=()):
+        self.members = set(members)
+        self.calls = []
+
+    async def fetch(self, sql, *args):
+        self.calls.append((sql, args))
+        return [
+            {"roomid": roomid, "userid": userid}
+            for roomid, userid in zip(args[0], args[1])
+            if (roomid, userid) in self.members
+        ]
+
+    async def execute(self, sql, *args):
+        self.calls.append((sql, args))
+
+
+def test_messages_aggregate_per_member():
+    deltas = CounterDeltas()
+    deltas.add_message("r1", "alice", T0 + timedelta(minutes=5))
+    deltas.add_message("r1", "alice", T0)
+    deltas.add_message("r1", "bob", T0)
+    deltas.add_message("r1", None, T0)
+
+    assert deltas.members == {
+        ("r1", "alice"): [2, T0 + timedelta(minutes=5)],
+        ("r1", "bob"): [1, T0],
+    }
+
+
+def test_group_deltas_cancel_out():
+    deltas = CounterDeltas()
+    deltas.add_group_members("r1", 2)
+    deltas.add_group_members("r1", -2)
+    deltas.add_group_members("r2", 0)
+
+    assert deltas.groups == {"r1": 0}
+
+
+@pytest.mark.asyncio
+async def test_apply_sorts_keys_and_skips_empty_group_deltas():
+    deltas = CounterDeltas()
+    deltas.add_message("r2", "bob", T0)
+    deltas.add_message("r1", "alice", T0)
+    deltas.add_group_members("r1", 0)
+    deltas.add_group_members("r2", 1)
+    conn = FakeConnection({("r1", "alice"), ("r2", "bob")})
+
+    assert await deltas.apply(conn) == 0
+    (member_sql, member_args), (group_sql, group_args) = conn.calls
+    assert member_sql == APPLY_MEMBER_COUNTERS_SQL
+    assert member_args[:3] == (["r1", "r2"], ["alice", "bob"], [1, 1])
+    assert group_sql == APPLY_GROUP_COUNTERS_SQL
+    assert group_args == (["r2"], [1])
+
+
+@pytest.mark.asyncio
+async def test_deltas_without_member_rows_are_dropped_and_counted():
+    """外部联系人等没有成员行的发言人不会新建成员行，增量被丢弃并计数"""
+    deltas = CounterDeltas()
+    deltas.add_message("r1", "alice", T0)
+    deltas.add_message("r1", "wo_external", T0)
+    deltas.add_message("r1", "wo_external", T0)
+
+    assert await deltas.apply(FakeConnection({("r1", "alice")})) == 1
@@ -0,0 +1,137 @@
+"""
+会话存档解密单元测试
+"""
+
+import base64
+import os
+import struct
+
+import pytest
+from Crypto.Cipher import AES, PKCS1_v1_5
+from Crypto.PublicKey import RSA
+
+from src.config import Settings
+from src.services.decrypt_executor import DecryptExecutor
+from src.services.decryptor import ChatDataDecryptor, DecryptError, DecryptKeyError
+
+AES_KEY = base64.b64encode(os.urandom(32)).decode().rstrip("=")
+
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    return RSA.generate(1024)
+
+
+@pytest.fixture
+def key_dir(tmp_path, rsa_key):
+    (tmp_path / "v1.pem").write_bytes(rsa_key.export_key())
+    return str(tmp_path)
+
+
+def _encrypt_entry(rsa_key, seq: int, plaintext: bytes, version: int = 1) -> dict:
+    random_key = os.urandom(16).hex().encode()
+    pad = 32 - len(plaintext) % 32
+    body = AES.new(random_key, AES.MODE_CBC, random_key[:16]).encrypt(plaintext + bytes([pad]) * pad)
+    return {
+        "seq": seq,
+        "publickey_ver": version,
+        "encrypt_random_key": base64.b64encode(PKCS1_v1_5.new(rsa_key.publickey()).encrypt(random_key)).decode(),
+        "encrypt_chat_msg": base64.b64encode(body).decode(),
+    }
+
+
+def _encrypt_callback_entry(aes_key: str, seq: int, plaintext: bytes) -> dict:
+    key = base64.b64decode(aes_key + "=")
+    content = os.urandom(16) + struct.pack(">I", len(plaintext)) + plaintext + b"wwcorp"
+    pad = 32 - len(content) % 32
+    body = AES.new(key, AES.MODE_CBC, key[:16]).encrypt(content + bytes([pad]) * pad)
+    return {"seq": seq, "encrypt_chat_msg": base64.b64encode(body).decode()}
+
+
+def test_decrypt_batch_returns_raw_bytes(rsa_key, key_dir):
+    decryptor = ChatDataDecryptor(key_path=key_dir, encoding_aes_key=AES_KEY)
+    entries = [_encrypt_entry(rsa_key, seq, b'{"msgid": "m%d"}' % seq) for seq in (1, 2)]
+
+    assert decryptor.decrypt_batch(entries) == [(1, b'{"msgid": "m1"}'), (2, b'{"msgid": "m2"}')]
+
+
+def test_corrupt_entry_is_skipped(rsa_key, key_dir):
+    """单条数据损坏只跳过该条"""
+    decryptor = ChatDataDecryptor(key_path=key_dir, encoding_aes_key=AES_KEY)
+    broken = _encrypt_entry(rsa_key, 2, b"{}")
+    broken["encrypt_random_key"] = base64.b64encode(b"garbage" * 18).decode()
+    entries = [_encrypt_entry(rsa_key, 1, b"{}"), broken, _encrypt_entry(rsa_key, 3, b"{}")]
+
+    assert [seq for seq, _ in decryptor.decrypt_batch(entries)] == [1, 3]
+
+
+def test_missing_private_key_fails_batch(rsa_key, key_dir):
+    """未知 publickey_ver 属于配置错误，整批失败而不是丢弃消息"""
+    decryptor = ChatDataDecryptor(key_path=key_dir, encoding_aes_key=AES_KEY)
+    entries = [_encrypt_entry(rsa_key, 1, b"{}"), _encrypt_entry(rsa_key, 2, b"{}", version=2)]
+
+    with pytest.raises(DecryptKeyError):
+        decryptor.decrypt_batch(entries)
+
+
+def test_invalid_private_key_fails_batch(rsa_key, tmp_path):
+    (tmp_path / "v1.pem").write_text("not a key")
+    decryptor = ChatDataDecryptor(key_path=str(tmp_path), encoding_aes_key=AES_KEY)
+
+    with pytest.raises(DecryptKeyError):
+        decryptor.decrypt_batch([_encrypt_entry(rsa_key, 1, b"{}")])
+
+
+def test_key_error_is_decrypt_error():
+    assert issubclass(DecryptKeyError, DecryptError)
+
+
+def test_callback_format_uses_corp_aes_key():
+    decryptor = ChatDataDecryptor(key_path="/nonexistent", encoding_aes_key=AES_KEY)
+
+    assert decryptor.decrypt_batch([_encrypt_callback_entry(AES_KEY, 1, b"{}")]) == [(1, b"{}")]
+
+
+def test_callback_format_without_aes_key_fails_batch():
+    """额外企业未配置 EncodingAESKey 时不能退回到主企业的密钥"""
+    decryptor = ChatDataDecryptor(key_path="/nonexistent")
+
+    with pytest.raises(DecryptKeyError):
+        decryptor.decrypt_batch([_encrypt_callback_entry(AES_KEY, 1, b"{}")])
+
+
+def test_settings_resolve_aes_key_per_corp():
+    settings = Settings(
+        corp_id="main", secret="s", encoding_aes_key="main-key", database_url="postgresql://db/x",
+        extra_corp_accounts="other:s2,third:s3", extra_corp_aes_keys="other:other-key",
+    )
+
+    assert settings.get_encoding_aes_key("main") == "main-key"
+    assert settings.get_encoding_aes_key("other") == "other-key"
+    assert settings.get_encoding_aes_key("third") is None
+
+
+@pytest.mark.asyncio
+async def test_executor_uses_aes_key_passed_per_batch():
+    other_key = base64.b64encode(os.urandom(32)).decode().rstrip("=")
+    executor = DecryptExecutor(max_workers=1)
+    try:
+        for aes_key in (AES_KEY, other_key):
+            entries = [_encrypt_callback_entry(aes_key, 1, b"{}")]
+            assert await executor.decrypt_batch(entries, "/nonexistent", aes_key) == [(1, b"{}")]
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_executor_propagates_key_error(rsa_key, key_dir):
+    """子进程中的密钥错误原样抛回调用方"""
+    executor = DecryptExecutor(max_workers=1)
+    try:
+        decrypted = await executor.decrypt_batch([_encrypt_entry(rsa_key, 1, b"{}")], key_dir)
+        assert decrypted == [(1, b"{}")]
+
+        with pytest.raises(DecryptKeyError):
+            await executor.decrypt_batch([_encrypt_entry(rsa_key, 2, b"{}", version=9)], key_dir)
+    finally:
+        executor.shutdown()
@@ -0,0 +1,80 @@
+"""
+共享上游 HTTP 客户端单元测试
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from src.services import http_client as http_client_module
+from src.services.http_client import SharedHTTPClient, close_http_clients, get_http_client
+
+BASE_URL = "https://qyapi.example.com"
+
+
+def _client(handler) -> SharedHTTPClient:
+    client = SharedHTTPClient(BASE_URL)
+    client.request_timeout = 10
+    client._client = httpx.AsyncClient(base_url=BASE_URL, transport=httpx.MockTransport(handler))
+    return client
+
+
+@pytest.mark.asyncio
+async def test_timeout_scaled_per_endpoint():
+    seen = {}
+
+    def handler(request):
+        seen[request.url.path] = request.extensions["timeout"]
+        return httpx.Response(200, json={"errcode": 0})
+
+    client = _client(handler)
+    await client.request("GET", "/cgi-bin/gettoken")
+    await client.request("POST", "/cgi-bin/msgaudit/getmediadata")
+
+    assert seen["/cgi-bin/gettoken"]["read"] == 5
+    assert seen["/cgi-bin/msgaudit/getmediadata"]["read"] == 20
+    assert seen["/cgi-bin/msgaudit/getmediadata"]["connect"] == http_client_module.CONNECT_TIMEOUT
+
+
+@pytest.mark.asyncio
+async def test_concurrency_capped_per_endpoint():
+    """gettoken 并发上限为 4，其他接口的请求不受其占用影响"""
+    active = {"/cgi-bin/gettoken": 0, "/cgi-bin/msgaudit/getchatdata": 0}
+    peak = dict(active)
+
+    async def handler(request):
+        path = request.url.path
+        active[path] += 1
+        peak[path] = max(peak[path], active[path])
+        await asyncio.sleep(0.01)
+        active[path] -= 1
+        return httpx.Response(200)
+
+    client = _client(handler)
+    await asyncio.gather(
+        *(client.request("GET", "/cgi-bin/gettoken") for _ in range(10)),
+        *(client.request("POST", "/cgi-bin/msgaudit/getchatdata") for _ in range(10)),
+    )
+
+    assert peak == {"/cgi-bin/gettoken": 4, "/cgi-bin/msgaudit/getchatdata": 8}
+
+
+@pytest.mark.asyncio
+async def test_transport_errors_propagate():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    with pytest.raises(httpx.ConnectError):
+        await _client(handler).request("GET", "/cgi-bin/gettoken")
+
+
+@pytest.mark.asyncio
+async def test_clients_shared_per_base_url():
+    first = get_http_client(BASE_URL)
+
+    assert get_http_client(BASE_URL) is first
+    assert get_http_client(BASE_URL + "/other") is not first
+    await close_http_clients()
+    assert get_http_client(BASE_URL) is not first
+    await close_http_clients()
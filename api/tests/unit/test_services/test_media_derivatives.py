@@ -0,0 +1,74 @@
+"""
+媒体衍生图单元测试
+"""
+
+import os
+
+import pytest
+
+from src.services.media_derivatives import _evict, _render
+
+
+def _cache_file(root, name, size, mtime):
+    path = root / name[:2] / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evict_under_limit_keeps_everything(tmp_path):
+    _cache_file(tmp_path, "aa_thumbnail.jpg", 40, 100)
+    _cache_file(tmp_path, "bb_thumbnail.jpg", 40, 200)
+
+    assert _evict(str(tmp_path), 100) == (80, 0)
+
+
+def test_evict_removes_oldest_down_to_target(tmp_path):
+    """超过上限时按 mtime 从旧到新删除，直到不超过上限的 90%"""
+    oldest = _cache_file(tmp_path, "aa_preview.jpg", 40, 100)
+    older = _cache_file(tmp_path, "bb_preview.jpg", 40, 200)
+    newest = _cache_file(tmp_path, "cc_preview.jpg", 40, 300)
+
+    assert _evict(str(tmp_path), 100) == (80, 1)
+    assert not oldest.exists()
+    assert older.exists() and newest.exists()
+
+
+def test_evict_large_overshoot(tmp_path):
+    for index in range(10):
+        _cache_file(tmp_path, f"{index:02d}_thumbnail.jpg", 20, 100 + index)
+
+    total, evicted = _evict(str(tmp_path), 100)
+
+    assert (total, evicted) == (80, 6)
+    remaining = sorted(name for _, _, files in os.walk(tmp_path) for name in files)
+    assert remaining == [f"{index:02d}_thumbnail.jpg" for index in range(6, 10)]
+
+
+def test_render_failure_leaves_no_temp_file(tmp_path):
+    pytest.importorskip("PIL")
+    source = tmp_path / "broken.jpg"
+    source.write_bytes(b"not an image")
+    target = tmp_path / "derivatives" / "ab" / "ab_thumbnail.jpg"
+
+    with pytest.raises(OSError):
+        _render(str(source), 0, None, str(target), 64)
+
+    assert os.listdir(target.parent) == []
+
+
+def test_render_from_pack_segment(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    image_path = tmp_path / "image.png"
+    Image.new("RGBA", (200, 100), (255, 0, 0, 128)).save(image_path)
+    pack = tmp_path / "seg-000001.pack"
+    pack.write_bytes(b"prefix" + image_path.read_bytes() + b"suffix")
+    target = tmp_path / "derivatives" / "ab" / "ab_thumbnail.jpg"
+
+    size = _render(str(pack), len(b"prefix"), image_path.stat().st_size, str(target), 64)
+
+    assert size == target.stat().st_size
+    with Image.open(target) as rendered:
+        assert (rendered.format, rendered.size) == ("JPEG", (64, 32))
+    assert os.listdir(target.parent) == ["ab_thumbnail.jpg"]
@@ -0,0 +1,60 @@
+"""
+媒体断点续传下载单元测试
+"""
+
+import pytest
+
+from src.models import DownloadStatus
+from src.services.media_downloader import MediaDownloader
+
+
+def _media(**fields):
+    media = {
+        "id": 1, "file_type": "image", "file_size": 10, "file_extension": "jpg", "md5": "a" * 32,
+        "metadata": {"download": {"offset": 0}}, "created_at": None, "download_attempts": 1,
+        "owner_corpid": "corp",
+    }
+    media.update(fields)
+    return media
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    downloader = MediaDownloader(session_maker=None)
+    downloader.enabled = True
+    downloader.storage_path = str(tmp_path)
+    downloader.failures = []
+
+    async def claim(media_id):
+        return _media(id=media_id)
+
+    async def fail(media_id, error, progress):
+        downloader.failures.append((media_id, error))
+
+    downloader._claim = claim
+    downloader._fail = fail
+    return downloader
+
+
+@pytest.mark.asyncio
+async def test_dedup_error_marks_claimed_row_failed(downloader):
+    """引用已有内容时出错，已领取的行要标记失败，不能停在 DOWNLOADING"""
+    async def link_existing(media):
+        raise RuntimeError("lock timeout")
+
+    downloader._link_existing = link_existing
+
+    assert await downloader.download(1) == DownloadStatus.FAILED.value
+    assert downloader.failures == [(1, "lock timeout")]
+
+
+@pytest.mark.asyncio
+async def test_dedup_hit_completes_without_upstream(downloader):
+    async def link_existing(media):
+        return "/media/aa/aaaa"
+
+    downloader._link_existing = link_existing
+    downloader.accounts = {}
+
+    assert await downloader.download(1) == DownloadStatus.COMPLETED.value
+    assert downloader.failures == []
@@ -0,0 +1,158 @@
+"""
+媒体完整性校验单元测试
+"""
+
+import hashlib
+import mmap
+import os
+from types import SimpleNamespace
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.services import media_integrity as media_integrity_module
+from src.services.media_integrity import (
+    CURSOR_KEY,
+    MAX_MEDIA_ID_SQL,
+    RESULT_OK,
+    MediaIntegrityScanner,
+    _hash_region,
+    _Throttle,
+)
+
+GRANULARITY = mmap.ALLOCATIONGRANULARITY
+CONTENT = os.urandom(GRANULARITY * 3 + 123)
+
+
+def _md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+@pytest.fixture
+def pack(tmp_path):
+    path = tmp_path / "seg-000001.pack"
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+@pytest.mark.parametrize("offset, length", [
+    (0, None),
+    (0, len(CONTENT)),
+    (1, 10),
+    (GRANULARITY, GRANULARITY),
+    (GRANULARITY - 1, 2),
+    (GRANULARITY * 2 + 7, GRANULARITY + 100),
+    (len(CONTENT) - 5, None),
+])
+def test_hash_region_handles_unaligned_offsets(pack, offset, length):
+    """mmap 偏移按分配粒度向下对齐，哈希的仍是 [offset, offset + length)"""
+    end = len(CONTENT) if length is None else offset + length
+
+    assert _hash_region(pack, offset, length, _Throttle(0)) == _md5(CONTENT[offset:end])
+
+
+def test_hash_region_small_chunks(pack, monkeypatch):
+    monkeypatch.setattr(media_integrity_module, "HASH_CHUNK_SIZE", 1000)
+    throttle = _Throttle(0)
+
+    assert _hash_region(pack, 5, GRANULARITY * 2, throttle) == _md5(CONTENT[5:5 + GRANULARITY * 2])
+    assert throttle.consumed == GRANULARITY * 2
+
+
+def test_hash_region_empty_and_out_of_range(pack, tmp_path):
+    assert _hash_region(pack, 10, 0, _Throttle(0)) == _md5(b"")
+    assert _hash_region(pack, len(CONTENT) - 5, 6, _Throttle(0)) is None
+    assert _hash_region(pack, len(CONTENT) + 1, None, _Throttle(0)) is None
+    assert _hash_region(str(tmp_path / "missing"), 0, None, _Throttle(0)) is None
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def scalar(self, sql, params=None):
+        assert sql is MAX_MEDIA_ID_SQL
+        return self.rows[-1].id
+
+    async def execute(self, sql, params):
+        rows = [row for row in self.rows if row.id > params["after"]][:params["limit"]]
+        return SimpleNamespace(all=lambda: rows)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(media_integrity_module.time, "monotonic", fake.monotonic)
+    return fake
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(server=FakeServer())
+    monkeypatch.setattr(media_integrity_module, "get_redis", lambda: client)
+    return client
+
+
+def _scanner(rows, clock, seconds_per_file):
+    scanner = MediaIntegrityScanner(session_maker=lambda: FakeSession(rows))
+    scanner.batch_size = 10
+    scanner.max_seconds = 10
+    scanner.verified = []
+
+    def verify(path, offset, length, md5, throttle):
+        scanner.verified.append(path)
+        clock.now += seconds_per_file
+        return RESULT_OK
+
+    scanner._verify = verify
+    return scanner
+
+
+def _rows(count):
+    return [
+        SimpleNamespace(id=i, md5="0" * 32, local_path=f"/media/{i}", metadata=None)
+        for i in range(1, count + 1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_deadline_checked_per_row_and_cursor_at_last_verified(clock, redis):
+    """批内超时即停止，游标停在最后校验的一行而不是批末尾"""
+    scanner = _scanner(_rows(8), clock, seconds_per_file=4)
+
+    result = await scanner._scan()
+
+    assert scanner.verified == ["/media/1", "/media/2", "/media/3"]
+    assert result["cursor"] == 3
+    assert int(await redis.get(CURSOR_KEY)) == 3
+
+    clock.now = 100.0
+    scanner.verified.clear()
+    await scanner._scan()
+    assert scanner.verified == ["/media/4", "/media/5", "/media/6"]
+
+
+@pytest.mark.asyncio
+async def test_full_pass_resets_cursor(clock, redis):
+    scanner = _scanner(_rows(3), clock, seconds_per_file=1)
+
+    result = await scanner._scan()
+
+    assert result["cursor"] == 0
+    assert result[RESULT_OK] == 3
+    assert int(await redis.get(CURSOR_KEY)) == 0
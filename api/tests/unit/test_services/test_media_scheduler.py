@@ -0,0 +1,73 @@
+"""
+媒体下载调度单元测试
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from src.services.media_scheduler import MediaDownloadScheduler
+
+NOW = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+WEIGHTS = {"image": 0.0, "video": 3.0}
+
+
+def _rows(*sizes):
+    return [{"id": index, "file_type": "image", "file_size": size} for index, size in enumerate(sizes, 1)]
+
+
+def _ids(chosen):
+    return [row["id"] for row in chosen]
+
+
+def test_select_keeps_priority_order_within_file_limit():
+    chosen = MediaDownloadScheduler._select(_rows(1, 1, 1, 1), free_files=2, free_bytes=100, idle=False)
+
+    assert _ids(chosen) == [1, 2]
+
+
+def test_select_skips_files_over_byte_budget():
+    """字节预算不够时跳过大文件，继续挑选后面的小文件"""
+    chosen = MediaDownloadScheduler._select(_rows(60, 50, 30, 20), free_files=10, free_bytes=100, idle=False)
+
+    assert _ids(chosen) == [1, 3]
+
+
+def test_oversized_file_runs_alone_when_idle():
+    chosen = MediaDownloadScheduler._select(_rows(500, 10, 10), free_files=3, free_bytes=100, idle=True)
+
+    assert _ids(chosen) == [1]
+
+
+def test_oversized_file_waits_while_others_are_in_flight():
+    chosen = MediaDownloadScheduler._select(_rows(500, 10), free_files=3, free_bytes=100, idle=False)
+
+    assert _ids(chosen) == [2]
+
+
+def test_oversized_file_not_first_waits_even_when_idle():
+    chosen = MediaDownloadScheduler._select(_rows(10, 500), free_files=3, free_bytes=100, idle=True)
+
+    assert _ids(chosen) == [1]
+
+
+def _candidate(id, file_type="image", mb=0, hours_ago=0):
+    return {"id": id, "file_type": file_type, "file_size": mb * 1048576, "msgtime": NOW - timedelta(hours=hours_ago)}
+
+
+def test_rank_prefers_recent_small_images():
+    """新消息的小图片最先，一个月前的图片排在 50MB 视频之前"""
+    candidates = [
+        _candidate(1, "video", mb=50),
+        _candidate(2, hours_ago=24 * 30),
+        _candidate(3, mb=1),
+        _candidate(4, "file"),
+    ]
+
+    ranked = MediaDownloadScheduler._rank(candidates, WEIGHTS, 1.0, NOW)
+
+    assert _ids(ranked) == [3, 4, 2, 1]
+
+
+def test_rank_ties_broken_by_id_and_naive_msgtime_treated_as_utc():
+    candidates = [_candidate(2), {**_candidate(1), "msgtime": NOW.replace(tzinfo=None)}]
+
+    assert _ids(MediaDownloadScheduler._rank(candidates, WEIGHTS, 1.0, NOW)) == [1, 2]
@@ -0,0 +1,134 @@
+"""
+媒体文件下载响应单元测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+
+from src.services.media_serving import (
+    RangeFileResponse,
+    RangeNotSatisfiable,
+    _etag_matches,
+    build_media_response,
+    parse_range,
+)
+
+CONTENT = bytes(range(256)) * 4
+MD5 = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=1000-", (1000, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=-24", (1000, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=10-5", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1024)
+
+
+def test_weak_comparison_for_if_none_match():
+    assert _etag_matches('"a", W/"b"', '"b"')
+    assert _etag_matches('"b"', 'W/"b"')
+    assert _etag_matches("*", '"b"')
+    assert not _etag_matches('"c"', '"b"')
+
+
+def test_strong_comparison_for_if_range():
+    """If-Range 使用强比较：任一方是弱 ETag 都不匹配"""
+    assert _etag_matches('"b"', '"b"', strong=True)
+    assert not _etag_matches('W/"b"', '"b"', strong=True)
+    assert not _etag_matches('"b"', 'W/"b"', strong=True)
+    assert not _etag_matches('W/"b"', 'W/"b"', strong=True)
+    assert not _etag_matches("*", '"b"', strong=True)
+
+
+def _scope(headers=None, method="GET", extensions=None):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": "/media/1",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    if extensions is not None:
+        scope["extensions"] = extensions
+    return scope
+
+
+async def _send_response(response, scope):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await response(scope, None, send)
+    return messages
+
+
+@pytest.fixture
+def media_path(tmp_path):
+    path = tmp_path / "blob"
+    path.write_bytes(CONTENT)
+    return str(path)
+
+
+def _media(md5=MD5):
+    return SimpleNamespace(
+        id=1, md5=md5, mime_type="image/jpeg", original_filename=None, file_name="a.jpg", file_extension="jpg"
+    )
+
+
+@pytest.mark.parametrize("if_range, status", [(f'"{MD5}"', 206), (f'W/"{MD5}"', 200), ('"other"', 200)])
+def test_if_range_requires_strong_match(media_path, if_range, status):
+    request = Request(_scope({"Range": "bytes=0-9", "If-Range": if_range}))
+
+    assert build_media_response(request, _media(), media_path).status_code == status
+
+
+def test_if_range_never_matches_weak_etag(media_path):
+    """没有 md5 时 ETag 是弱的，带 If-Range 的 Range 请求返回整个文件"""
+    request = Request(_scope({"Range": "bytes=0-9", "If-Range": 'W/"1-1024"'}))
+
+    assert build_media_response(request, _media(md5=None), media_path).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_range_response_streams_with_pread(media_path):
+    response = RangeFileResponse(media_path, 100, 300)
+    messages = await _send_response(response, _scope())
+
+    assert b"".join(m["body"] for m in messages[1:]) == CONTENT[100:400]
+    assert messages[-1]["more_body"] is False
+
+
+@pytest.mark.asyncio
+async def test_range_response_uses_zerocopy_extension(media_path):
+    response = RangeFileResponse(media_path, 100, 300)
+    messages = await _send_response(response, _scope(extensions={"http.response.zerocopy": {}}))
+
+    assert messages[1]["type"] == "http.response.zerocopy"
+    assert (messages[1]["offset"], messages[1]["count"]) == (100, 300)
+
+
+@pytest.mark.asyncio
+async def test_pathsend_only_for_whole_file(media_path):
+    extensions = {"http.response.pathsend": {}}
+
+    whole = await _send_response(RangeFileResponse(media_path, 0, len(CONTENT)), _scope(extensions=extensions))
+    part = await _send_response(RangeFileResponse(media_path, 0, 10), _scope(extensions=extensions))
+
+    assert whole[1] == {"type": "http.response.pathsend", "path": media_path}
+    assert part[1]["type"] == "http.response.body" and part[1]["body"] == CONTENT[:10]
@@ -0,0 +1,137 @@
+"""
+内容寻址媒体存储单元测试
+"""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.media_store import (
+    ACQUIRE_BLOB_SQL,
+    COLD_PLACEMENT_SQL,
+    LOCK_BLOB_SQL,
+    STORE_BLOB_SQL,
+    TIER_COLD,
+    MediaStore,
+)
+
+MD5 = "0123456789abcdef0123456789abcdef"
+
+
+class FakeResult:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+
+class FakeSession:
+    """按 SQL 返回预设行，并记录执行顺序"""
+
+    def __init__(self, blob=True, cold=None):
+        self.rows = {
+            LOCK_BLOB_SQL: SimpleNamespace(md5=MD5) if blob else None,
+            COLD_PLACEMENT_SQL: cold,
+            ACQUIRE_BLOB_SQL: SimpleNamespace(file_size=10) if blob else None,
+        }
+        self.executed = []
+
+    async def execute(self, sql, params=None):
+        self.executed.append(sql)
+        return FakeResult(self.rows.get(sql))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(storage_path=str(tmp_path), url_prefix="/api/v1/media/")
+
+
+def _write_hot(store):
+    path = store.blob_path(MD5)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"x" * 10)
+    return path
+
+
+def test_blob_path_and_url(store):
+    assert store.blob_path(MD5.upper()).endswith(os.path.join("blobs", "01", "23", MD5))
+    assert store.media_url(5) == "/api/v1/media/5"
+
+
+@pytest.mark.asyncio
+async def test_acquire_hot_blob_locks_before_checking_file(store):
+    path = _write_hot(store)
+    session = FakeSession()
+
+    assert await store.acquire(session, MD5) == {"file_size": 10, "local_path": path, "storage": None}
+    assert session.executed == [LOCK_BLOB_SQL, COLD_PLACEMENT_SQL, ACQUIRE_BLOB_SQL]
+
+
+@pytest.mark.asyncio
+async def test_acquire_prefers_committed_cold_placement(store):
+    """迁移已提交但热存储文件尚未删除时，引用冷存储位置"""
+    _write_hot(store)
+    storage = {"tier": TIER_COLD, "pack": "/packs/seg-000001.pack", "offset": 0, "length": 10}
+    session = FakeSession(cold=SimpleNamespace(local_path="/old", storage=storage))
+
+    blob = await store.acquire(session, MD5)
+
+    assert blob["storage"] == storage
+    assert blob["local_path"] == "/old"
+
+
+@pytest.mark.asyncio
+async def test_acquire_missing_content_keeps_ref_count(store):
+    session = FakeSession()
+
+    assert await store.acquire(session, MD5) is None
+    assert ACQUIRE_BLOB_SQL not in session.executed
+
+
+@pytest.mark.asyncio
+async def test_acquire_unknown_blob(store):
+    _write_hot(store)
+    session = FakeSession(blob=False)
+
+    assert await store.acquire(session, MD5) is None
+    assert session.executed == [LOCK_BLOB_SQL]
+
+
+@pytest.mark.asyncio
+async def test_store_discards_duplicate_content(store, tmp_path):
+    path = _write_hot(store)
+    source = tmp_path / "dup.part"
+    source.write_bytes(b"x" * 10)
+
+    assert await store.store(FakeSession(), MD5, str(source), 10) == {"local_path": path, "storage": None}
+    assert not source.exists()
+
+
+@pytest.mark.asyncio
+async def test_store_moves_new_content_into_place(store, tmp_path):
+    source = tmp_path / "new.part"
+    source.write_bytes(b"x" * 10)
+
+    blob = await store.store(FakeSession(), MD5, str(source), 10)
+
+    assert blob == {"local_path": store.blob_path(MD5), "storage": None}
+    assert os.path.exists(blob["local_path"]) and not source.exists()
+
+
+@pytest.mark.asyncio
+async def test_store_reuses_committed_cold_placement(store, tmp_path):
+    """迁移已提交、热存储文件待删除时，新下载引用打包位置而不是即将删除的热存储文件"""
+    _write_hot(store)
+    source = tmp_path / "dup.part"
+    source.write_bytes(b"x" * 10)
+    storage = {"tier": TIER_COLD, "pack": "/packs/seg-000001.pack", "offset": 0, "length": 10}
+    session = FakeSession(cold=SimpleNamespace(local_path="/packs/seg-000001.pack", storage=storage))
+
+    blob = await store.store(session, MD5, str(source), 10)
+
+    assert blob == {"local_path": "/packs/seg-000001.pack", "storage": storage}
+    assert session.executed == [STORE_BLOB_SQL, COLD_PLACEMENT_SQL]
+    assert not source.exists()
@@ -0,0 +1,79 @@
+"""
+媒体冷热分层单元测试
+"""
+
+import hashlib
+
+import pytest
+
+from src.services.media_tiering import PackWriter
+
+
+def _blob(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path), hashlib.md5(content).hexdigest()
+
+
+@pytest.fixture
+def pack_path(tmp_path):
+    return tmp_path / "packs"
+
+
+def test_append_records_offsets_and_index(tmp_path, pack_path):
+    writer = PackWriter(str(pack_path), segment_size=1024)
+    first, first_md5 = _blob(tmp_path, "a", b"hello")
+    second, second_md5 = _blob(tmp_path, "b", b"world!")
+
+    a = writer.append(first_md5, first)
+    b = writer.append(second_md5, second)
+    writer.close()
+
+    assert (a["offset"], a["length"], b["offset"], b["length"]) == (0, 5, 5, 6)
+    assert a["pack"] == b["pack"] == writer.segment_path(1)
+    assert (pack_path / "seg-000001.pack").read_bytes() == b"helloworld!"
+    assert (pack_path / "seg-000001.idx").read_text() == f"{first_md5} 0 5\n{second_md5} 5 6\n"
+
+
+def test_md5_mismatch_rolls_back_entry(tmp_path, pack_path):
+    """内容与 md5 不符时截断本次写入，下一条从原偏移继续"""
+    writer = PackWriter(str(pack_path), segment_size=1024)
+    bad, _ = _blob(tmp_path, "bad", b"corrupted")
+    good, good_md5 = _blob(tmp_path, "good", b"ok")
+
+    assert writer.append("0" * 32, bad) is None
+    placement = writer.append(good_md5, good)
+    writer.close()
+
+    assert placement["offset"] == 0
+    assert (pack_path / "seg-000001.pack").read_bytes() == b"ok"
+    assert (pack_path / "seg-000001.idx").read_text() == f"{good_md5} 0 2\n"
+
+
+def test_missing_source_rolls_back_and_raises(tmp_path, pack_path):
+    writer = PackWriter(str(pack_path), segment_size=1024)
+    good, good_md5 = _blob(tmp_path, "good", b"ok")
+    writer.append(good_md5, good)
+
+    with pytest.raises(OSError):
+        writer.append("0" * 32, str(tmp_path / "missing"))
+    writer.close()
+
+    assert (pack_path / "seg-000001.pack").read_bytes() == b"ok"
+
+
+def test_full_segment_rolls_over_and_reopen_continues(tmp_path, pack_path):
+    writer = PackWriter(str(pack_path), segment_size=4)
+    first, first_md5 = _blob(tmp_path, "a", b"12345")
+    second, second_md5 = _blob(tmp_path, "b", b"67")
+
+    assert writer.append(first_md5, first)["pack"] == writer.segment_path(1)
+    assert writer.append(second_md5, second)["pack"] == writer.segment_path(2)
+    writer.close()
+
+    reopened = PackWriter(str(pack_path), segment_size=4)
+    third, third_md5 = _blob(tmp_path, "c", b"8")
+    placement = reopened.append(third_md5, third)
+    reopened.close()
+
+    assert (placement["pack"], placement["offset"]) == (reopened.segment_path(2), 2)
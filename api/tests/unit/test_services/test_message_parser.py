@@ -0,0 +1,72 @@
+"""
+会话消息解析单元测试
+"""
+
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+
+from src.models import MessageType
+from src.services.message_parser import parse_chat_message
+
+
+def _raw(**fields) -> bytes:
+    data = {
+        "msgid": "m1", "action": "send", "from": "alice", "tolist": ["bob"],
+        "roomid": "room1", "msgtime": 1700000000123, "msgtype": "text",
+        "text": {"content": "hello"},
+    }
+    data.update(fields)
+    return orjson.dumps(data)
+
+
+def test_text_message():
+    raw = _raw()
+    message, media_files = parse_chat_message(7, raw)
+
+    assert message["seq"] == 7
+    assert message["msgtype"] == MessageType.TEXT
+    assert message["content"] == "hello"
+    assert message["msgtime"] == datetime(2023, 11, 14, 22, 13, 20, 123000, tzinfo=timezone.utc)
+    assert message["raw_data"] == raw.decode()
+    assert message["reply_to_msgid"] is None
+    assert message["revoke_target"] is None
+    assert media_files == []
+
+
+def test_quote_sets_reply_target():
+    message, _ = parse_chat_message(1, _raw(text={"content": "re", "quote": {"msgid": "m0"}}))
+
+    assert message["reply_to_msgid"] == "m0"
+
+
+def test_recall_sets_revoke_target():
+    raw = _raw(msgid="m2", action="recall", msgtype="revoke", revoke={"pre_msgid": "m1"})
+    message, _ = parse_chat_message(2, raw)
+
+    assert message["msgtype"] == MessageType.REVOKE
+    assert message["revoke_target"] == "m1"
+
+
+def test_pre_msgid_on_other_types_is_not_a_revoke():
+    message, _ = parse_chat_message(1, _raw(msgtype="link", link={"pre_msgid": "m0"}))
+
+    assert message["revoke_target"] is None
+
+
+def test_media_message_yields_media_file():
+    raw = _raw(msgtype="image", image={"sdkfileid": "sdk1", "md5sum": "a" * 32, "filesize": 10})
+    message, media_files = parse_chat_message(1, raw)
+
+    assert message["media_data"]["sdkfileid"] == "sdk1"
+    assert media_files == [{
+        "msgid": "m1", "file_type": "image", "file_name": None, "original_filename": None,
+        "file_size": 10, "file_extension": "jpg", "md5": "a" * 32,
+        "metadata": {"sdkfileid": "sdk1", "play_length": None},
+    }]
+
+
+@pytest.mark.parametrize("fields", [{"roomid": ""}, {"action": "switch"}, {"msgtype": None}])
+def test_non_group_messages_are_skipped(fields):
+    assert parse_chat_message(1, _raw(**fields)) is None
@@ -0,0 +1,96 @@
+"""
+msgid 布隆过滤器单元测试
+"""
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.services import msgid_filter as msgid_filter_module
+from src.services.msgid_filter import BloomFilter, MsgidFilter
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(server=FakeServer())
+    monkeypatch.setattr(msgid_filter_module, "get_redis", lambda: client)
+    return client
+
+
+def _filter(corp_id: str = "corp") -> MsgidFilter:
+    msgid_filter = MsgidFilter(corp_id, session_maker=None)
+    msgid_filter.capacity = 1000
+    msgid_filter.error_rate = 0.01
+    msgid_filter.refresh_interval = 300
+    return msgid_filter
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    msgids = [f"msg-{i}" for i in range(1000)]
+    for msgid in msgids:
+        bloom.add_positions(bloom.positions(msgid))
+
+    assert all(msgid in bloom for msgid in msgids)
+
+
+def test_bloom_false_positive_rate_is_near_target():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add_positions(bloom.positions(f"msg-{i}"))
+
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+    assert bloom.estimated_false_positive_rate(1000) == pytest.approx(0.01, rel=0.2)
+
+
+def test_bloom_bit_order_matches_redis_setbit():
+    """位序与 SETBIT 一致：偏移 0 是第一个字节的最高位"""
+    bloom = BloomFilter(100, 0.01)
+    bloom.add_positions([0, 9])
+
+    assert bytes(bloom.bits[:2]) == b"\x80\x40"
+    assert BloomFilter(100, 0.01, bytes(bloom.bits)).bits == bloom.bits
+
+
+@pytest.mark.asyncio
+async def test_add_writes_through_to_redis(redis):
+    first = _filter()
+    await first.load()
+    await first.add(["m1", "m2", "m1"])
+
+    reloaded = _filter()
+    await reloaded.load()
+    assert reloaded.count == 2
+    assert "m1" in reloaded.bloom and "m2" in reloaded.bloom
+
+
+@pytest.mark.asyncio
+async def test_changed_parameters_discard_old_bitmap(redis):
+    first = _filter()
+    await first.load()
+    await first.add(["m1"])
+
+    resized = _filter()
+    resized.capacity = 2000
+    await resized.load()
+    assert resized.count == 0
+    assert "m1" not in resized.bloom
+
+
+@pytest.mark.asyncio
+async def test_refresh_picks_up_msgids_added_by_other_workers(redis):
+    """长驻进程的副本按间隔重新加载，能看到其他进程写入 Redis 的位"""
+    local = _filter()
+    await local.load()
+    other = _filter()
+    await other.load()
+    await other.add(["m1"])
+
+    await local.refresh()
+    assert "m1" not in local.bloom
+
+    local.loaded_at -= local.refresh_interval
+    await local.refresh()
+    assert "m1" in local.bloom
+    assert local.count == 1
@@ -0,0 +1,76 @@
+"""
+上游配额限流单元测试
+"""
+
+import asyncio
+import time
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.services import rate_limiter as rate_limiter_module
+from src.services.rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_SYNC,
+    UpstreamRateLimiter,
+)
+
+ENDPOINT = "/cgi-bin/msgaudit/getchatdata"
+BUCKET = "ratelimit:corp:chatdata"
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(server=FakeServer())
+    monkeypatch.setattr(rate_limiter_module, "get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def limiter(redis):
+    limiter = UpstreamRateLimiter()
+    limiter.enabled = True
+    # 容量 10，每秒补充 1 个：测试期间补充的令牌可以忽略
+    limiter.rates = {"chatdata": 1}
+    limiter.burst_seconds = 10
+    return limiter
+
+
+async def _set_tokens(redis, tokens: float):
+    await redis.hset(BUCKET, mapping={"tokens": tokens, "ts": time.time()})
+
+
+async def _acquired(limiter, priority: str) -> bool:
+    try:
+        await asyncio.wait_for(limiter.acquire("corp", ENDPOINT, priority), 0.3)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+@pytest.mark.asyncio
+async def test_background_refused_below_its_reserve_while_interactive_succeeds(limiter, redis):
+    """剩余 3 个令牌：低于后台水位（5）和同步水位（2）之上，交互请求可以用尽"""
+    await _set_tokens(redis, 3)
+
+    assert not await _acquired(limiter, PRIORITY_BACKGROUND)
+    assert await _acquired(limiter, PRIORITY_SYNC)
+    assert not await _acquired(limiter, PRIORITY_SYNC)
+    assert await _acquired(limiter, PRIORITY_INTERACTIVE)
+    assert await _acquired(limiter, PRIORITY_INTERACTIVE)
+    assert float(await redis.hget(BUCKET, "tokens")) < 1
+
+
+@pytest.mark.asyncio
+async def test_full_bucket_admits_all_priorities(limiter, redis):
+    for priority in (PRIORITY_BACKGROUND, PRIORITY_SYNC, PRIORITY_INTERACTIVE):
+        assert await _acquired(limiter, priority)
+
+
+@pytest.mark.asyncio
+async def test_unknown_endpoint_without_default_rate_is_not_limited(limiter, redis):
+    await limiter.acquire("corp", "/cgi-bin/unknown", PRIORITY_BACKGROUND)
+
+    assert await redis.keys("ratelimit:*") == []
@@ -0,0 +1,112 @@
+"""
+上游错误分类与熔断器单元测试
+"""
+
+import httpx
+import pytest
+
+from src.services import retry_policy as retry_policy_module
+from src.services.retry_policy import CircuitBreaker, CircuitOpenError, ErrorClass, classify_error
+from src.services.wechat_client import WeChatAPIError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(retry_policy_module.time, "monotonic", fake.monotonic)
+    return fake
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://qyapi.weixin.qq.com/cgi-bin/msgaudit/getchatdata")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.mark.parametrize("error, expected", [
+    (WeChatAPIError(42001), ErrorClass.TOKEN),
+    (WeChatAPIError(45009), ErrorClass.RATE_LIMITED),
+    (WeChatAPIError(-1), ErrorClass.RETRYABLE),
+    (WeChatAPIError(301052), ErrorClass.FATAL),
+    (_status_error(429), ErrorClass.RATE_LIMITED),
+    (_status_error(502), ErrorClass.RETRYABLE),
+    (_status_error(404), ErrorClass.FATAL),
+    (httpx.ConnectTimeout("timeout"), ErrorClass.RETRYABLE),
+    (ValueError("bad"), ErrorClass.FATAL),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("test_open", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.retry_after == pytest.approx(20)
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test_reset", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_admits_single_probe(clock):
+    """冷却结束后只放行一个探测请求，探测成功后恢复"""
+    breaker = CircuitBreaker("test_probe", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("test_reopen", failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_release_frees_probe_slot(clock):
+    """确定性错误不计入熔断，但要释放探测名额，否则半开状态会一直拒绝调用"""
+    breaker = CircuitBreaker("test_release", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
@@ -0,0 +1,79 @@
+"""
+群成员增量同步单元测试
+"""
+
+from datetime import datetime, timezone
+
+from src.models import MemberType
+from src.services.roster_sync import RosterDiff, parse_roster, roster_hash
+
+
+def _ts(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+def _group(*members, creator="owner", admins=()):
+    return {
+        "roomname": "Room",
+        "notice": "",
+        "creator": creator,
+        "admin_list": list(admins),
+        "members": [{"memberid": userid, "jointime": jointime} for userid, jointime in members],
+    }
+
+
+def test_parse_roster_assigns_roles():
+    roster = parse_roster(_group(("owner", 1), ("boss", 2), ("alice", 3), ("", 4), admins=["boss"]))
+
+    assert roster == {
+        "owner": (MemberType.OWNER, _ts(1), None),
+        "boss": (MemberType.ADMIN, _ts(2), None),
+        "alice": (MemberType.MEMBER, _ts(3), None),
+    }
+
+
+def test_roster_hash_ignores_member_order():
+    first = _group(("owner", 1), ("alice", 2))
+    second = _group(("alice", 2), ("owner", 1))
+
+    assert roster_hash(first, parse_roster(first)) == roster_hash(second, parse_roster(second))
+    changed = _group(("owner", 1), ("alice", 3))
+    assert roster_hash(changed, parse_roster(changed)) != roster_hash(first, parse_roster(first))
+
+
+def test_diff_produces_joins_quits_and_role_changes():
+    data = _group(("owner", 1), ("alice", 2), ("carol", 5), admins=["alice"])
+    active = {
+        "owner": (10, MemberType.OWNER, _ts(1)),
+        "alice": (11, MemberType.MEMBER, _ts(2)),
+        "bob": (12, MemberType.MEMBER, _ts(3)),
+    }
+    diff = RosterDiff()
+    diff.add_group("r1", data, parse_roster(data), active, "hash")
+
+    assert diff.joins == [("r1", "carol", _ts(5), "MEMBER", None)]
+    assert diff.quits == [12]
+    assert diff.role_changes == [(11, "ADMIN")]
+    assert diff.groups == [("r1", "Room", "", "hash")]
+    assert diff.counters.groups == {}
+
+
+def test_rejoin_closes_old_membership():
+    """退群后重新入群：旧记录退出，按新入群时间新增一条"""
+    data = _group(("owner", 1), ("alice", 9))
+    active = {"owner": (10, MemberType.OWNER, _ts(1)), "alice": (11, MemberType.MEMBER, _ts(2))}
+    diff = RosterDiff()
+    diff.add_group("r1", data, parse_roster(data), active, "hash")
+
+    assert diff.quits == [11]
+    assert diff.joins == [("r1", "alice", _ts(9), "MEMBER", None)]
+    assert diff.counters.groups == {}
+
+
+def test_new_group_counts_all_members():
+    data = _group(("owner", 1), ("alice", 2))
+    diff = RosterDiff()
+    diff.add_group("r1", data, parse_roster(data), {}, "hash")
+
+    assert len(diff.joins) == 2
+    assert diff.counters.groups == {"r1": 2}
@@ -0,0 +1,110 @@
+"""
+消息同步流水线单元测试
+"""
+
+import orjson
+import pytest
+
+from src.services.sync_pipeline import SyncPipeline
+
+
+class FakeController:
+    """固定批大小的控制器"""
+
+    def __init__(self, fetch_limit: int, flush_size: int):
+        self.fetch_limit = fetch_limit
+        self.flush_size = flush_size
+
+    def observe_fetch(self, *args):
+        pass
+
+    def observe_decrypt(self, *args):
+        pass
+
+    def observe_commit(self, *args):
+        pass
+
+    def to_dict(self):
+        return {}
+
+
+class FakeClient:
+    def __init__(self, entries):
+        self.entries = entries
+
+    async def get_chat_data(self, seq, limit):
+        return {"chatdata": [e for e in self.entries if e["seq"] > seq][:limit]}
+
+
+class FakeDecryptor:
+    """带 broken 标记的条目视为解密失败"""
+    max_workers = 2
+
+    async def decrypt_batch(self, entries, key_path=None, encoding_aes_key=None):
+        return [(e["seq"], e["plain"]) for e in entries if not e.get("broken")]
+
+
+class FakeWriter:
+    def __init__(self):
+        self.calls = []
+
+    async def write_batch(self, messages, media_files, cursor_seq=None):
+        self.calls.append(([m["seq"] for m in messages], cursor_seq))
+        return len(messages), 0
+
+
+def _entry(seq: int, broken: bool = False) -> dict:
+    plain = orjson.dumps({
+        "msgid": f"m{seq}", "roomid": "room1", "msgtype": "text", "action": "send",
+        "msgtime": 1700000000000 + seq, "from": "alice", "text": {"content": "hi"},
+    })
+    return {"seq": seq, "plain": plain, "broken": broken}
+
+
+def _pipeline(entries, fetch_limit=3, flush_size=3, **kwargs) -> SyncPipeline:
+    return SyncPipeline(
+        client=FakeClient(entries),
+        decryptor=FakeDecryptor(),
+        writer=FakeWriter(),
+        controller=FakeController(fetch_limit, flush_size),
+        queue_size=1,
+        **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_pipeline_persists_all_pages_in_order():
+    pipeline = _pipeline([_entry(seq) for seq in range(1, 8)])
+    summary = await pipeline.run()
+
+    assert pipeline.writer.calls == [([1, 2, 3], 3), ([4, 5, 6], 6), ([7], 7)]
+    assert summary["fetched"] == 7
+    assert summary["inserted"] == 7
+    assert summary["last_seq"] == 7
+
+
+@pytest.mark.asyncio
+async def test_pipeline_stops_at_end_seq():
+    pipeline = _pipeline([_entry(seq) for seq in range(1, 8)], start_seq=2, end_seq=5)
+    await pipeline.run()
+
+    assert [seqs for seqs, _ in pipeline.writer.calls] == [[3, 4, 5]]
+
+
+@pytest.mark.asyncio
+async def test_cursor_not_advanced_past_undecrypted_message():
+    """解密失败的消息之后的批次照常写入，但游标停在失败消息之前"""
+    entries = [_entry(seq, broken=(seq == 5)) for seq in range(1, 10)]
+    pipeline = _pipeline(entries)
+    summary = await pipeline.run()
+
+    assert pipeline.writer.calls == [([1, 2, 3], 3), ([4, 6, 7, 8, 9], 4)]
+    assert summary["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_filtered_sync_does_not_move_cursor():
+    pipeline = _pipeline([_entry(seq) for seq in range(1, 4)], roomid="room1")
+    await pipeline.run()
+
+    assert pipeline.writer.calls == [([1, 2, 3], None)]
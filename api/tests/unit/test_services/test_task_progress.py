@@ -0,0 +1,95 @@
+"""
+同步任务进度通道单元测试
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.models import SyncTask, TaskStatus
+from src.services import task_progress as task_progress_module
+from src.services.task_progress import (
+    TaskProgress,
+    is_fresher,
+    progress_key,
+    read_progress,
+    set_progress_status,
+)
+
+
+class BrokenRedis:
+    def pipeline(self, transaction=True):
+        raise ConnectionError("redis down")
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(server=FakeServer())
+    monkeypatch.setattr(task_progress_module, "get_redis", lambda: client)
+    return client
+
+
+def _counts(progress, success=0, errors=0):
+    return {"progress": progress, "total_count": progress, "success_count": success, "error_count": errors}
+
+
+@pytest.mark.asyncio
+async def test_report_accumulates_deltas(redis):
+    """每次上报只累加与上次的差值，多个进程写同一个键也不会重复计数"""
+    progress = TaskProgress("t1", flush_interval=60)
+    await progress.report(_counts(10, success=8, errors=2))
+    await progress.report(_counts(25, success=20, errors=5))
+
+    stored = await read_progress("t1")
+    assert {k: stored[k] for k in ("progress", "success_count", "error_count")} == {
+        "progress": 25, "success_count": 20, "error_count": 5,
+    }
+    assert 0 < await redis.ttl(progress_key("t1")) <= task_progress_module.PROGRESS_TTL
+
+
+@pytest.mark.asyncio
+async def test_report_returns_published_status(redis):
+    progress = TaskProgress("t1", flush_interval=60)
+    assert await progress.report(_counts(1)) is None
+
+    await set_progress_status("t1", TaskStatus.CANCELLED.value)
+    assert await progress.report(_counts(2)) == TaskStatus.CANCELLED.value
+
+
+@pytest.mark.asyncio
+async def test_flush_throttled_until_interval(redis):
+    progress = TaskProgress("t1", flush_interval=60)
+    await progress.report(_counts(1))
+    assert not progress.flush_due()
+
+    progress._last_flush -= 60
+    assert progress.flush_due()
+
+
+@pytest.mark.asyncio
+async def test_redis_unavailable_flushes_every_batch(monkeypatch):
+    monkeypatch.setattr(task_progress_module, "get_redis", lambda: BrokenRedis())
+    progress = TaskProgress("t1", flush_interval=60)
+
+    assert await progress.report(_counts(1)) is None
+    assert progress.flush_due()
+
+
+@pytest.mark.asyncio
+async def test_finish_removes_key(redis):
+    progress = TaskProgress("t1", flush_interval=60)
+    await progress.report(_counts(1))
+
+    await progress.finish()
+    assert await read_progress("t1") is None
+
+
+def test_is_fresher_handles_naive_row_timestamps():
+    now = datetime.now(timezone.utc)
+    task = SyncTask(task_id="t1", updated_at=(now - timedelta(seconds=5)).replace(tzinfo=None))
+
+    assert is_fresher({"updated_at": now}, task)
+    assert not is_fresher({"updated_at": now - timedelta(seconds=10)}, task)
+    assert is_fresher({"updated_at": now}, SyncTask(task_id="t2"))
@@ -0,0 +1,96 @@
+"""
+access_token 分布式缓存单元测试
+"""
+
+import asyncio
+import time
+
+import orjson
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.services import token_store as token_store_module
+from src.services.token_store import AccessTokenStore
+
+
+class Fetcher:
+    def __init__(self, expires_in=7200, delay=0.0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return f"token-{self.calls}", self.expires_in
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(server=FakeServer())
+    monkeypatch.setattr(token_store_module, "get_redis", lambda: client)
+    return client
+
+
+def _store():
+    store = AccessTokenStore("corp", "secret")
+    store.max_ttl = 7000
+    store.refresh_margin = 300
+    return store
+
+
+@pytest.mark.asyncio
+async def test_concurrent_gets_refresh_once(redis):
+    """同一进程内的并发调用合并为一次刷新"""
+    store = _store()
+    fetch = Fetcher(delay=0.01)
+
+    tokens = await asyncio.gather(*(store.get(fetch) for _ in range(5)))
+
+    assert tokens == ["token-1"] * 5
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_other_processes_reuse_shared_token(redis):
+    fetch = Fetcher()
+    await _store().get(fetch)
+
+    assert await _store().get(fetch) == "token-1"
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_token_inside_refresh_margin_is_refreshed(redis):
+    store = _store()
+    fetch = Fetcher(expires_in=200)
+
+    assert await store.get(fetch) == "token-1"
+    assert await store.get(fetch) == "token-2"
+
+
+@pytest.mark.asyncio
+async def test_locked_refresh_keeps_using_valid_token(redis):
+    """其他进程持有刷新锁时，仍在有效期内的旧 token 继续使用"""
+    store = _store()
+    fetch = Fetcher(expires_in=200)
+    await store.get(fetch)
+    await redis.set(store.lock_key, "other")
+
+    assert await store.get(fetch) == "token-1"
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidate_keeps_token_refreshed_by_another_process(redis):
+    """失效的 token 已被其他进程换掉时不删除新 token，本地副本丢弃后改用它"""
+    store = _store()
+    fetch = Fetcher()
+    await store.get(fetch)
+    await redis.set(store.key, orjson.dumps({"token": "token-other", "expires_at": time.time() + 7000}))
+
+    await store.invalidate("token-1")
+
+    assert await store.get(fetch) == "token-other"
+    assert fetch.calls == 1
@@ -0,0 +1,107 @@
+"""
+会话存档接口客户端单元测试
+"""
+
+import httpx
+import pytest
+
+from src.services import retry_policy as retry_policy_module
+from src.services import wechat_client as wechat_client_module
+from src.services.http_client import SharedHTTPClient
+from src.services.retry_policy import CircuitBreaker, RetryPolicy
+from src.services.wechat_client import WeChatAPIError, WeChatArchiveClient
+
+BASE_URL = "https://qyapi.example.com"
+GETTOKEN = "/cgi-bin/gettoken"
+GETCHATDATA = "/cgi-bin/msgaudit/getchatdata"
+
+
+class FakeTokenStore:
+    """不缓存，每次都调用 gettoken"""
+
+    def __init__(self):
+        self.invalidated = []
+
+    async def get(self, fetch):
+        token, _ = await fetch()
+        return token
+
+    async def invalidate(self, token=None):
+        self.invalidated.append(token)
+
+
+class NoRateLimit:
+    async def acquire(self, corp_id, endpoint, priority="sync", cost=1.0):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    policy = RetryPolicy()
+    policy.max_attempts = 3
+    policy.base = policy.rate_limit_base = policy.cap = 0
+    monkeypatch.setattr(wechat_client_module, "get_retry_policy", lambda: policy)
+    monkeypatch.setattr(retry_policy_module, "_breakers", {})
+
+
+def _client(responses):
+    """responses: endpoint -> 依次返回的 errcode 列表（用完后重复最后一个）"""
+    calls = {GETTOKEN: 0, GETCHATDATA: 0}
+
+    def handler(request):
+        path = request.url.path
+        calls[path] += 1
+        errcodes = responses[path]
+        errcode = errcodes[min(calls[path], len(errcodes)) - 1]
+        return httpx.Response(200, json={"errcode": errcode, "access_token": "t", "chatdata": []})
+
+    client = WeChatArchiveClient(corp_id="corp", secret="secret", base_url=BASE_URL)
+    client._http = SharedHTTPClient(BASE_URL)
+    client._http._client = httpx.AsyncClient(base_url=BASE_URL, transport=httpx.MockTransport(handler))
+    client.token_store = FakeTokenStore()
+    client.rate_limiter = NoRateLimit()
+    client.recorder = None
+    return client, calls
+
+
+@pytest.mark.asyncio
+async def test_token_failure_not_retried_by_calling_endpoint():
+    """gettoken 自身重试用尽后直接失败：不被外层再重试，也不计入 getchatdata 的熔断器"""
+    client, calls = _client({GETTOKEN: [-1], GETCHATDATA: [0]})
+
+    with pytest.raises(WeChatAPIError) as exc_info:
+        await client.get_chat_data(0, 10)
+
+    assert exc_info.value.endpoint == GETTOKEN
+    assert calls == {GETTOKEN: 3, GETCHATDATA: 0}
+    chatdata_breaker = retry_policy_module.get_circuit_breaker(GETCHATDATA)
+    assert (chatdata_breaker.state, chatdata_breaker.failures) == (CircuitBreaker.CLOSED, 0)
+    assert retry_policy_module.get_circuit_breaker(GETTOKEN).failures == 3
+
+
+@pytest.mark.asyncio
+async def test_retryable_error_then_success():
+    client, calls = _client({GETTOKEN: [0], GETCHATDATA: [-1, 0]})
+
+    assert (await client.get_chat_data(0, 10))["errcode"] == 0
+    assert calls == {GETTOKEN: 2, GETCHATDATA: 2}
+    assert retry_policy_module.get_circuit_breaker(GETCHATDATA).failures == 0
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_is_invalidated_and_refetched():
+    client, calls = _client({GETTOKEN: [0], GETCHATDATA: [42001, 0]})
+
+    await client.get_chat_data(0, 10)
+
+    assert client.token_store.invalidated == ["t"]
+    assert calls == {GETTOKEN: 2, GETCHATDATA: 2}
+
+
+@pytest.mark.asyncio
+async def test_fatal_error_is_not_retried():
+    client, calls = _client({GETTOKEN: [0], GETCHATDATA: [301052]})
+
+    with pytest.raises(WeChatAPIError):
+        await client.get_chat_data(0, 10)
+    assert calls[GETCHATDATA] == 1